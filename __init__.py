@@ -4,8 +4,22 @@ from Neilyst.analyze import load_history, calculate_win_rate, Factor_Analyzer
 
 from Neilyst.backtest import backtest, evaluate_strategy
 
+from Neilyst.montecarlo import monte_carlo
+
+from Neilyst.preview import preview_backtest
+
+from Neilyst.paper import PaperTrader, ReplayFeed, BarFeed
+
 from Neilyst.models import Strategy, Signal
 
-from Neilyst.indicators import get_indicators
+from Neilyst.timeframe import MultiTimeframe
+
+from Neilyst.ledger import Ledger
+
+from Neilyst.cache import ResultCache, IndicatorCache
+
+from Neilyst.indicators import get_indicators, compile_indicators
+
+from Neilyst.streaming import StreamingIndicators, streaming_indicator
 
 from Neilyst.visualize import show_pnl, show_indicators, show_multi_symbol_pnl, show_total_pnl, show_return_distribution
\ No newline at end of file
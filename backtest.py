@@ -1,12 +1,17 @@
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
-import datetime
+import time
 from .data import get_klines
-from .models import Position
+from .models import Position, Strategy
+from .ledger import Ledger, to_frame
+from .profiler import BacktestProfiler, profile_phase
+from .checkpoint import save_checkpoint, load_checkpoint, symbol_checkpoint_path
+from .cache import default_cache, strategy_fingerprint
+from . import kernels
 from .utils.magic import US_TREASURY_YIELD, DAYS_IN_ONE_YEAR, TRADING_DAYS_IN_ONE_YEAR, TIMEZONE
 
-def backtest(symbol, start, end, strategy, proxy='http://127.0.0.1:7890/'):
+def backtest(symbol, start, end, strategy, proxy='http://127.0.0.1:7890/', portfolio=False, record_equity=False, equity_interval=1, equity_dtype='float64', profile=False, profile_strategy=None, checkpoint=None, checkpoint_every=100000, resume=False, cache=None, preview=None):
     ## 目前没有考虑双向持仓
 
     # 本函数是对外的回测接口函数
@@ -29,175 +34,940 @@ def backtest(symbol, start, end, strategy, proxy='http://127.0.0.1:7890/'):
 
     # 由于backtest也需要拉取数据 所以也添加一个proxy变量
 
+    # portfolio=True 时多个 symbol 共享一个资金账户, 策略需要实现 run_portfolio
+
+    # record_equity=True 时按K线记录现金, 持仓市值和净值, 结果的 equity 属性即为净值曲线
+    # equity_interval 为采样间隔(K线数), equity_dtype 可以设为 'float32' 以减少长周期回测的内存占用
+    equity_options = (equity_interval, equity_dtype) if record_equity else None
+
+    # profile=True(或传入一个 BacktestProfiler)时统计各阶段耗时, 结果的 profile 属性即为性能报告
+    # profile_strategy 传入文件路径时, 额外用 cProfile 记录策略回调并保存 pstats 结果
+    # checkpoint 为断点文件路径(多 symbol 时为目录), 每 checkpoint_every 根K线以及主循环结束时保存一次断点
+    # resume=True 时从断点继续回测; 断点保存了回测末尾平仓前的状态, 用更晚的 end 再次调用即可在原结果上追加新数据
+    # 策略状态通过 Strategy.get_state / set_state 保存和恢复
+    checkpoint_options = (checkpoint, checkpoint_every, resume) if checkpoint else None
+    if checkpoint_options and isinstance(symbol, list) and portfolio:
+        raise ValueError('Checkpoint is not supported for portfolio backtests yet.')
+
+    # preview 不为空时只做快速预览, 返回 preview_backtest 的结果(指标估计和置信区间), 而不是完整的账单
+    # preview=True 在抽样的子区间上回测, 传入 '15m' 这样的周期时在聚合后的K线上回测, 也可以传入 preview_backtest 的参数字典
+    if preview:
+        from .preview import preview_backtest
+        if isinstance(preview, dict):
+            preview_options = preview
+        elif isinstance(preview, str):
+            preview_options = {'timeframe': preview}
+        else:
+            preview_options = {}
+        return preview_backtest(symbol, start, end, strategy, proxy=proxy, **preview_options)
+
+    # cache=True(或传入一个 ResultCache)时, 策略代码, 参数, 回测选项和本地数据都没有变化就直接返回缓存的结果
+    # 开启 profile 时不使用缓存
+    result_cache = default_cache() if cache is True else cache
+    if result_cache is not None and not (profile or profile_strategy):
+        cache_options = {'portfolio': portfolio, 'record_equity': record_equity, 'equity_interval': equity_interval, 'equity_dtype': equity_dtype}
+        # 策略参数需要在回测改变策略状态之前计算
+        strategy_digest = strategy_fingerprint(strategy)
+        cached = result_cache.get(result_cache.key(symbol, start, end, strategy_digest, cache_options))
+        if cached is not None:
+            return cached
+    else:
+        result_cache = None
+
+    profiler = None
+    if isinstance(profile, BacktestProfiler):
+        profiler = profile
+    elif profile or profile_strategy:
+        profiler = BacktestProfiler(profile_strategy)
+    if profiler is not None:
+        profiler.attach(strategy)
+
     # 判断是单币种还是多币种策略
 
-    if isinstance(symbol, str):
-        result = []
-        # 运行回测引擎得到结果
-        result = _single_symbol_engine(symbol, start, end, strategy, proxy)
-        # 修改回测账单时区
-        result = _convert_result_time(result, TIMEZONE)
-        
-    elif isinstance(symbol, list):
-        result = {}
-        result = _multi_symbol_engine(symbol, start, end, strategy, proxy)
+    try:
+        if isinstance(symbol, list) and portfolio:
+            result = _portfolio_engine(symbol, start, end, strategy, proxy, equity_options, profiler)
+            result = _convert_result_time(result, TIMEZONE)
+
+        elif isinstance(symbol, str):
+            result = []
+            # 运行回测引擎得到结果
+            result = _single_symbol_engine(symbol, start, end, strategy, proxy, equity_options, profiler, checkpoint_options)
+            # 修改回测账单时区
+            result = _convert_result_time(result, TIMEZONE)
+            
+        elif isinstance(symbol, list):
+            result = {}
+            result = _multi_symbol_engine(symbol, start, end, strategy, proxy, equity_options, profiler, checkpoint_options)
+    finally:
+        if profiler is not None:
+            profiler.detach()
+
+    if result_cache is not None and result:
+        # 回测过程中可能补全了本地数据, 重新计算数据指纹
+        description = {'symbol': symbol, 'start': start, 'end': end, 'strategy': type(strategy).__name__}
+        result_cache.put(result_cache.key(symbol, start, end, strategy_digest, cache_options), result, description)
 
     return result
 
-def _single_symbol_engine(symbol, start, end, strategy, proxy):
-    # 获取1min数据
-    ticker_data = get_klines(symbol, start, end, '1m', proxy=proxy)
-    # 初始化仓位历史记录
-    current_pos = Position(symbol)
-    pos_history = []
-    
-    # 初始化策略参数
-    current_balance = strategy.total_balance
-    trading_fee_ratio = strategy.trading_fee_ratio
-    slippage_ratio = strategy.slippage_ratio
-
-    for index, row in tqdm(ticker_data.iterrows(), total=ticker_data.shape[0]):
-        # 先根据当前价格更新仓位的浮动盈亏
-        current_pos.update_float_profit(row['close'])
-        
-        # 从策略函数获取策略信号
-        signal = strategy.run(index, row, current_pos, current_balance, symbol)
-
-        if signal is not None:
-            # 开仓逻辑
-            if signal.dir == 'long' or signal.dir == 'short':
-                # 计算开仓时的交易费用
-                open_cost = signal.amount * signal.price
-                trade_cost = open_cost * (trading_fee_ratio + slippage_ratio)
-                # 执行开仓操作
-                current_pos.open(signal.price, signal.amount, signal.dir, index)
-                current_pos.trade_cost = trade_cost  # 记录开仓时的交易费用
-                if signal.dir == 'long':
-                    # 更新余额
-                    current_balance -= open_cost + trade_cost
-                elif signal.dir == 'short':
-                    # 更新余额，只扣除交易费用（假设无需保证金）
-                    current_balance -= trade_cost
-            elif signal.dir == 'close':
-                close_amount = min(signal.amount, current_pos.amount)
-                if close_amount > 0:
-                    if current_pos.dir == 'long':
-                        # 计算卖出所得
-                        proceeds = close_amount * signal.price
-                        trade_cost = proceeds * (trading_fee_ratio + slippage_ratio)
-                        net_proceeds = proceeds - trade_cost
-                        # 更新余额
-                        current_balance += net_proceeds
-                        # 计算净利润
-                        profit = net_proceeds - (current_pos.open_price * close_amount + current_pos.trade_cost)
-                        # 记录平仓交易费用
-                        current_pos.close_trade_cost = trade_cost
-                    elif current_pos.dir == 'short':
-                        # 计算买入成本
-                        cost = close_amount * signal.price
-                        trade_cost = cost * (trading_fee_ratio + slippage_ratio)
-                        net_cost = cost + trade_cost
-                        # 计算净利润
-                        profit = (current_pos.open_price * close_amount - net_cost) - current_pos.trade_cost
-                        # 更新余额
-                        current_balance += profit
-                        # 记录平仓交易费用
-                        current_pos.close_trade_cost = trade_cost
-                    # 执行平仓
-                    current_pos.close(signal.price, close_amount, index)
-
-                    # 如果完全平仓，则视为本次交易结束
-                    if current_pos.amount == 0:
-                        # 记录仓位
-                        pos_history.append({
-                            'open_date': current_pos.open_date,
-                            'close_date': current_pos.close_date,
-                            'dir': current_pos.dir,
-                            'open_price': current_pos.open_price,
-                            'close_price': current_pos.close_price,
-                            'amount': current_pos.amount,
-                            'pnl': profit,
-                            'open_fee': current_pos.trade_cost,
-                            'close_fee': current_pos.close_trade_cost,
-                            'balance': current_balance
-                        })
-
-                        # 重新初始化pos对象
-                        current_pos = Position(symbol)
+def _single_symbol_engine(symbol, start, end, strategy, proxy, equity_options=None, profiler=None, checkpoint_options=None, ticker_data=None):
+    # 获取1min数据, 传入 ticker_data 时直接使用已经加载好的数据
+    if ticker_data is None:
+        with profile_phase(profiler, 'data_load'):
+            ticker_data = get_klines(symbol, start, end, '1m', proxy=proxy)
+    # 初始化仓位, 余额, 挂单等引擎状态
+    state = _EngineState.from_frame(symbol, ticker_data, strategy)
+    # 信号处理, 止盈止损和挂单成交只在开启性能分析时包装计时
+    apply_signal, trigger_exit, match_orders = state.apply_signal, state.trigger_exit, state.match_orders
+    if profiler is not None:
+        apply_signal = profiler.wrap('order_handling', apply_signal)
+        trigger_exit = profiler.wrap('order_handling', trigger_exit)
+        match_orders = profiler.wrap('order_handling', match_orders)
+    loop_start = time.perf_counter()
+    recorder = _EquityRecorder(ticker_data.index, ticker_data['close'].to_numpy(dtype=float), *equity_options) if equity_options else None
+    run_in_position = getattr(strategy, 'run_in_position', True)
+    run_with_orders = getattr(strategy, 'run_with_orders', True)
+    on_order_filled = getattr(strategy, 'on_order_filled', None)
+    # 策略实现了 run_batch 时, 每次把一段K线和对齐的指标一起交给策略, 不再逐分钟调用 run
+    batch_columns = None
+    if type(strategy).run_batch is not Strategy.run_batch:
+        batch_columns = _batch_columns(ticker_data, strategy, symbol)
+        batch_size = max(int(getattr(strategy, 'batch_size', 1024)), 1)
+    close_prices = ticker_data['close'].to_numpy(dtype=float)
+
+    total = ticker_data.shape[0]
+    # 从断点恢复时, 从断点之后的第一根K线继续
+    i = 0
+    prior_equity = None
+    if checkpoint_options:
+        checkpoint_path, checkpoint_every, resume = checkpoint_options
+        payload = load_checkpoint(checkpoint_path) if resume else None
+        if payload is not None:
+            i, prior_equity = _restore_checkpoint(payload, symbol, state, strategy, recorder)
+            # 追加数据后断点可能落在原本会跳过的区间中, 与不中断时一样直接跳到下一个事件
+            if i > 0:
+                skip_to = state.next_run_idx(i - 1, run_in_position, run_with_orders)
+                if skip_to > i and recorder is not None:
+                    recorder.mark_position(i, skip_to, state.current_balance, state.current_pos)
+                i = max(i, skip_to)
+        next_checkpoint = i + checkpoint_every
+
+    progress = tqdm(total=total, initial=i)
+    while i < total:
+        index = ticker_data.index[i]
+
+        # 先处理引擎托管的止盈止损和挂单, 触发的K线上先于策略信号成交
+        if i == state.exit_idx:
+            trigger_exit(index)
+        if i == state.next_order_idx:
+            for order in match_orders(i, index):
+                if on_order_filled is not None:
+                    on_order_filled(index, order, state.current_pos, state.current_balance, symbol)
+
+        if batch_columns is None:
+            # 先根据当前价格更新仓位的浮动盈亏
+            state.current_pos.update_float_profit(close_prices[i])
+
+            # 从策略函数获取策略信号
+            signal = strategy.run(index, ticker_data.iloc[i], state.current_pos, state.current_balance, symbol)
+
+            if signal is not None:
+                apply_signal(signal, i, index)
+            last = i
+        else:
+            # 一段K线内不能有止盈止损或挂单事件, 否则仓位会在段内发生变化
+            # 持仓或挂单期间不需要运行策略时, 与逐分钟回调一样只交给策略当前这一根K线
+            stop = min(i + batch_size, state.next_event(i))
+            if state.next_run_idx(i, run_in_position, run_with_orders) > i + 1:
+                stop = i + 1
+            block = {name: values[i:stop] for name, values in batch_columns.items()}
+            action = strategy.run_batch(block, state.current_pos, state.current_balance, symbol)
+
+            # 策略返回第一个需要操作的K线在段内的位置和信号, 引擎处理后从下一根K线继续
+            last, signal = stop - 1, None
+            if action is not None:
+                k, signal = action
+                if not 0 <= k < stop - i:
+                    raise ValueError(f'run_batch returned bar {k} outside of the block of {stop - i} bars.')
+                last = i + k
+            if recorder is not None:
+                recorder.mark_position(i, last, state.current_balance, state.current_pos)
+
+            state.current_pos.update_float_profit(close_prices[last])
+            if signal is not None:
+                apply_signal(signal, last, ticker_data.index[last])
+
+        # 不需要每分钟运行策略时, 直接跳到下一个止盈止损或挂单事件
+        step = state.next_run_idx(last, run_in_position, run_with_orders) - i
+        if recorder is not None:
+            # 跳过的K线上仓位不变, 一次性向量化记录
+            recorder.mark_position(last, i + step, state.current_balance, state.current_pos)
+        progress.update(step)
+        i += step
+
+        if checkpoint_options and next_checkpoint <= i < total:
+            _save_engine_checkpoint(checkpoint_path, symbol, state, strategy, i, recorder, prior_equity)
+            next_checkpoint = i + checkpoint_every
+    progress.close()
+
+    # 在最终平仓前保存断点, 之后可以用新同步的数据继续回测
+    if checkpoint_options:
+        _save_engine_checkpoint(checkpoint_path, symbol, state, strategy, total, recorder, prior_equity)
 
     # 整体回测结束，平掉所有仓位
-    if current_pos.amount > 0:
+    if state.current_pos.amount > 0:
         final_price = ticker_data.iloc[-1]['close']
+        state.close(state.current_pos.amount, final_price, ticker_data.index[-1], 'end')
+
+    if profiler is not None:
+        profiler.add('engine_loop', time.perf_counter() - loop_start)
+        profiler.bars += total
+        state.pos_history.profile = profiler
+    if recorder is not None:
+        state.pos_history.equity = _concat_equity(prior_equity, recorder.to_frame())
+    return state.pos_history
+
+def _batch_columns(ticker_data, strategy, symbol):
+    """
+    run_batch 使用的整段数组: date, OHLCV 以及按时间对齐到1min K线的指标列。
+    指标按不晚于当前K线的最近一条取值, 与 get_recent_data 的取法相同。
+    """
+    columns = {'date': ticker_data.index}
+    for name in ticker_data.columns:
+        columns[name] = ticker_data[name].to_numpy()
+
+    indicators = getattr(strategy, 'indicators', None)
+    if isinstance(indicators, dict):
+        indicators = indicators.get(symbol)
+    if isinstance(indicators, pd.Series):
+        indicators = indicators.to_frame()
+    if isinstance(indicators, pd.DataFrame):
+        aligned = indicators.reindex(ticker_data.index, method='ffill')
+        for name in aligned.columns:
+            # 与K线重名的列(e.g close)以K线为准
+            if name not in columns:
+                columns[name] = aligned[name].to_numpy()
+
+    return columns
+
+def _save_engine_checkpoint(path, symbol, state, strategy, cursor, recorder, prior_equity):
+    """
+    保存处理完前 cursor 根K线后的引擎状态
+    """
+    save_checkpoint(path, {
+        'symbol': symbol,
+        'last_date': state.index[cursor - 1] if cursor > 0 else None,
+        'engine': state.snapshot(cursor),
+        'strategy': strategy.get_state(),
+        'equity': _concat_equity(prior_equity, recorder.to_frame()) if recorder is not None else None
+    })
+
+def _restore_checkpoint(payload, symbol, state, strategy, recorder):
+    """
+    从断点恢复引擎和策略状态, 返回 (继续回测的K线位置, 断点之前的净值曲线)
+    """
+    if payload['symbol'] != symbol:
+        raise ValueError(f"Checkpoint is for {payload['symbol']}, not {symbol}.")
+
+    last_date = payload['last_date']
+    cursor = int(state.index.searchsorted(last_date, side='right')) if last_date is not None else 0
+    state.restore(payload['engine'], cursor)
+    strategy.set_state(payload['strategy'])
+    if recorder is not None:
+        recorder.start_at(cursor)
+
+    return cursor, payload['equity']
+
+def _concat_equity(prior_equity, equity):
+    if prior_equity is None or len(prior_equity) == 0:
+        return equity
+    return pd.concat([prior_equity, equity])
+
+class _EquityRecorder():
+    """
+    把每根(或每 interval 根)K线收盘时的现金, 持仓市值和净值写入预分配的数组
+    每个采样点记录采样区间最后一根K线的值, 内存占用为 K线数 / interval
+    """
+    def __init__(self, index, close_prices, interval=1, dtype='float64'):
+        self.index = index
+        self.close_prices = close_prices
+        self.interval = max(int(interval), 1)
+        self.total = len(index)
+        size = -(-self.total // self.interval)
+        self.positions = np.zeros(size, dtype=np.int64)
+        self.cash = np.zeros(size, dtype=dtype)
+        self.position_value = np.zeros(size, dtype=dtype)
+        self.equity = np.zeros(size, dtype=dtype)
+        # 已经记录的采样点范围, 从断点恢复时前面的采样点保存在断点中
+        self.first_slot = 0
+        self.filled = 0
+
+    def start_at(self, cursor):
+        """
+        从第 cursor 根K线开始记录
+        """
+        self.first_slot = cursor // self.interval
+        self.filled = self.first_slot
+
+    def _sample_points(self, start, stop):
+        # [start, stop) 中需要记录的K线位置: 每个采样区间的最后一根K线以及整体的最后一根K线
+        k = self.interval
+        first = start + (k - 1 - start) % k
+        points = np.arange(first, stop, k)
+        if stop == self.total and start <= self.total - 1 and (len(points) == 0 or points[-1] != self.total - 1):
+            points = np.append(points, self.total - 1)
+        return points
+
+    def mark(self, start, stop, cash, position_value):
+        """
+        记录 [start, stop) 区间内的采样点, position_value 可以是标量或与采样点对应的数组
+        """
+        points = self._sample_points(start, stop)
+        if len(points) == 0:
+            return
+        slots = points // self.interval
+        self.positions[slots] = points
+        self.cash[slots] = cash
+        self.position_value[slots] = position_value
+        self.equity[slots] = cash + self.position_value[slots]
+        self.filled = slots[-1] + 1
+
+    def mark_position(self, start, stop, cash, current_pos):
+        """
+        按仓位和收盘价计算 [start, stop) 区间内的持仓市值并记录
+        多头持仓市值为数量 * 收盘价, 空头开仓时没有占用现金, 持仓市值即为浮动盈亏
+        """
+        if current_pos.amount == 0:
+            self.mark(start, stop, cash, 0.0)
+            return
+        points = self._sample_points(start, stop)
+        if len(points) == 0:
+            return
+        closes = self.close_prices[points]
         if current_pos.dir == 'long':
-            # 计算卖出所得
-            proceeds = current_pos.amount * final_price
-            trade_cost = proceeds * (trading_fee_ratio + slippage_ratio)
-            net_proceeds = proceeds - trade_cost
-            # 更新余额
-            current_balance += net_proceeds
-            # 计算净利润
-            profit = net_proceeds - (current_pos.open_price * current_pos.amount + current_pos.trade_cost)
-            # 记录平仓交易费用
-            current_pos.close_trade_cost = trade_cost
-        elif current_pos.dir == 'short':
-            # 计算买入成本
-            cost = current_pos.amount * final_price
-            trade_cost = cost * (trading_fee_ratio + slippage_ratio)
-            net_cost = cost + trade_cost
-            # 计算净利润
-            profit = (current_pos.open_price * current_pos.amount - net_cost) - current_pos.trade_cost
+            value = closes * current_pos.amount
+        else:
+            value = (current_pos.open_price - closes) * current_pos.amount
+        slots = points // self.interval
+        self.positions[slots] = points
+        self.cash[slots] = cash
+        self.position_value[slots] = value
+        self.equity[slots] = cash + self.position_value[slots]
+        self.filled = slots[-1] + 1
+
+    def to_frame(self):
+        filled = slice(self.first_slot, self.filled)
+        return pd.DataFrame({
+            'cash': self.cash[filled],
+            'position_value': self.position_value[filled],
+            'equity': self.equity[filled]
+        }, index=self.index[self.positions[filled]], copy=False)
+
+class _Account():
+    """
+    资金账户, 组合回测时多个 symbol 共享同一个账户
+    """
+    def __init__(self, balance):
+        self.balance = balance
+
+class _EngineState():
+    """
+    单个 symbol 回测时引擎维护的状态: 当前仓位, 余额, 历史仓位账单, 止盈止损和挂单簿
+    """
+    def __init__(self, symbol, index, open_prices, high_prices, low_prices, strategy, account=None, record_symbol=False):
+        self.symbol = symbol
+        self.current_pos = Position(symbol)
+        # 历史仓位账单, record_symbol 为 True 时每条记录带上 symbol
+        self.pos_history = Ledger()
+        self.record_symbol = record_symbol
+
+        # 初始化策略参数
+        self.account = account if account is not None else _Account(strategy.total_balance)
+        self.trading_fee_ratio = strategy.trading_fee_ratio
+        self.slippage_ratio = strategy.slippage_ratio
+
+        # 止盈止损和挂单扫描用的价格数组
+        self.index = index
+        self.open_prices = open_prices
+        self.high_prices = high_prices
+        self.low_prices = low_prices
+        self.total = len(index)
+
+        # 当前仓位止盈止损的触发位置, 成交价和类型, -1表示没有触发
+        self.exit_idx, self.exit_price, self.exit_type = -1, None, None
+        # 移动止损最高(低)价已经统计到的位置
+        self.scan_from = 0
+
+        # 挂单簿, 每个挂单记录成交位置, 成交价和失效位置
+        self.orders = []
+        # 最近一个挂单事件(成交或失效)的位置, -1表示没有挂单
+        self.next_order_idx = -1
+
+    @classmethod
+    def from_frame(cls, symbol, ticker_data, strategy, account=None):
+        return cls(symbol, ticker_data.index, ticker_data['open'].to_numpy(dtype=float), ticker_data['high'].to_numpy(dtype=float), ticker_data['low'].to_numpy(dtype=float), strategy, account)
+
+    @property
+    def current_balance(self):
+        return self.account.balance
+
+    @current_balance.setter
+    def current_balance(self, value):
+        self.account.balance = value
+
+    def apply_signal(self, signal, i, date):
+        """
+        处理策略在第 i 根K线返回的信号
+        """
+        if signal.dir == 'cancel':
+            # 撤销所有挂单
+            self.orders = []
+            self.next_order_idx = -1
+        elif getattr(signal, 'order_type', 'market') == 'limit':
+            self.place_order(signal, i)
+        elif signal.dir == 'long' or signal.dir == 'short':
+            self.open(signal, signal.price, signal.amount, i, date)
+        elif signal.dir == 'close':
+            close_amount = min(signal.amount, self.current_pos.amount)
+            if close_amount > 0:
+                self.close(close_amount, signal.price, date)
+
+    def open(self, signal, price, amount, i, date):
+        """
+        按给定价格开仓或加仓, 并挂上信号携带的止盈止损
+        """
+        current_pos = self.current_pos
+        # 计算开仓时的交易费用
+        open_cost = amount * price
+        trade_cost = open_cost * (self.trading_fee_ratio + self.slippage_ratio)
+        is_new_pos = current_pos.amount == 0
+        # 执行开仓操作
+        current_pos.open(price, amount, signal.dir, date)
+        current_pos.trade_cost = trade_cost  # 记录开仓时的交易费用
+        if signal.dir == 'long':
             # 更新余额
-            current_balance += profit
-            # 记录平仓交易费用
-            current_pos.close_trade_cost = trade_cost
-        
-        # 记录最后仓位
-        pos_history.append({
-            'open_date': current_pos.open_date,
-            'close_date': ticker_data.index[-1],
-            'dir': current_pos.dir,
-            'open_price': current_pos.open_price,
-            'close_price': final_price,
-            'amount': current_pos.amount,
-            'pnl': profit,
-            'open_fee': current_pos.trade_cost,
-            'close_fee': current_pos.close_trade_cost,
-            'balance': current_balance  
+            self.current_balance -= open_cost + trade_cost
+        elif signal.dir == 'short':
+            # 更新余额，只扣除交易费用（假设无需保证金）
+            self.current_balance -= trade_cost
+
+        # 挂上止盈止损, 并向后扫描找到第一根触发的K线
+        current_pos.set_exit_orders(getattr(signal, 'stop_loss', None), getattr(signal, 'take_profit', None), getattr(signal, 'trailing_stop', None))
+        if current_pos.has_exit_orders():
+            if is_new_pos or current_pos.extreme_price is None:
+                current_pos.extreme_price = current_pos.open_price
+            elif self.scan_from <= i:
+                # 加仓时把上次扫描以来的极值补上
+                current_pos.extreme_price = _update_extreme_price(current_pos, self.high_prices, self.low_prices, self.scan_from, i + 1)
+            self.scan_from = i + 1
+            self.exit_idx, self.exit_price, self.exit_type = _scan_exit_orders(current_pos, self.open_prices, self.high_prices, self.low_prices, i + 1)
+
+    def close(self, close_amount, price, date, exit_type='signal'):
+        """
+        按给定价格平仓, 完全平仓时记录历史仓位并重置仓位
+        """
+        current_pos = self.current_pos
+        self.current_balance, profit = _close_position(current_pos, close_amount, price, date, self.current_balance, self.trading_fee_ratio, self.slippage_ratio)
+
+        # 如果完全平仓，则视为本次交易结束
+        if current_pos.amount == 0:
+            # 各种平仓方式都记录最后一次平掉的数量
+            self.pos_history.append(
+                current_pos.open_date, date, current_pos.dir, current_pos.open_price, price, close_amount, profit,
+                current_pos.trade_cost, current_pos.close_trade_cost, self.current_balance, exit_type,
+                self.symbol if self.record_symbol else None
+            )
+
+            # 重新初始化pos对象
+            self.current_pos = Position(self.symbol)
+            self.exit_idx, self.exit_price, self.exit_type = -1, None, None
+
+    def trigger_exit(self, date):
+        """
+        执行已经定位到的止盈止损
+        """
+        self.close(self.current_pos.amount, self.exit_price, date, self.exit_type)
+
+    def place_order(self, signal, i):
+        """
+        把限价信号挂入挂单簿, 并向后扫描找到成交的K线
+        """
+        # 平仓单的买卖方向由当前仓位决定
+        if signal.dir == 'close':
+            is_buy = self.current_pos.dir == 'short'
+        else:
+            is_buy = signal.dir == 'long'
+        self._add_order(signal, i, is_buy, i + 1)
+        self._update_next_order_idx()
+
+    def _add_order(self, signal, i, is_buy, scan_start):
+        # 挂单在第 i 根K线下单, 从 scan_start 开始扫描成交
+        expire_idx = self._expire_idx(signal, i)
+        fill_idx, fill_price = _scan_limit_order(is_buy, signal.price, self.open_prices, self.high_prices, self.low_prices, scan_start, expire_idx)
+        self.orders.append({
+            'signal': signal,
+            'fill_idx': fill_idx,
+            'fill_price': fill_price,
+            'expire_idx': expire_idx,
+            'is_buy': is_buy,
+            'placed_date': self.index[i]
         })
-        
-    return pos_history
 
-def _multi_symbol_engine(symbols, start, end, strategy, proxy):
+    def snapshot(self, cursor):
+        """
+        生成处理完前 cursor 根K线后的状态快照。
+        止盈止损和挂单的触发位置依赖K线位置, 不直接保存, 恢复时从 cursor 开始重新扫描。
+        """
+        current_pos = self.current_pos
+        extreme_price = current_pos.extreme_price
+        if current_pos.amount > 0 and current_pos.trailing_stop is not None and self.scan_from < cursor:
+            # 把上次扫描以来的最高(低)价合并进去, 恢复后从 cursor 扫描的结果与不中断时相同
+            extreme_price = _update_extreme_price(current_pos, self.high_prices, self.low_prices, self.scan_from, cursor)
+
+        return {
+            'current_pos': current_pos,
+            'pos_history': self.pos_history,
+            'balance': self.current_balance,
+            'extreme_price': extreme_price,
+            'orders': [(order['signal'], order['placed_date'], order['is_buy']) for order in self.orders]
+        }
+
+    def restore(self, snapshot, cursor):
+        """
+        从快照恢复状态, 并从第 cursor 根K线开始重新定位止盈止损和挂单
+        """
+        self.current_pos = snapshot['current_pos']
+        self.pos_history = snapshot['pos_history']
+        self.current_balance = snapshot['balance']
+
+        current_pos = self.current_pos
+        self.exit_idx, self.exit_price, self.exit_type = -1, None, None
+        self.scan_from = cursor
+        if current_pos.amount > 0 and current_pos.has_exit_orders():
+            current_pos.extreme_price = snapshot['extreme_price']
+            self.exit_idx, self.exit_price, self.exit_type = _scan_exit_orders(current_pos, self.open_prices, self.high_prices, self.low_prices, cursor)
+
+        self.orders = []
+        for signal, placed_date, is_buy in snapshot['orders']:
+            i = self.index.get_loc(placed_date)
+            self._add_order(signal, i, is_buy, max(cursor, i + 1))
+        # 丢弃在断点之前已经失效的挂单
+        self.orders = [order for order in self.orders if order['fill_idx'] >= cursor or order['expire_idx'] >= cursor]
+        self._update_next_order_idx()
+
+    def match_orders(self, i, date):
+        """
+        在第 i 根K线上撮合挂单, 按下单顺序成交, 同时移除失效的挂单
+        返回本根K线成交的信号列表
+        """
+        filled = []
+        remaining = []
+        for order in self.orders:
+            if order['fill_idx'] == i:
+                signal = order['signal']
+                if signal.dir == 'close':
+                    close_amount = min(signal.amount, self.current_pos.amount)
+                    if close_amount > 0:
+                        self.close(close_amount, order['fill_price'], date, 'limit')
+                        filled.append(signal)
+                else:
+                    self.open(signal, order['fill_price'], signal.amount, i, date)
+                    filled.append(signal)
+            elif order['fill_idx'] == -1 and order['expire_idx'] <= i:
+                # 挂单到期未成交
+                continue
+            else:
+                remaining.append(order)
+        self.orders = remaining
+        self._update_next_order_idx()
+
+        return filled
+
+    def next_run_idx(self, i, run_in_position=True, run_with_orders=True):
+        """
+        第 i 根K线之后下一次需要运行策略的位置
+        """
+        if self.current_pos.amount > 0:
+            if not run_in_position and self.current_pos.has_exit_orders():
+                return self.next_event(i)
+        elif not run_with_orders and self.orders:
+            return self.next_event(i)
+        return i + 1
+
+    def next_event(self, i):
+        """
+        第 i 根K线之后最近的止盈止损或挂单事件位置, 没有事件时返回K线总数
+        """
+        events = [idx for idx in (self.exit_idx, self.next_order_idx) if idx > i]
+        return min(events) if events else self.total
+
+    def _update_next_order_idx(self):
+        events = [order['fill_idx'] if order['fill_idx'] >= 0 else order['expire_idx'] for order in self.orders]
+        self.next_order_idx = min(events) if events else -1
+
+    def _expire_idx(self, signal, i):
+        """
+        计算挂单失效的位置, 挂单在 [i + 1, expire_idx) 内有效
+        expire 可以是K线数量(int), 时间长度(pd.Timedelta 或 '4h' 这样的字符串)或者到期时间(pd.Timestamp)
+        """
+        expire = getattr(signal, 'expire', None)
+        if expire is None:
+            return self.total
+        if isinstance(expire, (int, np.integer)):
+            return min(i + 1 + int(expire), self.total)
+        if isinstance(expire, pd.Timestamp):
+            expire_date = expire
+        else:
+            expire_date = self.index[i] + pd.Timedelta(expire)
+        return min(max(int(self.index.searchsorted(expire_date, side='left')), i + 1), self.total)
+
+def _close_position(current_pos, close_amount, price, date, current_balance, trading_fee_ratio, slippage_ratio):
+    """
+    按给定价格平掉 close_amount 数量的仓位, 返回 (更新后的余额, 本次平仓的净利润)
+    """
+    if current_pos.dir == 'long':
+        # 计算卖出所得
+        proceeds = close_amount * price
+        trade_cost = proceeds * (trading_fee_ratio + slippage_ratio)
+        net_proceeds = proceeds - trade_cost
+        # 更新余额
+        current_balance += net_proceeds
+        # 计算净利润
+        profit = net_proceeds - (current_pos.open_price * close_amount + current_pos.trade_cost)
+        # 记录平仓交易费用
+        current_pos.close_trade_cost = trade_cost
+    elif current_pos.dir == 'short':
+        # 计算买入成本
+        cost = close_amount * price
+        trade_cost = cost * (trading_fee_ratio + slippage_ratio)
+        net_cost = cost + trade_cost
+        # 计算净利润
+        profit = (current_pos.open_price * close_amount - net_cost) - current_pos.trade_cost
+        # 更新余额
+        current_balance += profit
+        # 记录平仓交易费用
+        current_pos.close_trade_cost = trade_cost
+    # 执行平仓
+    current_pos.close(price, close_amount, date)
+
+    return current_balance, profit
+
+def _update_extreme_price(current_pos, high_prices, low_prices, start, stop):
+    """
+    把 [start, stop) 区间内的最高价(多)/最低价(空)合并进仓位的极值价格
+    """
+    if stop <= start:
+        return current_pos.extreme_price
+    if current_pos.dir == 'long':
+        return np.fmax(current_pos.extreme_price, np.fmax.reduce(high_prices[start:stop]))
+    return np.fmin(current_pos.extreme_price, np.fmin.reduce(low_prices[start:stop]))
+
+def _cummin(prices):
+    """ 累计最低价, 缺失的K线(NaN)不参与比较 """
+    return np.nan_to_num(np.fmin.accumulate(prices), nan=np.inf)
+
+def _cummax(prices):
+    """ 累计最高价, 缺失的K线(NaN)不参与比较 """
+    return np.nan_to_num(np.fmax.accumulate(prices), nan=-np.inf)
+
+_EXIT_TYPES = {
+    kernels.EXIT_STOP_LOSS: 'stop_loss',
+    kernels.EXIT_TAKE_PROFIT: 'take_profit',
+    kernels.EXIT_TRAILING_STOP: 'trailing_stop'
+}
+
+def _price_or_nan(price):
+    return np.nan if price is None else float(price)
+
+def _scan_exit_orders(current_pos, open_prices, high_prices, low_prices, start, block_size=1024, extreme=None):
+    """
+    从 start 开始向后分块扫描1min K线, 找出第一根触发止损/止盈/移动止损的K线。
+    固定价位通过累计极值 + searchsorted 定位, 移动止损通过累计极值得到每根K线的止损价。
+    同一根K线内同时触发时按最坏情况处理, 即优先止损。
+    跳空越过触发价时以开盘价成交。
+
+    extreme 为移动止损的起始极值, 默认使用仓位记录的极值。
+
+    返回:
+    - (触发位置, 成交价, 触发类型), 没有触发时返回 (-1, None, None)
+    """
+    total = len(open_prices)
+    is_long = current_pos.dir == 'long'
+    stop_loss = current_pos.stop_loss
+    take_profit = current_pos.take_profit
+    trailing_stop = current_pos.trailing_stop
+    if extreme is None:
+        extreme = current_pos.extreme_price if current_pos.extreme_price is not None else current_pos.open_price
+
+    # 安装了 numba 时使用编译后的逐K线扫描, 结果与下面的分块实现相同
+    kernel = kernels.jit_kernel('scan_exit')
+    if kernel is not None:
+        idx, price, code = kernel(is_long, _price_or_nan(stop_loss), _price_or_nan(take_profit), _price_or_nan(trailing_stop),
+                                  float(extreme), open_prices, high_prices, low_prices, start)
+        return (idx, float(price), _EXIT_TYPES[code]) if idx >= 0 else (-1, None, None)
+
+    pos = start
+    while pos < total:
+        stop = min(pos + block_size, total)
+        opens = open_prices[pos:stop]
+        highs = high_prices[pos:stop]
+        lows = low_prices[pos:stop]
+        n = stop - pos
+        # 每种出场方式在本块内第一次触发的相对位置, n表示本块内未触发
+        hits = {}
+
+        if is_long:
+            if stop_loss is not None:
+                # 累计最低价单调不增, 取负后可以直接二分
+                hits['stop_loss'] = np.searchsorted(-_cummin(lows), -stop_loss, side='left')
+            if take_profit is not None:
+                hits['take_profit'] = np.searchsorted(_cummax(highs), take_profit, side='left')
+            if trailing_stop is not None:
+                # 每根K线的止损价只使用之前K线的最高价, 不使用本根K线的最高价, 避免利用K线内部的顺序
+                running = np.fmax.accumulate(np.concatenate(([extreme], highs[:-1])))
+                trail_levels = running * (1 - trailing_stop)
+                trail_hit = lows <= trail_levels
+                hits['trailing_stop'] = trail_hit.argmax() if trail_hit.any() else n
+        else:
+            if stop_loss is not None:
+                hits['stop_loss'] = np.searchsorted(_cummax(highs), stop_loss, side='left')
+            if take_profit is not None:
+                hits['take_profit'] = np.searchsorted(-_cummin(lows), -take_profit, side='left')
+            if trailing_stop is not None:
+                running = np.fmin.accumulate(np.concatenate(([extreme], lows[:-1])))
+                trail_levels = running * (1 + trailing_stop)
+                trail_hit = highs >= trail_levels
+                hits['trailing_stop'] = trail_hit.argmax() if trail_hit.any() else n
+
+        first = min(hits.values()) if hits else n
+        if first < n:
+            bar_open = opens[first]
+            # 同一根K线内触发的止损价, 多头取较高者(先被触发), 空头取较低者
+            stop_levels = []
+            if hits.get('stop_loss', n) == first:
+                stop_levels.append(('stop_loss', stop_loss))
+            if hits.get('trailing_stop', n) == first:
+                stop_levels.append(('trailing_stop', trail_levels[first]))
+
+            if stop_levels:
+                if is_long:
+                    exit_type, level = max(stop_levels, key=lambda x: x[1])
+                    price = min(bar_open, level)
+                else:
+                    exit_type, level = min(stop_levels, key=lambda x: x[1])
+                    price = max(bar_open, level)
+            else:
+                exit_type = 'take_profit'
+                price = max(bar_open, take_profit) if is_long else min(bar_open, take_profit)
+
+            return pos + first, float(price), exit_type
+
+        # 本块未触发, 把极值带入下一块
+        if trailing_stop is not None:
+            extreme = np.fmax(extreme, np.fmax.reduce(highs)) if is_long else np.fmin(extreme, np.fmin.reduce(lows))
+        pos = stop
+        # 仓位通常持有较久, 逐块加大扫描长度
+        block_size *= 2
+
+    return -1, None, None
+
+def _scan_limit_order(is_buy, limit_price, open_prices, high_prices, low_prices, start, stop, block_size=1024):
+    """
+    在 [start, stop) 内分块扫描限价单第一次可以成交的K线。
+    买入(开多, 平空)在最低价不高于限价时成交, 卖出(开空, 平多)在最高价不低于限价时成交。
+    跳空越过限价时以更优的开盘价成交。
+
+    返回:
+    - (成交位置, 成交价), 没有成交时返回 (-1, None)
+    """
+    stop = min(stop, len(open_prices))
+    kernel = kernels.jit_kernel('scan_limit')
+    if kernel is not None:
+        idx, price = kernel(is_buy, float(limit_price), open_prices, high_prices, low_prices, start, stop)
+        return (idx, float(price)) if idx >= 0 else (-1, None)
+
+    pos = start
+    while pos < stop:
+        block_stop = min(pos + block_size, stop)
+        if is_buy:
+            first = np.searchsorted(-_cummin(low_prices[pos:block_stop]), -limit_price, side='left')
+        else:
+            first = np.searchsorted(_cummax(high_prices[pos:block_stop]), limit_price, side='left')
+
+        if first < block_stop - pos:
+            bar_open = open_prices[pos + first]
+            price = min(bar_open, limit_price) if is_buy else max(bar_open, limit_price)
+            return pos + first, float(price)
+
+        pos = block_stop
+        block_size *= 2
+
+    return -1, None
+
+def _multi_symbol_engine(symbols, start, end, strategy, proxy, equity_options=None, profiler=None, checkpoint_options=None):
     pos_historys = dict()
     for symbol in symbols:
-        pos_historys[symbol] = _single_symbol_engine(symbol, start, end, strategy, proxy)
+        # 每个 symbol 单独保存断点
+        symbol_checkpoint_options = None
+        if checkpoint_options:
+            checkpoint_path, checkpoint_every, resume = checkpoint_options
+            symbol_checkpoint_options = (symbol_checkpoint_path(checkpoint_path, symbol), checkpoint_every, resume)
+        pos_historys[symbol] = _single_symbol_engine(symbol, start, end, strategy, proxy, equity_options, profiler, symbol_checkpoint_options)
         pos_historys[symbol] = _convert_result_time(pos_historys[symbol], TIMEZONE)
     
     return pos_historys
 
+def _portfolio_engine(symbols, start, end, strategy, proxy, equity_options=None, profiler=None):
+    """
+    组合回测引擎, 所有 symbol 共享一个资金账户。
+    多个 symbol 的1min数据先对齐成 (时间, symbol, OHLCV) 的面板, 按时间顺序只遍历一次,
+    每个时间点调用一次 strategy.run_portfolio, 传入所有 symbol 在该时间点的K线。
+    止盈止损和挂单按 symbol 分别托管, 通过事件位置数组定位, 不在每个时间点遍历所有 symbol。
+
+    返回:
+    - 按平仓时间排序的交易记录列表, 每条记录带有 symbol 字段, balance 为组合账户的余额
+    """
+    with profile_phase(profiler, 'data_load'):
+        all_data = get_klines(symbols, start, end, '1m', proxy=proxy)
+        index, panel = _align_panel(all_data, symbols)
+    total = len(index)
+
+    account = _Account(strategy.total_balance)
+    states = [
+        _EngineState(symbol, index, panel[:, k, 0], panel[:, k, 1], panel[:, k, 2], strategy, account, record_symbol=True)
+        for k, symbol in enumerate(symbols)
+    ]
+    symbol_pos = {symbol: k for k, symbol in enumerate(symbols)}
+    positions = {symbol: state.current_pos for symbol, state in zip(symbols, states)}
+    symbols_index = pd.Index(symbols, name='symbol')
+    on_order_filled = getattr(strategy, 'on_order_filled', None)
+
+    # 每个 symbol 下一个止盈止损或挂单事件的位置, 没有事件时为 total
+    next_events = np.full(len(symbols), total, dtype=np.int64)
+    next_event = total
+    # 当前有持仓的 symbol, 只对它们更新浮动盈亏
+    holding = set()
+
+    # 记录净值曲线时, 持仓市值使用各 symbol 最近一个有效收盘价
+    recorder = _EquityRecorder(index, None, *equity_options) if equity_options else None
+    last_closes = np.full(len(symbols), np.nan)
+
+    def refresh(k, i):
+        # 某个 symbol 的状态发生变化后, 更新事件位置, 持仓集合和对外的仓位字典
+        state = states[k]
+        next_events[k] = state.next_event(i)
+        positions[state.symbol] = state.current_pos
+        if state.current_pos.amount > 0:
+            holding.add(k)
+        else:
+            holding.discard(k)
+
+    # 信号处理, 止盈止损和挂单成交只在开启性能分析时包装计时
+    def handle(func, *args):
+        return func(*args)
+    if profiler is not None:
+        handle = profiler.wrap('order_handling', handle)
+    loop_start = time.perf_counter()
+
+    for i in tqdm(range(total), total=total):
+        date = index[i]
+
+        # 先处理到期的止盈止损和挂单成交
+        if i == next_event:
+            for k in np.flatnonzero(next_events == i):
+                state = states[k]
+                if i == state.exit_idx:
+                    handle(state.trigger_exit, date)
+                if i == state.next_order_idx:
+                    for order in handle(state.match_orders, i, date):
+                        if on_order_filled is not None:
+                            on_order_filled(date, order, state.current_pos, account.balance, state.symbol)
+                refresh(k, i)
+            next_event = next_events.min()
+
+        # 根据当前价格更新持仓的浮动盈亏
+        closes = panel[i, :, 3]
+        np.copyto(last_closes, closes, where=~np.isnan(closes))
+        for k in holding:
+            if not np.isnan(closes[k]):
+                states[k].current_pos.update_float_profit(closes[k])
+
+        bars = pd.DataFrame(panel[i], index=symbols_index, columns=_PANEL_FIELDS, copy=False)
+        signals = strategy.run_portfolio(date, bars, positions, account.balance)
+
+        if signals:
+            for symbol, signal in signals.items():
+                if signal is None:
+                    continue
+                if symbol not in symbol_pos:
+                    raise ValueError(f'Symbol {symbol} is not in the backtest universe.')
+                k = symbol_pos[symbol]
+                handle(states[k].apply_signal, signal, i, date)
+                refresh(k, i)
+            next_event = next_events.min()
+
+        if recorder is not None:
+            position_value = 0.0
+            for k in holding:
+                current_pos = states[k].current_pos
+                if current_pos.dir == 'long':
+                    position_value += current_pos.amount * last_closes[k]
+                else:
+                    position_value += (current_pos.open_price - last_closes[k]) * current_pos.amount
+            recorder.mark(i, i + 1, account.balance, position_value)
+
+    # 整体回测结束，按各 symbol 最后一个有效收盘价平掉所有仓位
+    for k in sorted(holding):
+        state = states[k]
+        valid = np.flatnonzero(~np.isnan(panel[:, k, 3]))
+        last = valid[-1] if len(valid) else total - 1
+        state.close(state.current_pos.amount, panel[last, k, 3], index[last], 'end')
+
+    pos_history = Ledger.concat([state.pos_history for state in states], sort_by='close_date')
+
+    if profiler is not None:
+        profiler.add('engine_loop', time.perf_counter() - loop_start)
+        profiler.bars += total
+        pos_history.profile = profiler
+
+    if recorder is not None:
+        pos_history.equity = recorder.to_frame()
+    return pos_history
+
+_PANEL_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+def _align_panel(all_data, symbols):
+    """
+    把多个 symbol 的K线按时间对齐成形状为 (时间, symbol, 字段) 的连续数组, 缺失的K线为 NaN
+    """
+    index = all_data[symbols[0]].index
+    for symbol in symbols[1:]:
+        index = index.union(all_data[symbol].index)
+
+    panel = np.full((len(index), len(symbols), len(_PANEL_FIELDS)), np.nan)
+    for k, symbol in enumerate(symbols):
+        df = all_data[symbol]
+        rows = index.get_indexer(df.index)
+        for f, field in enumerate(_PANEL_FIELDS):
+            if field in df.columns:
+                panel[rows, k, f] = df[field].to_numpy(dtype=float)
+
+    return index, panel
+
 def _convert_result_time(result, timedelta):
     """
     由于ccxt的默认时间为0时区, 所以为了更好地对比回测账单和实盘账单
     新增该函数用以调整回测账单的时区
     timedelta即为时区修正的小时数
     eg: timedelta=8 => UTG+8
+    账单只记录时间偏移量, 不再逐条复制记录。
+    没有交易但记录了净值曲线时仍然返回账单, 净值曲线同样调整时区
     """
-    if not result:
+    if not result and getattr(result, 'equity', None) is None:
         print("No result now!")
         return
     
-    updated_result = []
-    for entry in result:
-        updated_entry = entry.copy()
-
-        if 'open_date' in updated_entry:
-            updated_entry['open_date'] = updated_entry['open_date'] + datetime.timedelta(hours=timedelta)
-        if 'close_date' in updated_entry:
-            updated_entry['close_date'] = updated_entry['close_date'] + datetime.timedelta(hours=timedelta)
-        
-        updated_result.append(updated_entry)
-    
-    return updated_result
+    return result.with_time_offset(timedelta)
 
 def evaluate_strategy(result, init_balance, risk_free_rate=US_TREASURY_YIELD):
     """
@@ -211,15 +981,49 @@ def evaluate_strategy(result, init_balance, risk_free_rate=US_TREASURY_YIELD):
     返回:
     - 一个包含总收益、胜率、盈亏比、最大回撤、年化收益率、夏普比率等指标的字典。
     """
-    if isinstance(result, list):
-        # 单 symbol 情况，直接调用单 symbol 评估函数
-        return _evaluate_single_symbol(result, init_balance, risk_free_rate)
+    if isinstance(result, (list, Ledger)):
+        profiler = getattr(result, 'profile', None)
     elif isinstance(result, dict):
-        # 多 symbol 情况，基于组合净值曲线计算综合指标
-        return _evaluate_multi_symbol(result, init_balance, risk_free_rate)
+        profiler = next((trades.profile for trades in result.values() if getattr(trades, 'profile', None) is not None), None)
     else:
         raise ValueError("Invalid result format. Expected list or dict.")
 
+    # 回测开启了性能分析时, 评估耗时也记录到同一个报告中
+    with profile_phase(profiler, 'evaluation'):
+        if isinstance(result, (list, Ledger)):
+            # 单 symbol 情况，直接调用单 symbol 评估函数
+            evaluation = _evaluate_single_symbol(result, init_balance, risk_free_rate)
+            equities = [getattr(result, 'equity', None)]
+        else:
+            # 多 symbol 情况，基于组合净值曲线计算综合指标
+            evaluation = _evaluate_multi_symbol(result, init_balance, risk_free_rate)
+            equities = [getattr(trades, 'equity', None) for trades in result.values()]
+
+        # 回测记录了逐K线净值时, 额外给出基于盯市净值的最大回撤和夏普比率
+        equities = [equity['equity'] for equity in equities if equity is not None]
+        if evaluation is not None and equities:
+            evaluation.update(_evaluate_equity(equities, risk_free_rate))
+
+    return evaluation
+
+def _evaluate_equity(equities, risk_free_rate):
+    """
+    基于逐K线记录的净值曲线计算最大回撤和夏普比率。
+    多个独立账户(多 symbol 分别回测)的净值先对齐再相加。
+    """
+    if len(equities) == 1:
+        total_equity = equities[0].astype(float)
+    else:
+        total_equity = pd.concat(equities, axis=1).ffill().bfill().sum(axis=1)
+
+    daily_equity = total_equity.resample('1D').last().dropna()
+    daily_returns = daily_equity.pct_change().fillna(0)
+
+    return {
+        'equity_max_drawdown': _calculate_max_drawdown_from_balance(total_equity),
+        'equity_sharpe_ratio': _calculate_sharpe_ratio_from_returns(daily_returns, risk_free_rate)
+    }
+
 
 def _evaluate_single_symbol(history, init_balance, risk_free_rate=US_TREASURY_YIELD):
     """
@@ -234,7 +1038,7 @@ def _evaluate_single_symbol(history, init_balance, risk_free_rate=US_TREASURY_YI
     - 一个包含总收益、胜率、盈亏比、最大回撤、年化收益率、夏普比率、交易次数、日均交易次数等指标的字典。
     """
     
-    df = pd.DataFrame(history)
+    df = to_frame(history)
 
     if df.empty:
         print('No trading result')
@@ -376,7 +1180,7 @@ def _evaluate_multi_symbol(results, init_balance, risk_free_rate):
     all_trades = []
 
     for symbol, trades in results.items():
-        df_trades = pd.DataFrame(trades)
+        df_trades = to_frame(trades)
 
         if df_trades.empty:
             print(f'No trading result for {symbol}')
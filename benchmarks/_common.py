@@ -0,0 +1,55 @@
+# 性能对比脚本共用的导入和随机K线
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 仓库目录本身就是 Neilyst 包, 目录名不是 Neilyst 时按包的方式加载
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if importlib.util.find_spec('Neilyst') is None:
+    _spec = importlib.util.spec_from_file_location('Neilyst', os.path.join(_root, '__init__.py'), submodule_search_locations=[_root])
+    _module = importlib.util.module_from_spec(_spec)
+    sys.modules['Neilyst'] = _module
+    _spec.loader.exec_module(_module)
+
+def random_bars(n, seed=0, price=100):
+    """
+    随机游走的 high/low/close, 返回三个 pd.Series
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-01-01', periods=n, freq='1min')
+    close = pd.Series(price * np.exp(np.cumsum(rng.normal(0, 0.001, n))), index=index)
+    high = close * (1 + np.abs(rng.normal(0, 0.0005, n)))
+    low = close * (1 - np.abs(rng.normal(0, 0.0005, n)))
+    return high, low, close
+
+def best_of(func, repeat=3):
+    """
+    func 的最短耗时(秒), 先调用一次, 不计入编译时间
+    """
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def kernel_inputs(n, seed=0):
+    """
+    计算内核的输入: OHLC 和收益率数组, 蒙特卡洛使用的交易盈亏和重抽样下标(共 n 笔交易)
+    """
+    high, low, close = random_bars(n, seed)
+    close = close.to_numpy()
+    open_ = np.r_[close[0], close[:-1]]
+    returns = np.r_[np.nan, np.round(np.diff(close) / close[:-1], 5)]
+    rng = np.random.default_rng(seed)
+    pnl = rng.normal(0.5, 10, 1000)
+    indices = rng.integers(0, len(pnl), size=(max(n // len(pnl), 1), len(pnl)), dtype=np.int32)
+    return {
+        'open': open_, 'high': np.maximum(high.to_numpy(), open_), 'low': np.minimum(low.to_numpy(), open_), 'close': close,
+        'returns': returns, 'pnl': pnl, 'indices': indices
+    }
@@ -0,0 +1,47 @@
+# 每个计算内核在各个后端下的耗时(秒, 取3次的最小值)
+# 用法: python benchmarks/bench_kernels.py [K线数量]
+import importlib
+import sys
+
+import pandas as pd
+
+from _common import best_of, kernel_inputs
+
+from Neilyst import kernels
+from Neilyst.models import Position
+
+def main(n=200000, seed=0):
+    engine = importlib.import_module('Neilyst.backtest')
+    data = kernel_inputs(n, seed)
+    # 止盈止损和挂单设得足够远, 扫描需要走完全部K线
+    position = Position('benchmark')
+    position.open(data['close'][0], 1, 'long', None)
+    position.set_exit_orders(data['close'][0] * 0.01, data['close'][0] * 100, 0.99)
+    cases = {
+        'rolling_ols': lambda: kernels.rolling_ols(data['low'], data['high'], 18),
+        'rolling_signed_var': lambda: kernels.rolling_signed_var(data['returns'], 10),
+        'rolling_rank_last': lambda: kernels.rolling_rank_last(data['returns'], 300),
+        'rolling_moments': lambda: kernels.rolling_moments(data['close'], list(range(10, 101, 5))),
+        'scan_exit': lambda: engine._scan_exit_orders(position, data['open'], data['high'], data['low'], 0),
+        'scan_limit': lambda: engine._scan_limit_order(True, data['close'][0] * 0.01, data['open'], data['high'], data['low'], 0, n),
+        'resample_metrics': lambda: kernels.resample_metrics(data['pnl'], data['indices']),
+        'shuffle_metrics': lambda: kernels.shuffle_metrics(data['pnl'], len(data['indices']), seed)
+    }
+
+    previous = kernels.get_backend()
+    rows = []
+    try:
+        for backend in kernels.available_backends():
+            kernels.set_backend(backend)
+            for name, func in cases.items():
+                rows.append({'kernel': name, 'backend': backend, 'seconds': best_of(func)})
+    finally:
+        kernels.set_backend(previous)
+
+    table = pd.DataFrame(rows).pivot(index='kernel', columns='backend', values='seconds')
+    if 'numba' in table.columns:
+        table['speedup'] = table['numpy'] / table['numba']
+    print(table.round(4).to_string())
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,32 @@
+# rsrs 和它使用的滚动回归, 滚动排名内核在各个后端下的耗时
+# 用法: python benchmarks/bench_rsrs.py [K线数量]
+import importlib
+import sys
+import warnings
+
+from _common import best_of, random_bars
+
+from Neilyst import kernels
+
+def main(n=500000):
+    warnings.simplefilter('ignore', FutureWarning)
+    rsrs = importlib.import_module('rsrs').rsrs
+    high, low, close = random_bars(n, seed=7, price=60000)
+    x, y = low.to_numpy(), high.to_numpy()
+    ret_std = close.pct_change().rolling(18).std().to_numpy()
+
+    previous = kernels.get_backend()
+    try:
+        for backend in kernels.available_backends():
+            kernels.set_backend(backend)
+            timings = {
+                'rsrs_18_300': best_of(lambda: rsrs(high, low, close, 18, 300)),
+                'rolling_ols': best_of(lambda: kernels.rolling_ols(x, y, 18)),
+                'rolling_rank_last': best_of(lambda: kernels.rolling_rank_last(ret_std, 300)),
+            }
+            print(f'{backend:6s} ' + '  '.join(f'{name} {seconds:.3f}s' for name, seconds in timings.items()))
+    finally:
+        kernels.set_backend(previous)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,457 @@
+# 本模块提供回测结果和指标的本地缓存, 参数和数据都没有变化时直接返回上次的结果
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import inspect
+import numpy as np
+import pandas as pd
+
+from .data import get_partitions_fingerprint
+from .ledger import Ledger
+from .utils.folder import check_folder_exists, creat_folder, get_current_path
+
+CACHE_VERSION = 1
+INDICATOR_CACHE_VERSION = 1
+
+class ResultCache():
+    """
+    内容寻址的回测结果缓存。
+    缓存键由策略类的源码和参数(包括手续费, 滑点, data 和 indicators), 回测选项, symbol, 时间范围,
+    本地1min数据分区文件的指纹以及回测引擎的源码共同计算, 任何一项变化都会得到新的键。
+    每个结果按列保存在 path/<key>/ 目录中。
+
+    参数:
+    - path: 缓存目录, 默认为 当前目录/cache/backtest
+    - max_size_mb: 缓存总大小上限, 超过时按最近使用时间淘汰
+    - max_age: 缓存有效期, 秒数或 '7d' 这样的时间长度, 超过有效期的结果不再使用
+    """
+    def __init__(self, path=None, max_size_mb=None, max_age=None):
+        self.path = path if path is not None else os.path.join(get_current_path(), 'cache', 'backtest')
+        self.max_size_mb = max_size_mb
+        self.max_age = pd.Timedelta(max_age).total_seconds() if isinstance(max_age, str) else max_age
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(self, symbol, start, end, strategy_digest, options):
+        """
+        计算缓存键, strategy_digest 为 strategy_fingerprint 的结果, 需要在回测开始前计算
+        """
+        symbols = symbol if isinstance(symbol, list) else [symbol]
+        digest = hashlib.sha256()
+        digest.update(repr((CACHE_VERSION, symbol, start, end, sorted(options.items()))).encode())
+        digest.update(strategy_digest.encode())
+        digest.update(_engine_fingerprint().encode())
+        for sym in symbols:
+            digest.update(repr(get_partitions_fingerprint(sym, start, end)).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        读取缓存的回测结果, 没有命中时返回 None
+        """
+        entry = os.path.join(self.path, key)
+        meta = _read_meta(entry)
+        if meta is None or self._expired(meta):
+            self.misses += 1
+            return None
+
+        if meta['kind'] == 'dict':
+            # 没有交易记录的 symbol 保存为空, 读取时还原为 None
+            missing = set(meta.get('missing', []))
+            result = {
+                symbol: None if k in missing else Ledger.load(os.path.join(entry, f'{k}.npz'))
+                for k, symbol in enumerate(meta['symbols'])
+            }
+        else:
+            result = Ledger.load(os.path.join(entry, '0.npz'))
+
+        # 更新最近使用时间, 淘汰时优先删除最久没有使用的结果
+        os.utime(os.path.join(entry, 'meta.json'))
+        self.hits += 1
+        return result
+
+    def put(self, key, result, description=None):
+        """
+        保存回测结果, 支持单个 Ledger 和 symbol -> Ledger 的字典, 字典中没有交易记录的 symbol(None)只在 meta.json 中记录
+        """
+        if isinstance(result, dict):
+            kind, symbols, ledgers = 'dict', list(result.keys()), list(result.values())
+        elif isinstance(result, Ledger):
+            kind, symbols, ledgers = 'ledger', None, [result]
+        else:
+            return
+
+        # 先写入临时目录再改名, 避免保存一半的结果被读到
+        entry = os.path.join(self.path, key)
+        tmp_entry = f'{entry}.tmp{os.getpid()}'
+        missing = [k for k, ledger in enumerate(ledgers) if ledger is None]
+        try:
+            creat_folder(tmp_entry)
+            for k, ledger in enumerate(ledgers):
+                if ledger is not None:
+                    ledger.save(os.path.join(tmp_entry, f'{k}.npz'))
+            with open(os.path.join(tmp_entry, 'meta.json'), 'w') as f:
+                json.dump({'kind': kind, 'symbols': symbols, 'missing': missing, 'created': time.time(), 'description': description}, f)
+        except Exception:
+            # 保存失败时删除写了一半的临时目录
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            raise
+
+        if check_folder_exists(entry):
+            shutil.rmtree(entry)
+        os.replace(tmp_entry, entry)
+        self.stores += 1
+        self.evict()
+
+    def invalidate(self, key=None, symbol=None):
+        """
+        删除缓存的结果。key 和 symbol 都不传时清空整个缓存, 传入 symbol 时删除包含该 symbol 的结果。
+        返回删除的结果数量
+        """
+        removed = 0
+        for entry_key, entry, meta in self._entries():
+            if key is not None and entry_key != key:
+                continue
+            if symbol is not None and symbol not in _meta_symbols(meta):
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+        return removed
+
+    def clear(self):
+        return self.invalidate()
+
+    def evict(self, max_size_mb=None, max_age=None):
+        """
+        删除过期的结果, 并在总大小超过上限时按最近使用时间从旧到新删除。返回删除的结果数量
+        """
+        max_size_mb = self.max_size_mb if max_size_mb is None else max_size_mb
+        max_age = self.max_age if max_age is None else max_age
+
+        now = time.time()
+        entries = []
+        removed = 0
+        for _, entry, meta in self._entries():
+            if max_age is not None and now - meta['created'] > max_age:
+                shutil.rmtree(entry, ignore_errors=True)
+                removed += 1
+                continue
+            entries.append((os.path.getmtime(os.path.join(entry, 'meta.json')), _folder_size(entry), entry))
+
+        if max_size_mb is not None:
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= max_size_mb * 1024 * 1024:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                removed += 1
+
+        self.evictions += removed
+        return removed
+
+    def stats(self):
+        """
+        返回命中率和缓存占用
+        """
+        entries = list(self._entries())
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'size_mb': sum(_folder_size(entry) for _, entry, _ in entries) / 1024 / 1024
+        }
+
+    def _expired(self, meta):
+        return self.max_age is not None and time.time() - meta['created'] > self.max_age
+
+    def _entries(self):
+        if not check_folder_exists(self.path):
+            return
+        for entry_key in os.listdir(self.path):
+            entry = os.path.join(self.path, entry_key)
+            meta = _read_meta(entry)
+            if meta is not None:
+                yield entry_key, entry, meta
+
+    def __repr__(self):
+        stats = self.stats()
+        return f"ResultCache({self.path}, {stats['entries']} entries, {stats['size_mb']:.1f} MB, hits: {stats['hits']}, misses: {stats['misses']})"
+
+class IndicatorCache(ResultCache):
+    """
+    指标的本地缓存。
+    每个 (symbol, 周期, 指标) 保存在 path/<key>/ 目录中, 同时记录计算时使用的K线(时间和OHLCV)的指纹。
+    K线没有变化时直接返回缓存的列; 只是在末尾追加了新的K线时只重新计算尾部:
+    从缓存末尾向前多取 warmup 根K线作为预热一起计算, 预热区间后半段的新旧结果一致时拼接到缓存后面,
+    不一致(e.g EMA 这类依赖全部历史的指标)时把预热区间加倍重试, 预热区间覆盖全部缓存时完整重算。
+    其他情况(K线被修改, 起点不同等)完整重算并覆盖缓存。
+
+    参数:
+    - path: 缓存目录, 默认为 当前目录/cache/indicators
+    - max_size_mb, max_age: 同 ResultCache, 超过大小上限时按最近使用时间淘汰
+    - rtol: 比较预热区间新旧结果的相对误差
+    """
+    def __init__(self, path=None, max_size_mb=None, max_age=None, rtol=1e-9):
+        path = path if path is not None else os.path.join(get_current_path(), 'cache', 'indicators')
+        super().__init__(path, max_size_mb, max_age)
+        self.rtol = rtol
+        self.partial_hits = 0
+        self.rows_reused = 0
+        self.rows_computed = 0
+        self._hashed = None
+
+    def key(self, symbol, timeframe, spec, source=''):
+        """
+        计算缓存键, source 为指标实现的指纹, 指标代码变化后得到新的键
+        """
+        digest = hashlib.sha256()
+        digest.update(repr((INDICATOR_CACHE_VERSION, symbol, timeframe, spec)).encode())
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        读取缓存的指标列, 没有命中时返回 None
+        """
+        entry = os.path.join(self.path, key)
+        meta = _read_meta(entry)
+        if meta is None or self._expired(meta):
+            return None
+        try:
+            return pd.read_pickle(os.path.join(entry, 'values.pkl'))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, result, description=None, fingerprint=None, symbol=None):
+        """
+        保存指标列, fingerprint 为计算时使用的K线的指纹
+        """
+        entry = os.path.join(self.path, key)
+        tmp_entry = f'{entry}.tmp{os.getpid()}'
+        creat_folder(tmp_entry)
+        result.to_pickle(os.path.join(tmp_entry, 'values.pkl'))
+        with open(os.path.join(tmp_entry, 'meta.json'), 'w') as f:
+            json.dump({
+                'kind': 'indicator', 'symbols': [symbol], 'created': time.time(), 'description': description,
+                'rows': len(result), 'fingerprint': fingerprint
+            }, f)
+
+        if check_folder_exists(entry):
+            shutil.rmtree(entry)
+        os.replace(tmp_entry, entry)
+        self.stores += 1
+        self.evict()
+
+    def compute(self, symbol, timeframe, spec, data, func, warmup=1, source=''):
+        """
+        返回 func(data) 的结果, 尽量使用缓存。
+
+        参数:
+        - symbol, timeframe, spec: 缓存键, spec 为指标名称和参数, e.g 'rsrs_18_300'
+        - data: K线数据
+        - func: 计算指标的函数, 输入K线, 返回以K线时间为索引的 DataFrame, 失败时返回 None
+        - warmup: 尾部重算时初始的预热K线数量
+        - source: 指标实现的指纹
+        """
+        key = self.key(symbol, timeframe, spec, source)
+        entry = os.path.join(self.path, key)
+        hashes = self._row_hashes(data)
+        meta = _read_meta(entry)
+
+        if meta is not None and meta.get('kind') == 'indicator' and not self._expired(meta):
+            rows = meta['rows']
+            if rows <= len(data) and _digest_rows(hashes[:rows]) == meta['fingerprint']:
+                # 读取失败时(其他进程正在覆盖或淘汰这条缓存)按未命中处理
+                cached = self.get(key)
+                if cached is not None and rows == len(data):
+                    os.utime(os.path.join(entry, 'meta.json'))
+                    self.hits += 1
+                    self.rows_reused += rows
+                    return cached
+
+                result = self._extend(cached, data, func, warmup) if cached is not None else None
+                if result is not None:
+                    self.partial_hits += 1
+                    self.put(key, result, {'spec': spec, 'timeframe': timeframe}, _digest_rows(hashes), symbol)
+                    return result
+
+        self.misses += 1
+        result = func(data)
+        self.rows_computed += len(data)
+        if result is not None:
+            self.put(key, result, {'spec': spec, 'timeframe': timeframe}, _digest_rows(hashes), symbol)
+        return result
+
+    def _extend(self, cached, data, func, warmup):
+        """
+        在缓存后面追加新K线的指标值, 预热区间的结果对不上且无法再加长时返回 None
+        """
+        n = len(cached)
+        warmup = max(int(warmup), 1)
+        while warmup < n:
+            lo = n - warmup
+            fresh = func(data.iloc[lo:])
+            if fresh is None or list(fresh.columns) != list(cached.columns):
+                return None
+            self.rows_computed += len(fresh)
+
+            # 预热区间的前半段可能还没有完整的窗口, 只比较后半段
+            check = max(warmup // 2, 1)
+            if _same_values(fresh.iloc[warmup - check:warmup], cached.iloc[n - check:], self.rtol):
+                self.rows_reused += n
+                return pd.concat([cached, fresh.iloc[warmup:]])
+            warmup *= 2
+        return None
+
+    def _row_hashes(self, data):
+        # 同一份K线连续计算多个指标时只计算一次
+        if self._hashed is None or self._hashed[0] is not data or len(self._hashed[1]) != len(data):
+            columns = [column for column in ('open', 'high', 'low', 'close', 'volume') if column in data.columns]
+            self._hashed = (data, pd.util.hash_pandas_object(data[columns], index=True).to_numpy())
+        return self._hashed[1]
+
+    def stats(self):
+        """
+        返回命中率, 尾部重算次数, 复用和计算的K线数量以及缓存占用
+        """
+        stats = super().stats()
+        lookups = self.hits + self.partial_hits + self.misses
+        stats.update({
+            'partial_hits': self.partial_hits,
+            'hit_rate': (self.hits + self.partial_hits) / lookups if lookups else 0,
+            'rows_reused': self.rows_reused,
+            'rows_computed': self.rows_computed
+        })
+        return stats
+
+    def __repr__(self):
+        stats = self.stats()
+        return f"IndicatorCache({self.path}, {stats['entries']} entries, {stats['size_mb']:.1f} MB, hits: {stats['hits']}, partial: {stats['partial_hits']}, misses: {stats['misses']})"
+
+_default_cache = None
+_default_indicator_cache = None
+
+def default_cache():
+    """
+    backtest(..., cache=True) 使用的全局缓存
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
+
+def default_indicator_cache():
+    """
+    get_indicators(..., cache=True) 使用的全局指标缓存
+    """
+    global _default_indicator_cache
+    if _default_indicator_cache is None:
+        _default_indicator_cache = IndicatorCache()
+    return _default_indicator_cache
+
+def strategy_fingerprint(strategy):
+    """
+    策略类(包括父类)的源码和策略实例参数的哈希
+    """
+    digest = hashlib.sha256()
+    for cls in type(strategy).__mro__:
+        if cls.__module__ in ('builtins', 'abc'):
+            continue
+        digest.update(_class_source(cls).encode())
+
+    state = strategy.get_state() if hasattr(strategy, 'get_state') else vars(strategy)
+    for name in sorted(state):
+        digest.update(name.encode())
+        _hash_value(digest, state[name])
+    _hash_value(digest, getattr(strategy, 'data', None))
+    _hash_value(digest, getattr(strategy, 'indicators', None))
+    return digest.hexdigest()
+
+def _class_source(cls):
+    try:
+        return inspect.getsource(cls)
+    except (OSError, TypeError):
+        # notebook 中定义的类可能拿不到源码, 改用各方法的字节码
+        parts = [cls.__qualname__]
+        for name, value in sorted(vars(cls).items()):
+            code = getattr(value, '__code__', None)
+            if code is not None:
+                parts.append(f'{name}:{code.co_code.hex()}:{code.co_consts!r}')
+            elif isinstance(value, (int, float, str, bool, tuple, type(None))):
+                parts.append(f'{name}:{value!r}')
+        return '\n'.join(parts)
+
+def _hash_value(digest, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        labels = list(value.columns) if isinstance(value, pd.DataFrame) else value.name
+        digest.update(repr((type(value).__name__, labels)).encode())
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=repr):
+            digest.update(repr(k).encode())
+            _hash_value(digest, value[k])
+    else:
+        try:
+            digest.update(pickle.dumps(value, protocol=4))
+        except Exception:
+            digest.update(repr(value).encode())
+
+_engine_digest = None
+
+def _engine_fingerprint():
+    # 回测引擎本身改动后旧的缓存自动失效
+    global _engine_digest
+    if _engine_digest is None:
+        digest = hashlib.sha256()
+        for name in ('backtest', 'models', 'ledger', 'kernels'):
+            module = sys.modules.get(f'{__package__}.{name}')
+            if module is not None and getattr(module, '__file__', None):
+                with open(module.__file__, 'rb') as f:
+                    digest.update(f.read())
+        _engine_digest = digest.hexdigest()
+    return _engine_digest
+
+def _digest_rows(hashes):
+    return hashlib.sha256(np.ascontiguousarray(hashes).tobytes()).hexdigest()
+
+def _same_values(fresh, cached, rtol):
+    try:
+        a, b = fresh.to_numpy(dtype=float), cached.to_numpy(dtype=float)
+        # 滚动求和等算法的舍入误差与起点有关, 接近0的值按所在列的量级比较
+        scale = np.nanmax(np.abs(b), axis=0, initial=0.0)
+        with np.errstate(invalid='ignore'):
+            close = np.abs(a - b) <= rtol * (np.abs(b) + scale)
+        return bool(np.all(close | (np.isnan(a) & np.isnan(b))))
+    except (TypeError, ValueError):
+        return fresh.set_axis(cached.index).equals(cached)
+
+def _read_meta(entry):
+    try:
+        with open(os.path.join(entry, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _meta_symbols(meta):
+    if meta.get('symbols'):
+        return meta['symbols']
+    description = meta.get('description') or {}
+    symbol = description.get('symbol')
+    return symbol if isinstance(symbol, list) else [symbol]
+
+def _folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
@@ -0,0 +1,41 @@
+# 本模块负责长周期回测的断点保存和恢复
+import os
+import pickle
+
+from .utils.folder import check_folder_exists, creat_folder
+
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(path, payload):
+    """
+    保存回测断点。先写入临时文件再替换, 避免保存过程中中断导致断点文件损坏。
+    """
+    folder = os.path.dirname(path)
+    if folder and not check_folder_exists(folder):
+        creat_folder(folder)
+
+    payload = dict(payload, version=CHECKPOINT_VERSION)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    """
+    读取回测断点, 文件不存在时返回 None
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        payload = pickle.load(f)
+
+    if payload.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version in {path}')
+    return payload
+
+def symbol_checkpoint_path(path, symbol):
+    """
+    多 symbol 回测时每个 symbol 单独保存断点, path 视为目录
+    """
+    return os.path.join(path, f"{symbol.replace('/', '_')}.ckpt")
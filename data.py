@@ -128,15 +128,7 @@ def _get_single_symbol_klines(symbol=None, start=None, end=None, timeframe='1h',
     获取单个 symbol 的 K 线数据。
     """
     exchange = init_ccxt_exchange(exchange_name, proxy)
-    symbol_sp = symbol.split('/')
-
-    if data_path is None:
-        # 使用默认路径
-        current_path = get_current_path()
-        data_path = f'{current_path}/data/{exchange_name}-{symbol_sp[0]}/{timeframe}'
-    else:
-        # 使用传入的 data_path，并添加子目录
-        data_path = os.path.join(data_path, f'{exchange_name}-{symbol_sp[0]}', timeframe)
+    data_path = _symbol_data_path(symbol, timeframe, exchange_name, data_path)
 
     if auth:
         missing_periods = _check_local_data(data_path, start, end, timeframe)
@@ -164,6 +156,39 @@ def _get_single_symbol_klines(symbol=None, start=None, end=None, timeframe='1h',
 
     return all_klines
 
+def _symbol_data_path(symbol, timeframe, exchange_name='binanceusdm', data_path=None):
+    """
+    本地保存某个 symbol 某个周期数据的目录
+    """
+    symbol_sp = symbol.split('/')
+
+    if data_path is None:
+        # 使用默认路径
+        current_path = get_current_path()
+        return f'{current_path}/data/{exchange_name}-{symbol_sp[0]}/{timeframe}'
+    # 使用传入的 data_path，并添加子目录
+    return os.path.join(data_path, f'{exchange_name}-{symbol_sp[0]}', timeframe)
+
+def get_partitions_fingerprint(symbol, start, end, timeframe='1m', exchange_name='binanceusdm', data_path=None):
+    """
+    返回本地数据在 [start, end] 范围内每个分区文件的 (文件名, 大小, 修改时间), 用于判断数据是否发生变化。
+    本地没有数据时返回空列表。
+    """
+    path = _symbol_data_path(symbol, timeframe, exchange_name, data_path)
+    if not check_folder_exists(path):
+        return []
+
+    start = datetime.strptime(start, '%Y-%m-%dT%H:%M:%SZ')
+    end = datetime.strptime(end, '%Y-%m-%dT%H:%M:%SZ')
+    fingerprint = []
+    for file in sorted(os.listdir(path)):
+        file_start, file_end = _parse_time_range(file)
+        if file_start >= start and file_end <= end:
+            stat = os.stat(os.path.join(path, file))
+            fingerprint.append((file, stat.st_size, stat.st_mtime_ns))
+
+    return fingerprint
+
 def _check_symbol(symbol):
     if not symbol:
         raise Exception('No symbol', symbol)
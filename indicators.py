@@ -3,107 +3,476 @@ import pandas as pd
 import os
 import inspect
 import sys
-from .utils.string import split_letters_numbers
+import hashlib
+import ast
+import functools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from .cache import IndicatorCache, default_indicator_cache
+from .shared import sharing, indicator as shared_indicator, atr as shared_atr
+from .kernels import rolling_moments
+from .utils.cpu import get_available_cpu_count
+from .utils.string import split_letters_numbers, expand_param_ranges
 
 # 将自建指标库添加到Python路径中
 current_dir = os.path.dirname(os.path.abspath(__file__))
 indicators_lib_path = os.path.join(current_dir, 'indicators_lib')
 sys.path.append(indicators_lib_path)
 
-def get_indicators(data, *args):
+def get_indicators(data, *args, cache=None, symbol=None, timeframe=None, processes=1, dtype=None):
     """
     对外的计算指标的接口，支持单个或多个 symbol。
+    指标的参数可以写成范围, e.g 'bollinger_k_10:100:5', 结果与逐个传入 bollinger_k_10, bollinger_k_15, ... 相同,
+    整组参数一次计算并作为一个二维数组加入结果, 见 indicator_family
+    参数:
+    - cache: True 时使用默认的指标缓存(当前目录/cache/indicators), 也可以传入 IndicatorCache, 为空时不使用缓存
+    - symbol: 缓存键中的 symbol, data 为字典时使用字典的键
+    - timeframe: 缓存键中的K线周期, e.g '1m', 为空时按K线间隔推断
+    - processes: 计算使用的进程数, 默认为1, 在当前进程中依次计算; None 时按空闲的CPU数量。
+      大于1时每个 (symbol, 指标) 作为一个任务分给进程池, K线通过共享内存传给子进程, 结果的列与串行计算相同
+    - dtype: 结果中浮点列的类型, e.g np.float32, 为空时与指标的结果相同(通常为 float64)。
+      所有浮点列写入同一个预先分配的二维数组, 结果只有一个数据块
     """
+    indicator_cache = default_indicator_cache() if cache is True else cache
+    frames = data if isinstance(data, dict) else {symbol: data}
+    processes = get_available_cpu_count() if processes is None else processes
+
+    tasks = len(frames) * len(args)
+    if processes > 1 and tasks > 1 and all(isinstance(df.index, pd.DatetimeIndex) for df in frames.values()):
+        results = _calculate_parallel(frames, args, indicator_cache, timeframe, min(processes, tasks))
+    else:
+        results = {sym: None for sym in frames}
+
+    all_indicators = {}
+    for sym, df in frames.items():
+        all_indicators[sym] = _calculate_indicators_for_single_symbol(df, *args, cache=indicator_cache, symbol=sym, timeframe=timeframe, results=results[sym], dtype=dtype)
+
     if isinstance(data, dict):
         # 多 symbol 情况
-        all_indicators = {}
-        for symbol, df in data.items():
-            indicators_df = _calculate_indicators_for_single_symbol(df, *args)
-            all_indicators[symbol] = indicators_df
-
         return all_indicators
     else:
         # 单 symbol 情况
-        return _calculate_indicators_for_single_symbol(data, *args)
+        return all_indicators[symbol]
 
-def _calculate_indicators_for_single_symbol(data, *args):
+def _calculate_indicators_for_single_symbol(data, *args, cache=None, symbol=None, timeframe=None, results=None, dtype=None):
     """
     计算单个 symbol 的指标。
+    results 为并行计算好的 指标 -> 结果, 为空时按编译好的计划在当前进程中计算
     """
     indicators = args
-    indicators_df = pd.DataFrame()
-    indicators_df['close'] = data['close']
+    if cache is not None and timeframe is None:
+        timeframe = _infer_timeframe(data.index)
+    if results is None:
+        results = compile_indicators(*indicators).run(data, cache, symbol, timeframe)
 
+    # 各指标的列按顺序收集后一次组装, 同名的列保留第一次出现的位置和最后一次的结果
+    columns = {'close': data['close']}
     for indicator in indicators:
-        name, params = split_letters_numbers(indicator)
-        params = [int(p) for p in params if p.isdigit()] if params else []
-        if params:
-            col_name = f"{name}_{'_'.join(map(str, params))}"
-        else:
-            col_name = name
+        result = results[indicator]
+        if result is None:
+            continue
 
+        if not result.index.equals(data.index):
+            result = result.reindex(data.index)
+        for col, values in result.items():
+            columns[col] = values
 
-        if hasattr(ta, name):
-            func = getattr(ta, name)
-        else:
-            # 再pandas_ta中找不到指标 则尝试在自建指标库中搜索
-            try:
-                custom_indicator_module = __import__(name)
-                func = getattr(custom_indicator_module, name)
-            except ImportError:
-                print(f'Indicator {name} not found in pandas_ta or indicators_lib.')
-                continue
-            except AttributeError:
-                print(f'Function {name} not found in module {name}.')
-                continue
+    return _assemble_columns(columns, data.index, dtype)
+
+def _assemble_columns(columns, index, dtype=None):
+    """
+    把 列名 -> Series 组装为 DataFrame。
+    浮点列按顺序写入一个预先分配, 按列连续存储的二维数组, 不再逐列插入(每次插入都会新增一个数据块, 之后合并时整体复制);
+    其它类型的列(整数, 布尔等)保持原类型, 组装后插入原来的位置
+    """
+    floats = [name for name, values in columns.items() if values.dtype.kind == 'f']
+    if dtype is None:
+        dtype = np.result_type(*(columns[name].dtype for name in floats)) if floats else np.float64
+    block = np.empty((len(index), len(floats)), dtype=dtype, order='F')
+    for j, name in enumerate(floats):
+        block[:, j] = columns[name].to_numpy()
+
+    df = pd.DataFrame(block, index=index, columns=floats, copy=False)
+    if len(floats) < len(columns):
+        for position, (name, values) in enumerate(columns.items()):
+            if values.dtype.kind != 'f':
+                df.insert(position, name, values.to_numpy())
+    return df
+
+def compile_indicators(*indicators):
+    """
+    把一组指标名称编译为 IndicatorPlan, 相同的指标列表只编译一次。
+    e.g plan = compile_indicators('bollinger_k_20', 'normalized_stddev_20_14', 'atr_14'); plan.run(data); plan.stats
+    """
+    return _compile_plan(tuple(indicators))
+
+class IndicatorPlan():
+    """
+    编译好的一组指标。
+    创建时解析每个指标的名称和参数, 找到指标函数并确定需要传入的参数和数据列, 重复的指标只保留一个;
+    run 时在 shared.sharing() 中依次计算, 指标之间输入和参数相同的中间序列(收益率, 滚动方差/标准差, ATR, 滚动回归)
+    以及参数相同的指标调用只计算一次。
+
+    属性:
+    - steps: 指标 -> 参数范围展开后每个指标的 (名称, 列名, 指标函数, 参数, 数据列), 找不到的指标为 None
+    - stats: 最近一次 run 的统计, duplicates 为去掉的重复指标数, computed/reused 为中间序列计算和共用的次数
+    """
+    def __init__(self, indicators):
+        self.indicators = tuple(indicators)
+        self.steps = {
+            indicator: [_compile_indicator(spec) for spec in expand_param_ranges(indicator)]
+            for indicator in dict.fromkeys(self.indicators)
+        }
+        self.stats = {}
+
+    def run(self, data, cache=None, symbol=None, timeframe=None):
+        """
+        计算每个指标, 返回 指标 -> 以列名命名的 DataFrame(找不到或计算失败时为 None), 参数与 get_indicators 相同
+        """
+        with sharing() as shared:
+            results = {indicator: _compute_indicator(data, indicator, cache, symbol, timeframe) for indicator in self.steps}
+        self.stats = {'indicators': len(self.indicators), 'duplicates': len(self.indicators) - len(self.steps), **shared.stats()}
+        return results
+
+@functools.lru_cache(maxsize=256)
+def _compile_plan(indicators):
+    return IndicatorPlan(indicators)
+
+def _compute_indicator(data, indicator, cache=None, symbol=None, timeframe=None):
+    """
+    计算单个指标, 有缓存时通过缓存计算
+    """
+    if cache is None:
+        return _calculate_indicator(data, indicator)
+
+    if timeframe is None:
+        timeframe = _infer_timeframe(data.index)
+    return cache.compute(
+        symbol, timeframe, indicator, data, lambda df: _calculate_indicator(df, indicator),
+        warmup=_warmup(indicator), source=_indicator_source(indicator)
+    )
+
+@functools.lru_cache(maxsize=None)
+def _compile_indicator(indicator):
+    """
+    解析指标名称, 找到指标函数, 按函数签名确定参数和需要传入的数据列, 结果缓存, 找不到指标时返回 None
+    """
+    name, params, col_name = _parse_spec(indicator)
+
+    if hasattr(ta, name):
+        func = getattr(ta, name)
+    else:
+        # 再pandas_ta中找不到指标 则尝试在自建指标库中搜索
         try:
-            # 获取函数签名
-            sig = inspect.signature(func)
-            required_params = sig.parameters
-
-            # 构建传入的参数，根据函数所需的参数动态传递
-            kwargs = {}
-
-           # 处理 std_length 和 atr_length 参数
-            if 'std_length' in required_params and len(params) >= 1:
-                kwargs['std_length'] = params[0]
-            if 'atr_length' in required_params and len(params) >= 2:
-                kwargs['atr_length'] = params[1]
-            if 'length' in required_params and len(params) >= 1:
-                kwargs['length'] = params[0]
-
-            # 根据函数签名传递数据列 (open, high, low, close, volume)
-            if 'open' in required_params:
-                kwargs['open'] = data['open']
-            if 'high' in required_params:
-                kwargs['high'] = data['high']
-            if 'low' in required_params:
-                kwargs['low'] = data['low']
-            if 'close' in required_params:
-                kwargs['close'] = data['close']
-            if 'volume' in required_params and 'volume' in data.columns:
-                kwargs['volume'] = data['volume']
-
-            # 调用指标函数
-            result = func(**kwargs)
-            if result is None:
-                print(f'Indicator {name} returned None.')
-                continue
+            custom_indicator_module = __import__(name)
+            func = getattr(custom_indicator_module, name)
+        except ImportError:
+            print(f'Indicator {name} not found in pandas_ta or indicators_lib.')
+            return None
+        except AttributeError:
+            print(f'Function {name} not found in module {name}.')
+            return None
+
+    # 获取函数签名
+    required_params = inspect.signature(func).parameters
+    # 根据函数签名传递数据列 (open, high, low, close, volume)
+    columns = tuple(column for column in ('open', 'high', 'low', 'close', 'volume') if column in required_params)
+    return name, col_name, func, _spec_kwargs(required_params, params), columns
+
+def _calculate_indicator(data, indicator):
+    """
+    计算单个指标, 返回以指标名称(和参数)命名列的 DataFrame, 找不到指标或计算失败时返回 None
+    """
+    if ':' in indicator:
+        values, labels = indicator_family(data, indicator)
+        if not labels:
+            return None
+        return pd.DataFrame(values, index=data.index, columns=labels, copy=False)
+
+    step = _compile_indicator(indicator)
+    if step is None:
+        return None
+    name, col_name, func, params, columns = step
+    try:
+        # 构建传入的参数，根据函数所需的参数动态传递
+        kwargs = dict(params)
+        for column in columns:
+            if column != 'volume' or column in data.columns:
+                kwargs[column] = data[column]
+
+        # 调用指标函数, 同一次计算中参数相同的调用共用结果
+        result = shared_indicator(func, **kwargs)
+        if result is None:
+            print(f'Indicator {name} returned None.')
+            return None
+
+        # 处理返回多个列的情况, 列直接使用指标的结果, 组装时才复制到结果数组
+        if isinstance(result, pd.DataFrame):
+            return pd.DataFrame({f'{col_name}_{col}': result[col] for col in result.columns}, index=data.index, copy=False)
+        return pd.DataFrame({col_name: result}, index=data.index, copy=False)
+    except Exception as e:
+        print(f'Error calculating indicator {name}: {e}')
+        import traceback
+        traceback.print_exc()
+        return None
+
+def indicator_family(data, indicator):
+    """
+    计算参数范围指标, e.g 'bollinger_k_10:100:5', 返回 (二维数组, 列名)。
+    数组形状为 (K线数, 列数), 按列连续存储; 列名与逐个传入展开后的指标相同, e.g ['bollinger_k_10', 'bollinger_k_15', ...]。
+    bollinger_k, normalized_stddev 和 sma 的所有窗口长度由 kernels.rolling_moments 共用一份分块前缀和一次算出,
+    其它指标在 shared.sharing() 中逐个计算(共用中间序列)后写入同一个数组
+    """
+    specs = expand_param_ranges(indicator)
+    steps = [_compile_indicator(spec) for spec in specs]
+    labels = [_parse_spec(spec)[2] for spec in specs]
+
+    family = _FAMILIES.get(steps[0][0]) if steps[0] is not None else None
+    longest = max((max(step[3].values(), default=0) for step in steps if step is not None), default=0)
+    if family is not None and all(step is not None for step in steps) and len(data) >= longest:
+        with sharing():
+            return family(data, [step[3] for step in steps]), labels
+
+    with sharing():
+        results = [_calculate_indicator(data, spec) for spec in specs]
+    results = [result for result in results if result is not None]
+    labels = [col for result in results for col in result.columns]
+    values = np.empty((len(data), len(labels)), order='F')
+    j = 0
+    for result in results:
+        for col in result.columns:
+            values[:, j] = result[col].to_numpy(dtype=float)
+            j += 1
+    return values, labels
+
+def _rolling_family(close, lengths):
+    # 一组窗口长度的滚动均值和标准差, 按列存储, 与 rolling(length).mean() 和 rolling(length).std() 相同
+    mean, var = rolling_moments(close, lengths)
+    return mean, np.sqrt(var, out=var)
+
+def _bollinger_k_family(data, params):
+    close = data['close'].to_numpy(dtype=float)
+    mean, std = _rolling_family(close, [kwargs.get('length', 20) for kwargs in params])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.subtract(close[:, None], mean, out=mean)
+        return np.divide(mean, std, out=mean)
+
+def _sma_family(data, params):
+    mean, _ = rolling_moments(data['close'].to_numpy(dtype=float), [kwargs.get('length', 10) for kwargs in params])
+    return mean
 
-            # 处理返回多个列的情况
-            if isinstance(result, pd.DataFrame):
-                for col in result.columns:
-                    indicators_df[f'{col_name}_{col}'] = result[col]
+def _normalized_stddev_family(data, params):
+    close = data['close'].to_numpy(dtype=float)
+    _, std = _rolling_family(close, [kwargs.get('std_length', 14) for kwargs in params])
+    # ATR 按 atr_length 分别计算一次, 与 normalized_stddev 中的 ATR 相同
+    for atr_length in {kwargs.get('atr_length', 14) for kwargs in params}:
+        atr = shared_atr(data['high'], data['low'], data['close'], atr_length).to_numpy(dtype=float)
+        columns = [j for j, kwargs in enumerate(params) if kwargs.get('atr_length', 14) == atr_length]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std[:, columns] = std[:, columns] / atr[:, None]
+    return std
+
+# 可以对整组参数一次计算的指标
+_FAMILIES = {
+    'bollinger_k': _bollinger_k_family,
+    'sma': _sma_family,
+    'normalized_stddev': _normalized_stddev_family,
+}
+
+def _parse_spec(indicator):
+    """
+    解析指标名称, e.g 'normalized_stddev_14_14' => ('normalized_stddev', [14, 14], 'normalized_stddev_14_14'),
+    第三项为结果的列名(多列结果的列名前缀)
+    """
+    name, params = split_letters_numbers(indicator)
+    params = [int(p) for p in params if p.isdigit()] if params else []
+    if params:
+        col_name = f"{name}_{'_'.join(map(str, params))}"
+    else:
+        col_name = name
+    return name, params, col_name
+
+def _spec_kwargs(required_params, params):
+    """
+    按函数签名把指标名称中的参数对应到 length, std_length 和 atr_length
+    """
+    kwargs = {}
+
+    # 处理 std_length 和 atr_length 参数
+    if 'std_length' in required_params and len(params) >= 1:
+        kwargs['std_length'] = params[0]
+    if 'atr_length' in required_params and len(params) >= 2:
+        kwargs['atr_length'] = params[1]
+    if 'length' in required_params and len(params) >= 1:
+        kwargs['length'] = params[0]
+    return kwargs
+
+def _warmup(indicator):
+    """
+    尾部重算时初始的预热K线数量, 取参数之和的两倍, 不够时缓存会自动加长; 参数范围取展开后的最大值
+    """
+    warmups = [1]
+    for spec in expand_param_ranges(indicator):
+        _, params = split_letters_numbers(spec)
+        warmups.append(2 * sum(int(p) for p in params if p.isdigit()) + 1)
+    return max(warmups)
+
+def _indicator_source(indicator):
+    """
+    指标实现的指纹: pandas_ta 的指标取版本号, 自建指标取源文件以及它(直接或间接)导入的本包模块的内容,
+    e.g rsrs 包括 shared.py 和 kernels.py。参数范围按 _FAMILIES 一次计算时再加上 indicators.py
+    """
+    name, _ = split_letters_numbers(expand_param_ranges(indicator)[0])
+    version = f'pandas_ta {getattr(ta, "version", "")}' if hasattr(ta, name) else ''
+    paths = [] if version else [os.path.join(indicators_lib_path, f'{name}.py')]
+    if ':' in indicator and name in _FAMILIES:
+        paths.append(os.path.abspath(__file__))
+    if not paths:
+        return version
+
+    digest = hashlib.sha256(version.encode())
+    for path in _package_imports(paths):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def _package_imports(paths):
+    """
+    paths 中的源文件以及它们直接或间接导入的本包模块的文件, 按遍历顺序返回
+    """
+    files = []
+    pending = [path for path in paths if os.path.exists(path)]
+    while pending:
+        path = pending.pop(0)
+        if path in files:
+            continue
+        files.append(path)
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            # from Neilyst.x import ... / import Neilyst.x / 包内的相对导入 from .x import ...
+            if isinstance(node, ast.Import):
+                targets = [(current_dir, alias.name.split('.')[1:]) for alias in node.names
+                           if alias.name.split('.')[0] == 'Neilyst']
+            elif isinstance(node, ast.ImportFrom):
+                if node.level > 0:
+                    base = os.path.dirname(path)
+                    for _ in range(node.level - 1):
+                        base = os.path.dirname(base)
+                    parts = node.module.split('.') if node.module else []
+                elif node.module and node.module.split('.')[0] == 'Neilyst':
+                    base, parts = current_dir, node.module.split('.')[1:]
+                else:
+                    continue
+                # from . import x 的 x 也可能是模块
+                targets = [(base, parts)] + [(base, parts + [alias.name]) for alias in node.names]
             else:
-                indicators_df[col_name] = result
+                continue
+            for base, parts in targets:
+                module = os.path.join(base, *parts)
+                # 子包取 __init__.py, 由它的相对导入继续找到包内模块
+                module = os.path.join(module, '__init__.py') if os.path.isdir(module) else module + '.py'
+                if os.path.commonpath([current_dir, module]) == current_dir and os.path.exists(module):
+                    pending.append(module)
+    return files
+
+def _infer_timeframe(index):
+    # 取相邻K线时间间隔的中位数, e.g '1m', '60m'
+    if not isinstance(index, pd.DatetimeIndex) or len(index) < 2:
+        return None
+    step = pd.Timedelta(np.median(np.diff(index.asi8)))
+    return f'{int(step.total_seconds() // 60)}m'
+
+# 并行计算时K线通过共享内存传给子进程, 每个 symbol 依次保存 int64 时间和按行排列的 float64 OHLCV
+_KLINE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+_CACHE_COUNTERS = ('hits', 'partial_hits', 'misses', 'stores', 'rows_reused', 'rows_computed')
+
+def _calculate_parallel(frames, indicators, cache, timeframe, processes):
+    """
+    在进程池中计算每个 (symbol, 指标), 返回 symbol -> 指标 -> 结果
+    """
+    shm, layout = _share_klines(frames)
+    # 子进程使用同一目录的缓存, 淘汰在全部任务结束后由当前进程完成
+    worker_cache = None if cache is None else IndicatorCache(cache.path, None, cache.max_age, cache.rtol)
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(shm.name, layout, worker_cache)) as executor:
+            futures = {
+                (symbol, indicator): executor.submit(_indicator_task, symbol, indicator, timeframe)
+                for symbol in frames for indicator in indicators
+            }
+            outputs = {key: future.result() for key, future in futures.items()}
+    finally:
+        shm.close()
+        shm.unlink()
 
-            # 填充空值
-            # indicators_df = indicators_df.fillna(method='bfill')
-        except Exception as e:
-            print(f'Error calculating indicator {name}: {e}')
-            import traceback
-            traceback.print_exc()
+    results = {symbol: {} for symbol in frames}
+    for (symbol, indicator), (columns, values, counters) in outputs.items():
+        if columns is not None:
+            results[symbol][indicator] = pd.DataFrame(dict(zip(columns, values)), index=frames[symbol].index)
+        else:
+            results[symbol][indicator] = None
+        if cache is not None:
+            for name, value in counters.items():
+                setattr(cache, name, getattr(cache, name) + value)
+    if cache is not None:
+        cache.evict()
+    return results
+
+def _share_klines(frames):
+    """
+    把各 symbol 的K线写入一块共享内存, 返回 (共享内存, 布局), 布局为 symbol -> (偏移, 行数, 列名, 时区)
+    """
+    layout = {}
+    offset = 0
+    for symbol, df in frames.items():
+        columns = [column for column in _KLINE_COLUMNS if column in df.columns]
+        layout[symbol] = (offset, len(df), columns, df.index.tz)
+        offset += len(df) * (1 + len(columns)) * 8
+
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    for symbol, df in frames.items():
+        index, values = _shared_views(shm.buf, layout[symbol])
+        index[:] = df.index.as_unit('ns').asi8
+        values[:] = df[layout[symbol][2]].to_numpy(dtype=float)
+    return shm, layout
 
-    return indicators_df
+def _shared_views(buffer, item):
+    offset, rows, columns, _ = item
+    index = np.ndarray(rows, dtype=np.int64, buffer=buffer, offset=offset)
+    values = np.ndarray((rows, len(columns)), dtype=np.float64, buffer=buffer, offset=offset + rows * 8)
+    return index, values
 
-    
\ No newline at end of file
+_worker_shm = None
+_worker_layout = None
+_worker_cache = None
+_worker_frames = {}
+
+def _init_worker(name, layout, cache):
+    global _worker_shm, _worker_layout, _worker_cache
+    _worker_shm = SharedMemory(name=name)
+    _worker_layout = layout
+    _worker_cache = cache
+    _worker_frames.clear()
+
+def _worker_frame(symbol):
+    # 子进程中的K线直接使用共享内存, 不复制
+    if symbol not in _worker_frames:
+        index, values = _shared_views(_worker_shm.buf, _worker_layout[symbol])
+        _, _, columns, tz = _worker_layout[symbol]
+        index = pd.DatetimeIndex(index.view('M8[ns]'))
+        if tz is not None:
+            index = index.tz_localize('UTC').tz_convert(tz)
+        _worker_frames[symbol] = pd.DataFrame(values, index=index, columns=columns, copy=False)
+    return _worker_frames[symbol]
+
+def _indicator_task(symbol, indicator, timeframe):
+    """
+    在子进程中计算一个指标, 返回 (列名, 各列的值, 缓存计数的变化), 只传回数组, 时间索引由主进程补上
+    """
+    before = {name: getattr(_worker_cache, name) for name in _CACHE_COUNTERS} if _worker_cache is not None else {}
+    result = _compute_indicator(_worker_frame(symbol), indicator, _worker_cache, symbol, timeframe)
+    counters = {name: getattr(_worker_cache, name) - value for name, value in before.items()}
+    if result is None:
+        return None, None, counters
+    return list(result.columns), [result[column].to_numpy() for column in result.columns], counters
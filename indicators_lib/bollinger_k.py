@@ -3,6 +3,8 @@ import numpy as np
 from numpy import nan as npNan
 from pandas_ta.utils import get_offset, verify_series
 
+from Neilyst.shared import rolling_std
+
 def bollinger_k(close, length=None, offset=None, **kwargs):
     """
     Indicator: Bollinger Band K Value (Number of Standard Deviations from Moving Average)
@@ -38,8 +40,8 @@ def bollinger_k(close, length=None, offset=None, **kwargs):
     else:  # Default to SMA
         ma = close.rolling(window=length).mean()
     
-    # Calculate Standard Deviation
-    std = close.rolling(window=length).std()
+    # Calculate Standard Deviation, shared with other indicators of the same request
+    std = rolling_std(close, length)
     
     # Calculate K Value
     k_value = (close - ma) / std
@@ -3,7 +3,8 @@
 import pandas as pd
 import numpy as np
 from pandas_ta.utils import get_offset, verify_series
-from pandas_ta.volatility import atr
+
+from Neilyst.shared import atr, rolling_std
 
 def normalized_stddev(high, low, close, std_length=None, atr_length=None, offset=None, **kwargs):
     """
@@ -26,11 +27,11 @@ def normalized_stddev(high, low, close, std_length=None, atr_length=None, offset
     atr_length = int(atr_length) if atr_length and atr_length > 0 else 14
     offset = get_offset(offset)
 
-    # 计算标准差
-    stddev = close.rolling(window=std_length).std()
+    # 计算标准差, 同一次 get_indicators 中与其它指标共用
+    stddev = rolling_std(close, std_length)
 
     # 计算 ATR
-    atr_value = atr(high=high, low=low, close=close, length=atr_length)
+    atr_value = atr(high, low, close, atr_length)
 
     # 计算归一化标准差
     normalized_std = stddev / atr_value
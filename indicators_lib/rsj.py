@@ -1,7 +1,9 @@
-from numpy import nan as npNan
-from pandas_ta import Imports
+import pandas as pd
 from pandas_ta.utils import get_offset, verify_series
 
+from Neilyst.kernels import rolling_signed_var
+from Neilyst.shared import pct_change, rolling_var
+
 def rsj(close, length=None, offset=None, **kwargs):
     """Indicator: Relative Signed Jump (RSJ)"""
 
@@ -14,29 +16,15 @@ def rsj(close, length=None, offset=None, **kwargs):
         return
 
     # Calculate Returns
-    returns = close.pct_change()
+    returns = pct_change(close)
 
     # Calculate realized variance over the window
-    rv = returns.rolling(window=length).var()
+    rv = rolling_var(returns, length)
 
-    # Functions to compute variance of positive and negative returns
-    def var_positive(x):
-        positive_x = x[x > 0]
-        if len(positive_x) > 0:
-            return positive_x.var()
-        else:
-            return npNan
-
-    def var_negative(x):
-        negative_x = x[x < 0]
-        if len(negative_x) > 0:
-            return negative_x.var()
-        else:
-            return npNan
-
-    # Compute rv_p and rv_n using rolling apply
-    rv_p = returns.rolling(window=length).apply(var_positive, raw=False)
-    rv_n = returns.rolling(window=length).apply(var_negative, raw=False)
+    # Variance of positive and negative returns over the window, from rolling counts, sums and sums of squares
+    rv_p, rv_n = rolling_signed_var(returns.to_numpy(dtype=float), length)
+    rv_p = pd.Series(rv_p, index=returns.index)
+    rv_n = pd.Series(rv_n, index=returns.index)
 
     # Compute RSJ
     rsj = (rv_p - rv_n) / rv
@@ -56,3 +44,33 @@ def rsj(close, length=None, offset=None, **kwargs):
     rsj.category = 'volatility'
 
     return rsj
+
+def rsj_panel(close, length=None, offset=None, **kwargs):
+    """
+    在多个 symbol 的收盘价面板(行为时间, 列为 symbol)上一次计算 RSJ, 每一列与对该列调用 rsj 的结果相同
+    """
+    length = int(length) if length and length > 0 else 10
+    offset = get_offset(offset)
+
+    if close is None or len(close) < length:
+        return
+
+    returns = close.pct_change()
+    rv = returns.rolling(window=length).var()
+
+    # 各列的正负收益方差在一次调用中计算
+    rv_p, rv_n = rolling_signed_var(returns.to_numpy(dtype=float), length)
+    rv_p = pd.DataFrame(rv_p, index=returns.index, columns=returns.columns)
+    rv_n = pd.DataFrame(rv_n, index=returns.index, columns=returns.columns)
+
+    rsj = (rv_p - rv_n) / rv
+
+    if offset != 0:
+        rsj = rsj.shift(offset)
+
+    if 'fillna' in kwargs:
+        rsj.fillna(kwargs['fillna'], inplace=True)
+    if 'fill_method' in kwargs:
+        rsj.fillna(method=kwargs['fill_method'], inplace=True)
+
+    return rsj
@@ -1,7 +1,9 @@
 import pandas as pd
-from numpy import nan as npNaN
 from pandas_ta.utils import get_offset, verify_series
 
+from Neilyst.kernels import rolling_rank_last
+from Neilyst.shared import pct_change, rolling_ols, rolling_std
+
 def rsrs(high, low, close, length=None, std_length=None, offset=None, **kwargs):
     """
     计算 RSRS 指标，包括原始 RSRS、标准化 RSRS、钝化 RSRS。
@@ -10,6 +12,8 @@ def rsrs(high, low, close, length=None, std_length=None, offset=None, **kwargs):
     - RSRS_Beta：原始斜率 β
     - RSRS：标准化后的 RSRS 值
     - RSRS_Passive：钝化 RSRS 值
+
+    窗口内 low 全部相同时 β 和 R 方为 NaN, high 全部相同时 β 为 0, R 方为 NaN。
     """
     # 验证参数
     length = int(length) if length and length > 0 else 18
@@ -20,43 +24,14 @@ def rsrs(high, low, close, length=None, std_length=None, offset=None, **kwargs):
     low = verify_series(low)
     close = verify_series(close)
 
-    if high is None or low is None or close is None or open is None:
+    if high is None or low is None or close is None:
         return
 
-    # 初始化 DataFrame
-    hl_df = pd.concat([low, high], axis=1)
-    hl_df.columns = ['low', 'high']
-
-    # 初始化用于存储 β 和 R 方的列表
-    beta_values = [npNaN] * len(hl_df)
-    r2_values = [npNaN] * len(hl_df)
-
-    # 计算滚动斜率 β 和 R 方
-    for i in range(length - 1, len(hl_df)):
-        hl_window = hl_df.iloc[i - length + 1:i + 1]
-        x = hl_window['low'].values
-        y = hl_window['high'].values
-
-        x_mean = x.mean()
-        y_mean = y.mean()
-        numerator = ((x - x_mean) * (y - y_mean)).sum()
-        denominator = ((x - x_mean) ** 2).sum()
-        if denominator == 0:
-            beta = npNaN
-            r_squared = npNaN
-        else:
-            beta = numerator / denominator
-            y_pred = x * beta + (y_mean - beta * x_mean)
-            ss_res = ((y - y_pred) ** 2).sum()
-            ss_tot = ((y - y_mean) ** 2).sum()
-            r_squared = 1 - ss_res / ss_tot if ss_tot != 0 else npNaN
-
-        beta_values[i] = beta
-        r2_values[i] = r_squared
-
-    # 将 β 和 R 方转换为 Series
-    beta = pd.Series(beta_values, index=hl_df.index)
-    r_squared = pd.Series(r2_values, index=hl_df.index)
+    # 计算滚动斜率 β 和 R 方, 由 kernels 模块用滑动窗口的求和计算, 在 numba 和 NumPy 实现之间选择
+    # 同一次 get_indicators 中相同 length 的 rsrs 共用回归结果, beta 之后可能被原地填充, 这里复制一份
+    beta_values, r2_values = rolling_ols(low, high, length)
+    beta = pd.Series(beta_values, index=high.index, copy=True)
+    r_squared = pd.Series(r2_values, index=high.index)
 
     # 计算标准化 RSRS
     beta_mean = beta.rolling(window=std_length, min_periods=1).mean()
@@ -66,11 +41,10 @@ def rsrs(high, low, close, length=None, std_length=None, offset=None, **kwargs):
     # 计算收益率标准差的分位数（ret_quantile）
     N = length  # 使用与 β 相同的 N
     M = std_length  # 使用与标准化相同的 M
-    returns = close.pct_change()
-    ret_std = returns.rolling(window=N).std()
-    # 计算过去 M 期内标准差的分位数
-    ret_quantile = ret_std.rolling(window=M).apply(
-        lambda x: x.rank(pct=True)[-1] if len(x.dropna()) == M else npNaN, raw=False)
+    returns = pct_change(close)
+    ret_std = rolling_std(returns, N)
+    # 计算过去 M 期内标准差的分位数, 每步只更新移出和加入的值, 不对整个窗口重新排序
+    ret_quantile = pd.Series(rolling_rank_last(ret_std.to_numpy(dtype=float), M), index=close.index)
 
     # 计算钝化 RSRS
     rsrs_passive = rsrs * (r_squared ** (2 * ret_quantile))
@@ -0,0 +1,713 @@
+# 本模块提供回测引擎, 指标和蒙特卡洛检验的计算内核
+# 安装了 numba 时使用 JIT 编译的逐元素循环, 否则使用等价的 NumPy 向量化实现
+import os
+import bisect
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# 运行时选择的后端: 'numba' 或 'numpy', 可以用环境变量 NEILYST_KERNELS=numpy 强制使用 NumPy
+_backend = None
+_compiled = {}
+
+# scan_exit 返回的触发类型编码
+EXIT_NONE, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT, EXIT_TRAILING_STOP = 0, 1, 2, 3
+
+# NumPy 实现按块处理滑动窗口, 限制临时数组的内存
+_CHUNK = 65536
+# 滚动求和时每块的窗口数量, 块越小前缀和的量级越小, 误差越小
+_SUM_BLOCK = 1024
+# 窗口长于该值时 NumPy 实现的滚动排名改用有序列表
+_RANK_BISECT = 512
+# rolling_moments 前缀和的最小块长, 块越小误差越小, 块越大 NumPy 实现的开销越小
+_MOMENT_BLOCK = 1024
+
+def available_backends():
+    return ['numba', 'numpy'] if numba is not None else ['numpy']
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        preferred = os.environ.get('NEILYST_KERNELS', 'auto')
+        _backend = 'numba' if preferred in ('auto', 'numba') and numba is not None else 'numpy'
+    return _backend
+
+def set_backend(backend):
+    """
+    切换计算后端: 'auto', 'numba' 或 'numpy'
+    """
+    global _backend
+    if backend == 'auto':
+        _backend = 'numba' if numba is not None else 'numpy'
+    elif backend == 'numba' and numba is None:
+        raise ImportError('numba is not installed.')
+    elif backend in ('numba', 'numpy'):
+        _backend = backend
+    else:
+        raise ValueError(f'Unknown kernel backend: {backend}')
+
+def jit_kernel(name):
+    """
+    返回编译后的内核, 当前后端不是 numba 时返回 None
+    """
+    if get_backend() != 'numba':
+        return None
+    kernel = _compiled.get(name)
+    if kernel is None:
+        # 内核中调用的辅助函数需要先编译, 编译内核时按全局变量解析
+        global _path_metrics_kernel, _snap_r2
+        if _path_metrics_kernel is _path_metrics_loop:
+            _path_metrics_kernel = numba.njit(cache=True, nogil=True)(_path_metrics_loop)
+        if not hasattr(_snap_r2, 'py_func'):
+            _snap_r2 = numba.njit(cache=True, nogil=True)(_snap_r2)
+        kernel = _compiled[name] = numba.njit(cache=True, nogil=True)(_LOOP_KERNELS[name])
+    return kernel
+
+def rolling_ols(x, y, length):
+    """
+    滚动窗口内 y 对 x 做最小二乘回归, 返回 (斜率 β, R 方), 前 length - 1 个值为 NaN。
+    由滑动窗口的 Σx, Σy, Σx², Σxy, Σy² 计算, 复杂度与窗口长度无关;
+    窗口内有 NaN 或 x 全部相同时都为 NaN, y 全部相同时斜率为0, R 方为 NaN
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    kernel = jit_kernel('rolling_ols')
+    if kernel is not None:
+        return kernel(x, y, length)
+    return _rolling_ols_numpy(x, y, length)
+
+def rolling_signed_var(values, length):
+    """
+    滚动窗口内正值和负值各自的样本方差, 返回 (正值方差, 负值方差)。
+    窗口内有 NaN 或者对应符号的值不足两个时为 NaN, 与 pandas 的 rolling().apply(lambda x: x[x > 0].var()) 相同。
+    由滑动窗口内正负值各自的数量, 和与平方和计算, 复杂度与窗口长度无关。
+    values 可以是二维数组(时间 x symbol), 按列分别计算
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    kernel = jit_kernel('rolling_signed_var')
+    if kernel is None:
+        return _rolling_signed_var_numpy(values, length)
+    if values.ndim == 1:
+        return kernel(values, length)
+
+    # 按列存储, 每一列都是连续的内存
+    columns = np.asfortranarray(values)
+    var_p = np.empty(values.shape, order='F')
+    var_n = np.empty(values.shape, order='F')
+    for j in range(values.shape[1]):
+        var_p[:, j], var_n[:, j] = kernel(columns[:, j], length)
+    return var_p, var_n
+
+def rolling_rank_last(values, length):
+    """
+    每个窗口最后一个值在窗口内的百分比排名(相同值取平均排名), 窗口内有 NaN 时为 NaN,
+    与 pandas 的 rolling().apply(lambda x: x.rank(pct=True).iloc[-1]) 相同。
+    numba 实现用树状数组维护窗口内各个值的数量, 每步 O(log N); NumPy 实现在窗口较短时逐个比较, 较长时维护有序列表
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    kernel = jit_kernel('rolling_rank_last')
+    if kernel is not None:
+        return kernel(values, length)
+    return _rolling_rank_last_numpy(values, length)
+
+def rolling_moments(values, lengths):
+    """
+    一组窗口长度的滚动均值和样本方差, 返回 (均值, 方差), 形状为 (n, len(lengths)), 按列存储。
+    与 pandas 的 rolling(length).mean() 和 rolling(length).var() 相同: 窗口不满或有 NaN 时为 NaN, 窗口内全部相同时方差为0。
+    按块计算减去块内均值后的前缀和, 各个窗口长度共用同一份前缀和, 窗口的和由前缀和相减得到
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n, k = len(values), len(lengths)
+    mean = np.full((n, k), np.nan, order='F')
+    var = np.full((n, k), np.nan, order='F')
+    if n == 0 or k == 0:
+        return mean, var
+
+    # NaN 的数量和相邻取值变化的次数的前缀和, 都是精确的整数
+    invalid = np.isnan(values)
+    missing = np.concatenate(([0], np.cumsum(invalid)))
+    moves = np.concatenate(([0, 0], np.cumsum(values[1:] != values[:-1])))
+
+    kernel = jit_kernel('rolling_moments') or _rolling_moments_numpy
+    # 前缀和的误差随块长增长, 窗口长度按量级(每档4倍)分组, 同一档共用前缀和, 块长至少为该档最长窗口的2倍
+    tiers = {}
+    for j, length in enumerate(lengths.tolist()):
+        tiers.setdefault(int(np.log2(max(length, 1)) // 2), []).append(j)
+    for columns in tiers.values():
+        columns = np.array(columns, dtype=np.int64)
+        block = max(_MOMENT_BLOCK, 2 * int(lengths[columns].max()))
+        kernel(values, lengths[columns], columns, block, missing, moves, mean, var)
+    return mean, var
+
+def resample_metrics(pnl, indices):
+    """
+    indices 的每一行是一次重抽样的交易下标, 对每一行的交易序列计算
+    (总盈亏, 累计盈亏的最大回撤, 每笔盈亏的样本方差)
+    """
+    pnl = np.ascontiguousarray(pnl, dtype=np.float64)
+    kernel = jit_kernel('resample_metrics')
+    if kernel is not None:
+        return kernel(pnl, np.ascontiguousarray(indices), float(pnl.mean()))
+    return _resample_metrics_numpy(pnl, indices)
+
+def shuffle_metrics(pnl, sims, seed):
+    """
+    把交易顺序随机打乱 sims 次, 返回值与 resample_metrics 相同。
+    两个后端使用不同的随机数发生器, 同一个 seed 得到的排列不同, 但分布相同
+    """
+    pnl = np.ascontiguousarray(pnl, dtype=np.float64)
+    kernel = jit_kernel('shuffle_metrics')
+    if kernel is not None:
+        return kernel(pnl, sims, seed, float(pnl.mean()))
+    # 对随机数排序得到每一行独立的随机排列
+    rng = np.random.default_rng(seed)
+    return _resample_metrics_numpy(pnl, np.argsort(rng.random((sims, len(pnl)), dtype=np.float32), axis=1))
+
+# ---------------- 逐元素循环实现, 由 numba 编译 ----------------
+
+def _scan_exit_loop(is_long, stop_loss, take_profit, trailing_stop, extreme, open_prices, high_prices, low_prices, start):
+    # 与 backtest._scan_exit_orders 的分块实现规则相同, 价位为 NaN 表示未设置
+    total = len(open_prices)
+    has_sl = not np.isnan(stop_loss)
+    has_tp = not np.isnan(take_profit)
+    has_trail = not np.isnan(trailing_stop)
+    running = extreme
+    for j in range(start, total):
+        high = high_prices[j]
+        low = low_prices[j]
+        if is_long:
+            sl_hit = has_sl and low <= stop_loss
+            tp_hit = has_tp and high >= take_profit
+            trail_level = running * (1 - trailing_stop)
+            trail_hit = has_trail and low <= trail_level
+        else:
+            sl_hit = has_sl and high >= stop_loss
+            tp_hit = has_tp and low <= take_profit
+            trail_level = running * (1 + trailing_stop)
+            trail_hit = has_trail and high >= trail_level
+
+        if sl_hit or tp_hit or trail_hit:
+            bar_open = open_prices[j]
+            if sl_hit or trail_hit:
+                # 同一根K线内都触发时, 多头取较高的止损价, 空头取较低的止损价, 相同时为止损
+                if sl_hit and (not trail_hit or (stop_loss >= trail_level if is_long else stop_loss <= trail_level)):
+                    code, level = EXIT_STOP_LOSS, stop_loss
+                else:
+                    code, level = EXIT_TRAILING_STOP, trail_level
+                price = min(bar_open, level) if is_long else max(bar_open, level)
+            else:
+                code = EXIT_TAKE_PROFIT
+                price = max(bar_open, take_profit) if is_long else min(bar_open, take_profit)
+            return j, price, code
+
+        # 移动止损只使用之前K线的极值, NaN 不参与比较
+        if is_long:
+            if high > running or np.isnan(running):
+                running = high
+        elif low < running or np.isnan(running):
+            running = low
+
+    return -1, np.nan, EXIT_NONE
+
+def _scan_limit_loop(is_buy, limit_price, open_prices, high_prices, low_prices, start, stop):
+    # 与分块实现的切片一样, 超出数组长度的部分忽略
+    for j in range(start, min(stop, len(open_prices))):
+        if is_buy:
+            if low_prices[j] <= limit_price:
+                return j, min(open_prices[j], limit_price)
+        elif high_prices[j] >= limit_price:
+            return j, max(open_prices[j], limit_price)
+    return -1, np.nan
+
+def _rolling_ols_loop(x, y, length):
+    # 滑动更新窗口内的 Σx, Σy, Σx², Σxy, Σy², 每 length 个输出以窗口第一个值为基准重新求和一次,
+    # 平均每个输出 O(1), 同时减小大数相减的误差。NaN 的数量和取值变化的次数单独计数, 与逐窗口计算的判断相同
+    n = len(x)
+    beta = np.full(n, np.nan)
+    r2 = np.full(n, np.nan)
+    ref_x = 0.0
+    ref_y = 0.0
+    sx = sy = sxx = sxy = syy = 0.0
+    missing = 0
+    x_moves = 0
+    y_moves = 0
+    for i in range(length - 1, n):
+        start = i - length + 1
+        if start % length == 0:
+            if not np.isnan(x[start]):
+                ref_x = x[start]
+            if not np.isnan(y[start]):
+                ref_y = y[start]
+            sx = sy = sxx = sxy = syy = 0.0
+            missing = 0
+            x_moves = 0
+            y_moves = 0
+            for k in range(start, i + 1):
+                if np.isnan(x[k]) or np.isnan(y[k]):
+                    missing += 1
+                else:
+                    dx = x[k] - ref_x
+                    dy = y[k] - ref_y
+                    sx += dx
+                    sy += dy
+                    sxx += dx * dx
+                    sxy += dx * dy
+                    syy += dy * dy
+                if k > start:
+                    x_moves += int(x[k] != x[k - 1])
+                    y_moves += int(y[k] != y[k - 1])
+        else:
+            old = start - 1
+            if np.isnan(x[old]) or np.isnan(y[old]):
+                missing -= 1
+            else:
+                dx = x[old] - ref_x
+                dy = y[old] - ref_y
+                sx -= dx
+                sy -= dy
+                sxx -= dx * dx
+                sxy -= dx * dy
+                syy -= dy * dy
+            if np.isnan(x[i]) or np.isnan(y[i]):
+                missing += 1
+            else:
+                dx = x[i] - ref_x
+                dy = y[i] - ref_y
+                sx += dx
+                sy += dy
+                sxx += dx * dx
+                sxy += dx * dy
+                syy += dy * dy
+            x_moves += int(x[i] != x[i - 1]) - int(x[start] != x[old])
+            y_moves += int(y[i] != y[i - 1]) - int(y[start] != y[old])
+
+        # 窗口内 x 全部相同时斜率和 R 方都为 NaN, y 全部相同时斜率为0, R 方为 NaN
+        if missing > 0 or x_moves == 0:
+            continue
+        if y_moves == 0:
+            beta[i] = 0.0
+            continue
+        dxx = sxx - sx * sx / length
+        dxy = sxy - sx * sy / length
+        dyy = syy - sy * sy / length
+        b = dxy / dxx
+        beta[i] = b
+        r2[i] = _snap_r2(b * dxy / dyy)
+    return beta, r2
+
+def _snap_r2(r):
+    # 完全共线时逐窗口计算得到的 R 方恰好为1, 求和的舍入误差会让它略小于1, 这里还原为1
+    return 1.0 if r > 1 - 1e-12 else r
+
+def _rolling_signed_var_loop(values, length):
+    # 滑动更新窗口内正值和负值的数量, 和与平方和, 每 length 个输出以窗口内各自的均值为基准重新求和一次
+    n = len(values)
+    var_p = np.full(n, np.nan)
+    var_n = np.full(n, np.nan)
+    ref_p = 0.0
+    ref_n = 0.0
+    count_p = count_n = missing = 0
+    sum_p = sum_n = square_p = square_n = 0.0
+    for i in range(length - 1, n):
+        start = i - length + 1
+        if start % length == 0:
+            count_p = count_n = missing = 0
+            sum_p = sum_n = 0.0
+            for k in range(start, i + 1):
+                v = values[k]
+                if np.isnan(v):
+                    missing += 1
+                elif v > 0:
+                    count_p += 1
+                    sum_p += v
+                elif v < 0:
+                    count_n += 1
+                    sum_n += v
+            ref_p = sum_p / count_p if count_p > 0 else 0.0
+            ref_n = sum_n / count_n if count_n > 0 else 0.0
+            sum_p = sum_n = square_p = square_n = 0.0
+            for k in range(start, i + 1):
+                v = values[k]
+                if v > 0:
+                    sum_p += v - ref_p
+                    square_p += (v - ref_p) ** 2
+                elif v < 0:
+                    sum_n += v - ref_n
+                    square_n += (v - ref_n) ** 2
+        else:
+            v = values[start - 1]
+            if np.isnan(v):
+                missing -= 1
+            elif v > 0:
+                count_p -= 1
+                sum_p -= v - ref_p
+                square_p -= (v - ref_p) ** 2
+            elif v < 0:
+                count_n -= 1
+                sum_n -= v - ref_n
+                square_n -= (v - ref_n) ** 2
+            v = values[i]
+            if np.isnan(v):
+                missing += 1
+            elif v > 0:
+                count_p += 1
+                sum_p += v - ref_p
+                square_p += (v - ref_p) ** 2
+            elif v < 0:
+                count_n += 1
+                sum_n += v - ref_n
+                square_n += (v - ref_n) ** 2
+
+        if missing > 0:
+            continue
+        if count_p > 1:
+            var_p[i] = max((square_p - sum_p * sum_p / count_p) / (count_p - 1), 0.0)
+        if count_n > 1:
+            var_n[i] = max((square_n - sum_n * sum_n / count_n) / (count_n - 1), 0.0)
+    return var_p, var_n
+
+def _rolling_rank_last_loop(values, length):
+    # 先把全部非 NaN 值映射为有序的编号, 用树状数组记录窗口内每个编号出现的次数,
+    # 每步移出和加入一个值, 再查询小于和等于最后一个值的数量, 都是 O(log N)
+    n = len(values)
+    ranks = np.full(n, np.nan)
+    finite = values[~np.isnan(values)]
+    levels = np.unique(finite)
+    size = len(levels)
+    codes = np.searchsorted(levels, values)
+    tree = np.zeros(size + 1, dtype=np.int64)
+    missing = 0
+    for i in range(n):
+        if i >= length:
+            if np.isnan(values[i - length]):
+                missing -= 1
+            else:
+                k = codes[i - length] + 1
+                while k <= size:
+                    tree[k] -= 1
+                    k += k & -k
+
+        last = values[i]
+        if np.isnan(last):
+            missing += 1
+            continue
+        k = codes[i] + 1
+        while k <= size:
+            tree[k] += 1
+            k += k & -k
+
+        if i >= length - 1 and missing == 0:
+            # 编号小于 codes[i] 的数量和不大于 codes[i] 的数量
+            less = 0
+            k = codes[i]
+            while k > 0:
+                less += tree[k]
+                k -= k & -k
+            upto = 0
+            k = codes[i] + 1
+            while k > 0:
+                upto += tree[k]
+                k -= k & -k
+            ranks[i] = (less + (upto - less + 1) / 2) / length
+    return ranks
+
+def _path_metrics_loop(pnl, indices, row, shift, total, max_drawdown, variance):
+    # 单条交易序列的指标, 方差先减去全体交易的均值再累加平方, 避免大数相减损失精度
+    n = indices.shape[1]
+    cumulative = 0.0
+    peak = -np.inf
+    drawdown = 0.0
+    squares = 0.0
+    for j in range(n):
+        value = pnl[indices[row, j]]
+        cumulative += value
+        if cumulative > peak:
+            peak = cumulative
+        elif peak - cumulative > drawdown:
+            drawdown = peak - cumulative
+        squares += (value - shift) ** 2
+    total[row] = cumulative
+    max_drawdown[row] = drawdown
+    deviation = cumulative - n * shift
+    variance[row] = (squares - deviation * deviation / n) / (n - 1) if n > 1 else np.nan
+
+# 未编译时直接调用 Python 版本, 编译时替换为编译后的函数
+_path_metrics_kernel = _path_metrics_loop
+
+def _resample_metrics_loop(pnl, indices, shift):
+    sims = indices.shape[0]
+    total = np.empty(sims)
+    max_drawdown = np.empty(sims)
+    variance = np.empty(sims)
+    for row in range(sims):
+        _path_metrics_kernel(pnl, indices, row, shift, total, max_drawdown, variance)
+    return total, max_drawdown, variance
+
+def _shuffle_metrics_loop(pnl, sims, seed, shift):
+    n = len(pnl)
+    # xorshift64* 随机数, 比 np.random 快得多, 对洗牌足够均匀
+    state = np.uint64(seed) | np.uint64(1)
+    order = np.empty((1, n), dtype=np.int64)
+    for j in range(n):
+        order[0, j] = j
+    total = np.empty(sims)
+    max_drawdown = np.empty(sims)
+    variance = np.empty(sims)
+    for row in range(sims):
+        # Fisher-Yates 洗牌, 在上一次的排列上继续打乱, 结果仍是均匀的随机排列
+        for j in range(n - 1, 0, -1):
+            state ^= state >> np.uint64(12)
+            state ^= state << np.uint64(25)
+            state ^= state >> np.uint64(27)
+            k = int(((state * np.uint64(2685821657736338717)) >> np.uint64(11)) * (1.0 / 9007199254740992.0) * (j + 1))
+            order[0, j], order[0, k] = order[0, k], order[0, j]
+        _path_metrics_kernel(pnl, order, 0, shift, total[row:row + 1], max_drawdown[row:row + 1], variance[row:row + 1])
+    return total, max_drawdown, variance
+
+def _rolling_moments_loop(values, lengths, columns, block, missing, moves, mean, var):
+    # 与 NumPy 实现相同的分块前缀和, 每块只求一次前缀和, 各个窗口长度逐个输出
+    n = len(values)
+    longest = lengths.max()
+    total_sum = np.empty(block + longest)
+    square_sum = np.empty(block + longest)
+    for lo in range(0, n, block):
+        hi = min(lo + block, n)
+        start = max(lo - longest + 1, 0)
+        ref = 0.0
+        count = 0
+        for i in range(start, hi):
+            if not np.isnan(values[i]):
+                ref += values[i]
+                count += 1
+        if count > 0:
+            ref /= count
+        total_sum[0] = 0.0
+        square_sum[0] = 0.0
+        for i in range(start, hi):
+            d = 0.0 if np.isnan(values[i]) else values[i] - ref
+            total_sum[i - start + 1] = total_sum[i - start] + d
+            square_sum[i - start + 1] = square_sum[i - start] + d * d
+
+        for g in range(len(lengths)):
+            length = lengths[g]
+            j = columns[g]
+            for e in range(max(lo, length - 1), hi):
+                if missing[e + 1] > missing[e + 1 - length]:
+                    continue
+                if moves[e + 1] == moves[e + 2 - length]:
+                    mean[e, j] = values[e]
+                    if length > 1:
+                        var[e, j] = 0.0
+                    continue
+                a = e - start + 1
+                total = total_sum[a] - total_sum[a - length]
+                square = square_sum[a] - square_sum[a - length]
+                mean[e, j] = ref + total / length
+                if length > 1:
+                    var[e, j] = max((square - total * total / length) / (length - 1), 0.0)
+
+_LOOP_KERNELS = {
+    'scan_exit': _scan_exit_loop,
+    'scan_limit': _scan_limit_loop,
+    'rolling_ols': _rolling_ols_loop,
+    'rolling_signed_var': _rolling_signed_var_loop,
+    'rolling_rank_last': _rolling_rank_last_loop,
+    'rolling_moments': _rolling_moments_loop,
+    'resample_metrics': _resample_metrics_loop,
+    'shuffle_metrics': _shuffle_metrics_loop
+}
+
+# ---------------- NumPy 向量化实现 ----------------
+
+def _windows(values, length):
+    """
+    按块生成 (输出位置, 滑动窗口) , 窗口为 (块大小, length) 的只读视图
+    """
+    view = sliding_window_view(values, length)
+    for lo in range(0, len(view), _CHUNK):
+        yield lo + length - 1, view[lo:lo + _CHUNK]
+
+def _rolling_ols_numpy(x, y, length):
+    n = len(x)
+    beta = np.full(n, np.nan)
+    r2 = np.full(n, np.nan)
+    if n < length:
+        return beta, r2
+
+    # NaN 的数量和取值变化的次数用整数前缀和计算, 是精确的
+    missing = _window_sums(np.isnan(x) | np.isnan(y), length)
+    x_moves = _window_sums(np.r_[False, x[1:] != x[:-1]], length) - np.r_[False, x[1:n - length + 1] != x[:n - length]]
+    y_moves = _window_sums(np.r_[False, y[1:] != y[:-1]], length) - np.r_[False, y[1:n - length + 1] != y[:n - length]]
+
+    # 滑动窗口的和由前缀和相减得到, 分块并减去块内第一个有效值, 限制前缀和的量级
+    for lo in range(0, n - length + 1, _SUM_BLOCK):
+        hi = min(lo + _SUM_BLOCK, n - length + 1)
+        xs = x[lo:hi + length - 1]
+        ys = y[lo:hi + length - 1]
+        valid = ~(np.isnan(xs) | np.isnan(ys))
+        if not valid.any():
+            continue
+        dx = np.where(valid, xs - xs[valid][0], 0.0)
+        dy = np.where(valid, ys - ys[valid][0], 0.0)
+        sx = _window_sums(dx, length)
+        sy = _window_sums(dy, length)
+        dxx = _window_sums(dx * dx, length) - sx * sx / length
+        dxy = _window_sums(dx * dy, length) - sx * sy / length
+        dyy = _window_sums(dy * dy, length) - sy * sy / length
+
+        # 窗口内 x 全部相同时斜率和 R 方都为 NaN, y 全部相同时斜率为0, R 方为 NaN
+        ok = (missing[lo:hi] == 0) & (x_moves[lo:hi] != 0)
+        flat_y = y_moves[lo:hi] == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            b = np.where(flat_y, 0.0, dxy / dxx)
+            r = np.where(flat_y, np.nan, b * dxy / dyy)
+            r = np.where(r > 1 - 1e-12, 1.0, r)
+        beta[lo + length - 1:hi + length - 1] = np.where(ok, b, np.nan)
+        r2[lo + length - 1:hi + length - 1] = np.where(ok, r, np.nan)
+    return beta, r2
+
+def _window_sums(values, length):
+    """
+    沿第一维长度为 length 的滑动窗口之和, 整数和布尔值的结果是精确的
+    """
+    values = np.asarray(values)
+    cumulative = np.cumsum(values, axis=0, dtype=np.int64 if values.dtype.kind in 'bi' else np.float64)
+    sums = cumulative[length - 1:].copy()
+    sums[1:] -= cumulative[:-length]
+    return sums
+
+def _rolling_signed_var_numpy(values, length):
+    n = len(values)
+    var_p = np.full(values.shape, np.nan)
+    var_n = np.full(values.shape, np.nan)
+    if n < length:
+        return var_p, var_n
+
+    missing = _window_sums(np.isnan(values), length)
+    for lo in range(0, n - length + 1, _SUM_BLOCK):
+        hi = min(lo + _SUM_BLOCK, n - length + 1)
+        block = values[lo:hi + length - 1]
+        for result, mask in ((var_p, block > 0), (var_n, block < 0)):
+            # 减去块内同号值的均值再求和, 限制前缀和的量级
+            count = mask.sum(axis=0)
+            ref = np.where(mask, block, 0.0).sum(axis=0) / np.maximum(count, 1)
+            dev = np.where(mask, block - ref, 0.0)
+            count = _window_sums(mask, length)
+            total = _window_sums(dev, length)
+            square = _window_sums(dev * dev, length)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                var = np.maximum((square - total * total / count) / (count - 1), 0.0)
+            result[lo + length - 1:hi + length - 1] = np.where((missing[lo:hi] > 0) | (count < 2), np.nan, var)
+    return var_p, var_n
+
+def _rolling_moments_numpy(values, lengths, columns, block, missing, moves, mean, var):
+    n = len(values)
+    longest = int(lengths.max())
+    for lo in range(0, n, block):
+        hi = min(lo + block, n)
+        # 块内的输出需要的值从 lo - longest + 1 开始, 减去其中有效值的均值再求前缀和
+        start = max(lo - longest + 1, 0)
+        segment = values[start:hi]
+        valid = ~np.isnan(segment)
+        # 与 numba 实现一样按顺序求和, 两个后端的前缀和完全相同
+        count = valid.sum()
+        ref = np.cumsum(np.where(valid, segment, 0.0))[-1] / count if count else 0.0
+        dev = np.where(valid, segment - ref, 0.0)
+        total_sum = np.concatenate(([0.0], np.cumsum(dev)))
+        square_sum = np.concatenate(([0.0], np.cumsum(dev * dev)))
+
+        for j, length in zip(columns.tolist(), lengths.tolist()):
+            first = max(lo, length - 1)
+            if first >= hi:
+                continue
+            # 窗口 [e - length + 1, e] 的和为前缀和之差, e 为 first..hi-1
+            end = slice(first - start + 1, hi - start + 1)
+            begin = slice(first - start + 1 - length, hi - start + 1 - length)
+            total = total_sum[end] - total_sum[begin]
+            m = mean[first:hi, j]
+            v = var[first:hi, j]
+            np.add(total / length, ref, out=m)
+            if length > 1:
+                square = square_sum[end] - square_sum[begin]
+                total *= total
+                total /= length
+                np.subtract(square, total, out=square)
+                square /= length - 1
+                np.maximum(square, 0.0, out=v)
+
+            # 全部相同的窗口直接取原值和0, 有 NaN 的窗口为 NaN, 多数块中没有这两种窗口
+            flat = moves[first + 1:hi + 1] == moves[first + 2 - length:hi + 2 - length]
+            if flat.any():
+                m[flat] = values[first:hi][flat]
+                if length > 1:
+                    v[flat] = 0.0
+            bad = missing[first + 1:hi + 1] > missing[first + 1 - length:hi + 1 - length]
+            if bad.any():
+                m[bad] = np.nan
+                v[bad] = np.nan
+
+def _rolling_rank_last_numpy(values, length):
+    n = len(values)
+    ranks = np.full(n, np.nan)
+    if n < length:
+        return ranks
+    if length > _RANK_BISECT:
+        return _rolling_rank_last_bisect(values, length)
+
+    for out, window in _windows(values, length):
+        last = window[:, -1:]
+        less = (window < last).sum(axis=1)
+        equal = (window == last).sum(axis=1)
+        has_nan = np.isnan(window).any(axis=1)
+        ranks[out:out + len(window)] = np.where(has_nan, np.nan, (less + (equal + 1) / 2) / length)
+    return ranks
+
+def _rolling_rank_last_bisect(values, length):
+    """
+    窗口较长时逐个比较的代价随窗口长度增长, 改为维护有序列表, 每步用 bisect 删除移出的值并插入新值
+    """
+    n = len(values)
+    ranks = np.full(n, np.nan)
+    items = values.tolist()
+    ordered = []
+    missing = 0
+    for i, last in enumerate(items):
+        if i >= length:
+            old = items[i - length]
+            if old != old:
+                missing -= 1
+            else:
+                del ordered[bisect.bisect_left(ordered, old)]
+
+        if last != last:
+            missing += 1
+            continue
+        bisect.insort(ordered, last)
+        if i >= length - 1 and missing == 0:
+            less = bisect.bisect_left(ordered, last)
+            equal = bisect.bisect_right(ordered, last) - less
+            ranks[i] = (less + (equal + 1) / 2) / length
+    return ranks
+
+def _resample_metrics_numpy(pnl, indices):
+    n = indices.shape[1]
+    values = np.take(pnl, indices)
+    cumulative = np.cumsum(values, axis=1)
+    total = cumulative[:, -1].copy()
+    # 最大回撤: 累计盈亏的历史最高点减去当前累计盈亏
+    drawdown = np.maximum.accumulate(cumulative, axis=1)
+    np.subtract(drawdown, cumulative, out=drawdown)
+    max_drawdown = drawdown.max(axis=1)
+
+    shift = pnl.mean()
+    np.subtract(values, shift, out=values)
+    squares = np.einsum('ij,ij->i', values, values)
+    deviation = total - n * shift
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (squares - deviation * deviation / n) / (n - 1)
+    return total, max_drawdown, variance
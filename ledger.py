@@ -0,0 +1,297 @@
+# 本模块定义回测使用的列式交易账单
+import json
+import numpy as np
+import pandas as pd
+
+# 仓位方向和平仓原因在账单中以整数编码保存
+DIRS = ['long', 'short']
+EXIT_TYPES = ['signal', 'stop_loss', 'take_profit', 'trailing_stop', 'limit', 'end']
+
+_FLOAT_COLUMNS = ['open_price', 'close_price', 'amount', 'pnl', 'open_fee', 'close_fee', 'balance']
+
+class Ledger():
+    """
+    列式交易账单。每个字段保存在一个按需倍增扩容的 NumPy 数组中, 追加记录的均摊成本为 O(1)。
+    - to_frame() 把浮点列作为一个数据块整体复制构建 DataFrame, 不再逐条复制字典; copy=False 时使用只读视图
+    - 迭代或下标访问时返回与原来 pos_history 相同结构的字典, 兼容旧的使用方式
+    - with_time_offset() 调整时区时只记录偏移量, 与原账单共享数组
+    - amount 为最后一次平仓的数量(没有分批平仓时即开仓数量), 与平仓方式无关
+    - equity: 开启 record_equity 时的净值曲线 DataFrame
+    - profile: 开启 profile 时的 BacktestProfiler
+    """
+    def __init__(self, capacity=64):
+        self._size = 0
+        self._capacity = max(int(capacity), 1)
+        self._open_date = np.zeros(self._capacity, dtype=np.int64)
+        self._close_date = np.zeros(self._capacity, dtype=np.int64)
+        self._dir = np.zeros(self._capacity, dtype=np.int8)
+        self._exit_type = np.zeros(self._capacity, dtype=np.int8)
+        self._symbol = np.zeros(self._capacity, dtype=np.int32)
+        # 浮点字段放在同一个二维数组中, 每个字段一行, 转为 DataFrame 时可以整体作为一个数据块
+        self._floats = np.zeros((len(_FLOAT_COLUMNS), self._capacity), dtype=np.float64)
+
+        # symbol 编码表, 只有带 symbol 的记录才会输出 symbol 列
+        self.symbols = []
+        self._has_symbol = False
+        # 时间字段的时区和偏移(纳秒)
+        self.tz = None
+        self.time_offset = 0
+        self.equity = None
+        self.profile = None
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError('Ledger index out of range')
+
+        record = {
+            'open_date': self._to_timestamp(self._open_date[i]),
+            'close_date': self._to_timestamp(self._close_date[i]),
+            'dir': DIRS[self._dir[i]],
+        }
+        for k, column in enumerate(_FLOAT_COLUMNS):
+            record[column] = self._floats[k, i]
+        record['exit_type'] = EXIT_TYPES[self._exit_type[i]]
+        if self._has_symbol:
+            record['symbol'] = self.symbols[self._symbol[i]]
+        return record
+
+    def __repr__(self):
+        return f'Ledger({self._size} trades)'
+
+    def append(self, open_date, close_date, dir, open_price, close_price, amount, pnl, open_fee, close_fee, balance, exit_type='signal', symbol=None):
+        """
+        追加一条交易记录
+        """
+        if self._size == self._capacity:
+            self._grow(self._capacity * 2)
+
+        i = self._size
+        if self.tz is None:
+            self.tz = getattr(open_date, 'tz', None)
+        self._open_date[i] = pd.Timestamp(open_date).value
+        self._close_date[i] = pd.Timestamp(close_date).value
+        self._dir[i] = DIRS.index(dir)
+        self._exit_type[i] = EXIT_TYPES.index(exit_type)
+        if symbol is not None:
+            self._has_symbol = True
+            self._symbol[i] = self._symbol_code(symbol)
+
+        self._floats[:, i] = (open_price, close_price, amount, pnl, open_fee, close_fee, balance)
+        self._size += 1
+
+    def column(self, name):
+        """
+        返回某一列的数组视图, 时间列返回 DatetimeIndex
+        """
+        n = self._size
+        if name == 'open_date':
+            return self._to_datetime(self._open_date[:n])
+        if name == 'close_date':
+            return self._to_datetime(self._close_date[:n])
+        if name == 'dir':
+            return np.asarray(DIRS, dtype=object)[self._dir[:n]]
+        if name == 'exit_type':
+            return np.asarray(EXIT_TYPES, dtype=object)[self._exit_type[:n]]
+        if name == 'symbol':
+            return np.asarray(self.symbols, dtype=object)[self._symbol[:n]]
+        return self._floats[_FLOAT_COLUMNS.index(name), :n]
+
+    @property
+    def columns(self):
+        columns = ['open_date', 'close_date', 'dir'] + _FLOAT_COLUMNS + ['exit_type']
+        if self._has_symbol:
+            columns.append('symbol')
+        return columns
+
+    def to_frame(self, copy=True):
+        """
+        转换为 DataFrame, 修改返回的 DataFrame 不会影响账单。
+        copy=False 时浮点列整体直接使用账单数组的只读视图, 不复制数据, 对这些列原地赋值会抛出 ValueError
+        """
+        floats = self._floats[:, :self._size]
+        if copy:
+            floats = floats.copy()
+        else:
+            floats = floats.view()
+            floats.flags.writeable = False
+        df = pd.DataFrame(floats.T, columns=_FLOAT_COLUMNS, copy=False)
+        df.insert(0, 'dir', self.column('dir'))
+        df.insert(0, 'close_date', self.column('close_date'))
+        df.insert(0, 'open_date', self.column('open_date'))
+        df['exit_type'] = self.column('exit_type')
+        if self._has_symbol:
+            df['symbol'] = self.column('symbol')
+        return df
+
+    def to_arrow(self):
+        """
+        转换为 pyarrow.Table, 需要安装 pyarrow
+        """
+        import pyarrow as pa
+        return pa.Table.from_pandas(self.to_frame(copy=False), preserve_index=False)
+
+    def save(self, path):
+        """
+        按列保存为 .npz 文件, 净值曲线一并保存
+        """
+        n = self._size
+        meta = {'symbols': self.symbols, 'has_symbol': self._has_symbol, 'tz': str(self.tz) if self.tz is not None else None, 'time_offset': self.time_offset}
+        arrays = {
+            'open_date': self._open_date[:n],
+            'close_date': self._close_date[:n],
+            'dir': self._dir[:n],
+            'exit_type': self._exit_type[:n],
+            'symbol': self._symbol[:n],
+            'floats': self._floats[:, :n]
+        }
+        if self.equity is not None:
+            meta['equity_columns'] = list(self.equity.columns)
+            meta['equity_tz'] = str(self.equity.index.tz) if self.equity.index.tz is not None else None
+            meta['equity_index_name'] = self.equity.index.name
+            arrays['equity_index'] = self.equity.index.asi8
+            arrays['equity_values'] = self.equity.to_numpy().T
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        读取 save 保存的账单
+        """
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            n = len(arrays['open_date'])
+            ledger = cls(n)
+            ledger._size = n
+            ledger._open_date[:n] = arrays['open_date']
+            ledger._close_date[:n] = arrays['close_date']
+            ledger._dir[:n] = arrays['dir']
+            ledger._exit_type[:n] = arrays['exit_type']
+            ledger._symbol[:n] = arrays['symbol']
+            ledger._floats[:, :n] = arrays['floats']
+            ledger.symbols = meta['symbols']
+            ledger._has_symbol = meta['has_symbol']
+            ledger.tz = meta['tz']
+            ledger.time_offset = meta['time_offset']
+            if 'equity_index' in arrays:
+                index = pd.DatetimeIndex(arrays['equity_index'].view('datetime64[ns]'), name=meta['equity_index_name'])
+                if meta['equity_tz'] is not None:
+                    index = index.tz_localize('UTC').tz_convert(meta['equity_tz'])
+                values = arrays['equity_values']
+                ledger.equity = pd.DataFrame({column: values[k] for k, column in enumerate(meta['equity_columns'])}, index=index)
+        return ledger
+
+    def with_time_offset(self, hours):
+        """
+        返回时间字段整体偏移 hours 小时的账单视图, 与原账单共享数组
+        """
+        view = self._view()
+        view.time_offset = self.time_offset + int(hours * 3600 * 1e9)
+        if self.equity is not None:
+            view.equity = self.equity.copy(deep=False)
+            view.equity.index = self.equity.index + pd.Timedelta(hours=hours)
+        return view
+
+    def take(self, indices):
+        """
+        按位置取出若干条记录, 返回新的账单
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        ledger = Ledger(len(indices))
+        ledger._size = len(indices)
+        ledger._open_date[:len(indices)] = self._open_date[indices]
+        ledger._close_date[:len(indices)] = self._close_date[indices]
+        ledger._dir[:len(indices)] = self._dir[indices]
+        ledger._exit_type[:len(indices)] = self._exit_type[indices]
+        ledger._symbol[:len(indices)] = self._symbol[indices]
+        ledger._floats[:, :len(indices)] = self._floats[:, indices]
+        ledger.symbols = list(self.symbols)
+        ledger._has_symbol = self._has_symbol
+        ledger.tz = self.tz
+        ledger.time_offset = self.time_offset
+        return ledger
+
+    @classmethod
+    def concat(cls, ledgers, sort_by=None):
+        """
+        合并多个账单, sort_by 可以指定按某个时间列稳定排序, e.g 'close_date'
+        """
+        ledgers = [ledger for ledger in ledgers if ledger is not None]
+        total = sum(len(ledger) for ledger in ledgers)
+        merged = cls(total)
+        for ledger in ledgers:
+            if merged.tz is None:
+                merged.tz = ledger.tz
+            merged.time_offset = ledger.time_offset
+            n = len(ledger)
+            start = merged._size
+            stop = start + n
+            merged._open_date[start:stop] = ledger._open_date[:n]
+            merged._close_date[start:stop] = ledger._close_date[:n]
+            merged._dir[start:stop] = ledger._dir[:n]
+            merged._exit_type[start:stop] = ledger._exit_type[:n]
+            if ledger._has_symbol:
+                merged._has_symbol = True
+                codes = np.array([merged._symbol_code(symbol) for symbol in ledger.symbols], dtype=np.int32)
+                if len(codes):
+                    merged._symbol[start:stop] = codes[ledger._symbol[:n]]
+            merged._floats[:, start:stop] = ledger._floats[:, :n]
+            merged._size = stop
+
+        if sort_by is not None and total > 0:
+            keys = merged._open_date if sort_by == 'open_date' else merged._close_date
+            merged = merged.take(np.argsort(keys[:total], kind='stable'))
+        return merged
+
+    def _view(self):
+        view = Ledger.__new__(Ledger)
+        view.__dict__.update(self.__dict__)
+        return view
+
+    def _grow(self, capacity):
+        self._open_date = np.resize(self._open_date, capacity)
+        self._close_date = np.resize(self._close_date, capacity)
+        self._dir = np.resize(self._dir, capacity)
+        self._exit_type = np.resize(self._exit_type, capacity)
+        self._symbol = np.resize(self._symbol, capacity)
+        floats = np.zeros((len(_FLOAT_COLUMNS), capacity), dtype=np.float64)
+        floats[:, :self._size] = self._floats[:, :self._size]
+        self._floats = floats
+        self._capacity = capacity
+
+    def _symbol_code(self, symbol):
+        try:
+            return self.symbols.index(symbol)
+        except ValueError:
+            self.symbols.append(symbol)
+            return len(self.symbols) - 1
+
+    def _to_timestamp(self, value):
+        return pd.Timestamp(int(value) + self.time_offset, tz='UTC').tz_convert(self.tz) if self.tz is not None else pd.Timestamp(int(value) + self.time_offset)
+
+    def _to_datetime(self, values):
+        if self.time_offset:
+            values = values + self.time_offset
+        dates = pd.DatetimeIndex(values.view('datetime64[ns]'))
+        if self.tz is not None:
+            dates = dates.tz_localize('UTC').tz_convert(self.tz)
+        return dates
+
+def to_frame(history):
+    """
+    把回测结果统一转换为 DataFrame, 支持 Ledger 和旧的字典列表
+    """
+    if isinstance(history, Ledger):
+        return history.to_frame()
+    return pd.DataFrame(history)
@@ -1,54 +1,71 @@
 # 本文件用于定义一些通用类
 from abc import ABC
 from pandas import Timestamp
+import numpy as np
 import pandas as pd
 
 class Strategy(ABC):
-    def __init__(self, total_balance, trading_fee_ratio, slippage_ratio, data=None, indicators=None):
+    # 持仓期间是否仍然每分钟调用run
+    # 设为False时, 挂有止盈止损的仓位由引擎托管, 回测会直接跳到触发止盈止损的那根K线
+    run_in_position = True
+    # 没有持仓且有挂单时是否仍然每分钟调用run
+    # 设为False时, 回测会直接跳到下一个挂单成交或失效的K线
+    run_with_orders = True
+    # 实现了run_batch时每次交给策略的K线数量
+    batch_size = 1024
+
+    def __init__(self, total_balance, trading_fee_ratio, slippage_ratio, data=None, indicators=None, timeframes=None):
         self.total_balance = total_balance
         self.trading_fee_ratio = trading_fee_ratio
         self.slippage_ratio = slippage_ratio
         self.data = data
         self.indicators = indicators
+        # 多周期对齐索引(MultiTimeframe), 多symbol时为 symbol -> MultiTimeframe 的字典
+        self.timeframes = timeframes
 
     def get_recent_data(self, date, periods, data=None, indicators=None, symbol=None):
         """
         获取最近的 N 条数据和指标。
         如果传入的 data 和 indicators 是 dict则按 symbol 处理；
         如果传入的是 DataFrame则直接处理。
+        第一次调用时把数据和指标拼接好并缓存在策略上, 之后每次只需定位时间并切片,
+        返回的是缓存的切片, 缓存的数组是只读的, 原地修改返回的窗口(e.g window.iloc[-1, 0] = 0)会抛出 ValueError,
+        需要修改时先 copy()。data 或 indicators 被替换或行列数变化时重新拼接。
         """
         if not isinstance(date, Timestamp):
             date = Timestamp(date)
 
+        data = self.data if data is None else data
+        indicators = self.indicators if indicators is None else indicators
+
         # 如果传入的数据是 dict，按照 symbol 获取数据
-        if isinstance(data, dict) and isinstance(indicators, dict):
+        if isinstance(data, dict) or isinstance(indicators, dict):
             if symbol is None:
                 raise ValueError("Symbol must be provided for multi-symbol data.")
-            
-            # 获取指定 symbol 的数据和指标
-            data = self.data[symbol] if data is None else data[symbol]
-            indicators = self.indicators[symbol] if indicators is None else indicators[symbol]
-        else:
-            # 如果不是 dict，直接使用传入的 DataFrame
-            data = self.data if data is None else data
-            indicators = self.indicators if indicators is None else indicators
 
-        # 找到最近的 N 条数据的位置
-        recent_data_idx = data.index[data.index <= date][-periods:]
-        recent_indicators_idx = indicators.index[indicators.index <= date][-periods:]
-
-        # 获取最近的 N 条数据和指标
-        recent_data = data.loc[recent_data_idx]
-        recent_indicators = indicators.loc[recent_indicators_idx]
+            # 获取指定 symbol 的数据和指标
+            data = data[symbol] if isinstance(data, dict) else data
+            indicators = indicators[symbol] if isinstance(indicators, dict) else indicators
 
-        # 移除重复的close列
-        if 'close' in recent_indicators.columns:
-            recent_indicators = recent_indicators.drop(columns=['close'])
+        # 每个 symbol 只保留最近使用的一份拼接结果
+        windows = self.__dict__.setdefault('_recent_windows', {})
+        window = windows.get(symbol)
+        if window is None or not window.matches(data, indicators):
+            window = windows[symbol] = _RecentWindow(data, indicators)
 
-        # 合并数据和指标
-        recent_combined = pd.concat([recent_data, recent_indicators], axis=1, join='inner')
+        return window.get(date, periods)
 
-        return recent_combined
+    def get_timeframe_data(self, date, periods, timeframe, symbol=None):
+        """
+        获取 date 时最近 N 根已经收盘的粗周期K线(数据或指标), 需要先在 self.timeframes 上注册该周期。
+        与用 get_recent_data 查询粗周期的数据不同, 不会看到 date 时还没有收盘的K线。
+        """
+        timeframes = self.timeframes
+        if isinstance(timeframes, dict):
+            if symbol is None:
+                raise ValueError("Symbol must be provided for multi-symbol data.")
+            timeframes = timeframes[symbol]
+        return timeframes.recent(timeframe, date, periods)
 
     def run(self, date, price_row, current_pos, current_balance, symbol):
         # run方法每次接收一行1min级别数据用作驱动
@@ -60,13 +77,61 @@ class Strategy(ABC):
         # 如果返回None，则不做任何操作
         pass
 
+    def run_batch(self, block, current_pos, current_balance, symbol):
+        # 批量回调, 策略重写此方法后回测引擎不再逐分钟调用run
+        # block是最多batch_size根连续1min K线的字典: 'date'为DatetimeIndex, open/high/low/close/volume
+        # 以及self.indicators中按时间对齐到每根K线的指标列, 都是NumPy数组
+        # 段内不会发生止盈止损或挂单成交, current_pos和current_balance在整段内不变
+        # 返回(k, signal)表示在段内第k根K线发出信号, 引擎处理后从第k+1根K线继续; 整段都不操作时返回None
+        # 第k根K线的判断只能使用前k根K线的数据, 否则会引入未来数据
+        return None
+
+    def run_portfolio(self, date, bars, positions, current_balance):
+        # 组合回测(backtest(..., portfolio=True))时每个时间点调用一次
+        # bars是该时间点所有symbol的K线, index为symbol, 列为open/high/low/close/volume, 该分钟没有数据的symbol为NaN
+        # positions是 symbol -> Position 的字典, current_balance是组合共享的余额
+        # 返回 symbol -> Signal 的字典, 没有信号就返回None
+        pass
+
+    def on_order_filled(self, date, signal, current_pos, current_balance, symbol):
+        # 限价挂单成交时的回调, signal即为当初挂单时返回的信号
+        # 成交在该分钟的run之前处理, 默认不做任何操作
+        pass
+
+    def get_state(self):
+        # 回测保存断点时调用, 返回策略需要保存的状态, 必须可以被pickle
+        # 默认保存除了data, indicators, timeframes(以及get_recent_data的缓存)以外的所有属性, 有不能pickle的属性时请重写
+        return {
+            key: value for key, value in self.__dict__.items()
+            if key not in ('data', 'indicators', 'timeframes', '_recent_windows') and not (callable(value) and hasattr(type(self), key))
+        }
+
+    def set_state(self, state):
+        # 从断点恢复时调用, state为get_state返回的内容
+        self.__dict__.update(state)
+
 class Signal():
-    def __init__(self, dir, price, amount):
-        self.dir = dir # long/short/None
+    __slots__ = ('dir', 'price', 'amount', 'stop_loss', 'take_profit', 'trailing_stop', 'order_type', 'expire')
+
+    def __init__(self, dir, price, amount, stop_loss=None, take_profit=None, trailing_stop=None, order_type='market', expire=None):
+        self.dir = dir # long/short/close/cancel
         self.price = price
         self.amount = amount
+        # market: 按price立即成交; limit: 以price作为限价挂单, 等待后续K线触及后成交
+        self.order_type = order_type
+        # 限价单有效期, 可以是K线数量(int), 时间长度('4h', pd.Timedelta)或到期时间(pd.Timestamp), None表示一直有效
+        self.expire = expire
+        # 以下为引擎托管的止盈止损参数, 只对开仓信号生效
+        self.stop_loss = stop_loss # 止损价
+        self.take_profit = take_profit # 止盈价
+        self.trailing_stop = trailing_stop # 移动止损回撤比例, e.g 0.02 => 从最高(低)点回撤2%平仓
 
 class Position():
+    __slots__ = (
+        'symbol', 'open_price', 'close_price', 'dir', 'amount', 'pnl', 'float_profit', 'open_date', 'close_date',
+        'trade_cost', 'close_trade_cost', 'stop_loss', 'take_profit', 'trailing_stop', 'extreme_price'
+    )
+
     def __init__(self, symbol):
         self.symbol = symbol
         self.open_price = 0 # 开仓价
@@ -78,6 +143,24 @@ class Position():
         self.open_date = None
         self.close_date = None
         self.trade_cost = 0 # 手续费和滑点
+        self.close_trade_cost = 0 # 平仓手续费和滑点
+        self.stop_loss = None # 止损价
+        self.take_profit = None # 止盈价
+        self.trailing_stop = None # 移动止损回撤比例
+        self.extreme_price = None # 持仓期间的最高价(多)/最低价(空), 用于移动止损
+
+    def has_exit_orders(self):
+        # 是否挂有引擎托管的止盈止损
+        return self.stop_loss is not None or self.take_profit is not None or self.trailing_stop is not None
+
+    def set_exit_orders(self, stop_loss=None, take_profit=None, trailing_stop=None):
+        # 设置止盈止损参数, 传入None的参数保持原值不变
+        if stop_loss is not None:
+            self.stop_loss = stop_loss
+        if take_profit is not None:
+            self.take_profit = take_profit
+        if trailing_stop is not None:
+            self.trailing_stop = trailing_stop
 
     def update_float_profit(self, current_price):
         # 根据当前价格更新浮动盈亏
@@ -125,4 +208,96 @@ class Position():
         # 如果当前仓位为0，则确认完全平仓
         if self.amount == 0:
             self.close_date = current_date
-            self.close_price = current_price
\ No newline at end of file
+            self.close_price = current_price
+
+def _read_only(frame):
+    """
+    用复制出并设为只读的数组重新构造 DataFrame(copy=False 时直接使用这些数组), 对它的切片原地修改时报错,
+    不会改掉之后每次查询的结果。所有列类型相同时为一个二维数组, 切片时不必逐列处理
+    """
+    dtypes = set(frame.dtypes)
+    if len(dtypes) == 1 and isinstance(next(iter(dtypes)), np.dtype):
+        values = frame.to_numpy(copy=True)
+        values.flags.writeable = False
+        return pd.DataFrame(values, index=frame.index, columns=frame.columns, copy=False)
+
+    columns = {}
+    for j, dtype in enumerate(frame.dtypes):
+        # 扩展类型(e.g 带时区的时间)的列不是 NumPy 数组, 保持原样
+        values = frame.iloc[:, j].to_numpy(copy=True) if isinstance(dtype, np.dtype) else frame.iloc[:, j].copy()
+        if isinstance(values, np.ndarray):
+            values.flags.writeable = False
+        columns[j] = values
+    result = pd.DataFrame(columns, index=frame.index, copy=False)
+    result.columns = frame.columns
+    return result
+
+class _RecentWindow():
+    """
+    get_recent_data 使用的缓存。
+    data 和 indicators 的时间索引相同(指标由 data 计算得到的常见情况)时, 预先把两者拼接成一个 DataFrame,
+    并记录上一次查询的位置。回测逐根K线查询, 查询时间一般就是上一次位置的下一根K线, 不是时再二分查找。
+    时间索引不同时分别二分查找截取最近的 N 条再按时间取交集, 结果与逐条比较筛选相同。
+    """
+    def __init__(self, data, indicators):
+        self.data = data
+        self.indicators = indicators
+        self.shapes = (data.shape, indicators.shape)
+
+        # 移除重复的close列
+        if 'close' in indicators.columns:
+            indicators = indicators.drop(columns=['close'])
+        self.extra = indicators
+
+        self.aligned = data.index.equals(indicators.index)
+        if self.aligned:
+            self.frame = _read_only(pd.concat([data, indicators], axis=1))
+            self.index = self.frame.index
+            # 纳秒时间戳, 用于和游标位置的K线时间快速比较
+            unique = isinstance(self.index, pd.DatetimeIndex) and self.index.is_unique
+            self.keys = self.index.as_unit('ns').asi8 if unique else None
+            self.tz_aware = unique and self.index.tz is not None
+        self.sorted = data.index.is_monotonic_increasing and indicators.index.is_monotonic_increasing
+        self.stop = 0
+
+    def matches(self, data, indicators):
+        return data is self.data and indicators is self.indicators and (data.shape, indicators.shape) == self.shapes
+
+    def get(self, date, periods):
+        if not self.sorted:
+            return self._filter(date, periods)
+        if not self.aligned:
+            data_stop = self.data.index.searchsorted(date, side='right')
+            extra_stop = self.extra.index.searchsorted(date, side='right')
+            return pd.concat([
+                self.data.iloc[_window_start(data_stop, periods):data_stop],
+                self.extra.iloc[_window_start(extra_stop, periods):extra_stop]
+            ], axis=1, join='inner')
+
+        stop = self._locate(date)
+        return self.frame.iloc[_window_start(stop, periods):stop]
+
+    def _locate(self, date):
+        """
+        时间不晚于 date 的K线数量
+        """
+        keys, stop = self.keys, self.stop
+        if keys is not None and (date.tz is not None) == self.tz_aware:
+            key = date.value
+            if stop < len(keys) and keys[stop] == key:
+                self.stop = stop + 1
+                return self.stop
+            if stop > 0 and keys[stop - 1] == key:
+                return stop
+        self.stop = int(self.index.searchsorted(date, side='right'))
+        return self.stop
+
+    def _filter(self, date, periods):
+        # 时间索引无序时逐条比较
+        recent_data = self.data.loc[self.data.index[self.data.index <= date][-periods:]]
+        recent_extra = self.extra.loc[self.extra.index[self.extra.index <= date][-periods:]]
+        return pd.concat([recent_data, recent_extra], axis=1, join='inner')
+
+def _window_start(stop, periods):
+    # 与 [-periods:] 的切片规则相同, periods 为0时取全部
+    return range(stop)[-periods:].start
@@ -0,0 +1,127 @@
+# 本模块提供回测结果的蒙特卡洛检验: 对交易重抽样, 得到总盈亏, 最大回撤和夏普比率的分布
+import numpy as np
+import pandas as pd
+
+from .ledger import Ledger, to_frame
+from . import kernels
+from .utils.magic import US_TREASURY_YIELD, DAYS_IN_ONE_YEAR, TRADING_DAYS_IN_ONE_YEAR
+
+_METHODS = ('bootstrap', 'block', 'shuffle')
+
+def monte_carlo(result, init_balance, n_sims=10000, method='bootstrap', block_size=None, percentiles=(5, 25, 50, 75, 95), risk_free_rate=US_TREASURY_YIELD, seed=None, combine=True, chunk_size=None):
+    """
+    对回测账单中的交易重抽样 n_sims 次, 每次得到一条新的交易序列并计算指标。
+    指标的算法与 evaluate_strategy 相同: 总盈亏, 按累计盈亏计算的最大回撤, 按每笔交易收益计算的夏普比率。
+
+    method:
+    - bootstrap: 有放回地抽取同样数量的交易
+    - block: 有放回地抽取连续的 block_size 笔交易(首尾相接), 保留相邻交易之间的相关性, block_size 默认为交易数的平方根
+    - shuffle: 只打乱交易顺序, 总盈亏和夏普比率不变, 用来检验最大回撤对交易顺序的敏感程度
+
+    参数:
+    - result: backtest 的结果, 单个账单或 symbol -> 账单 的字典
+    - init_balance: 初始资金
+    - n_sims: 重抽样次数
+    - percentiles: 需要输出的分位数
+    - seed: 随机种子
+    - combine: result 为字典时, True 表示把所有 symbol 的交易按平仓时间合并为一个序列, False 表示每个 symbol 分别检验
+    - chunk_size: 每批同时模拟的次数, 默认按每批约 50 万笔交易自动选择, 中间数组可以留在缓存中
+    计算由 kernels 模块完成, 安装了 numba 时每条路径的指标在一次循环中算完, shuffle 的随机排列也在编译后的循环中生成
+
+    返回:
+    - 字典: samples 为每次模拟的指标, percentiles 为各指标的分位数, actual 为原始交易序列的指标,
+      rank 为原始指标在模拟分布中的分位(0-1), prob_loss 为总盈亏小于0的比例。
+      combine=False 时返回 symbol -> 上述字典
+    """
+    if method not in _METHODS:
+        raise ValueError(f'Unknown method: {method}, expected one of {_METHODS}.')
+
+    if isinstance(result, dict) and not combine:
+        return {
+            symbol: monte_carlo(history, init_balance, n_sims, method, block_size, percentiles, risk_free_rate, seed, chunk_size=chunk_size)
+            for symbol, history in result.items()
+        }
+
+    pnl = _trade_pnl(result)
+    if len(pnl) == 0:
+        print('No trading result')
+        return
+
+    rng = np.random.default_rng(seed)
+    n = len(pnl)
+    if chunk_size is None:
+        chunk_size = max(1, 500000 // n)
+    if method == 'block':
+        block_size = int(block_size) if block_size else max(1, int(round(np.sqrt(n))))
+        block_size = min(block_size, n)
+
+    total_pnl = np.empty(n_sims)
+    max_drawdown = np.empty(n_sims)
+    variance = np.empty(n_sims)
+    for lo in range(0, n_sims, chunk_size):
+        hi = min(lo + chunk_size, n_sims)
+        if method == 'shuffle':
+            metrics = kernels.shuffle_metrics(pnl, hi - lo, int(rng.integers(2 ** 63)))
+        else:
+            metrics = kernels.resample_metrics(pnl, _resample_indices(rng, method, n, hi - lo, block_size))
+        total_pnl[lo:hi], max_drawdown[lo:hi], variance[lo:hi] = metrics
+    sharpe_ratio = _sharpe_ratio(total_pnl / n, variance, init_balance, risk_free_rate)
+
+    samples = pd.DataFrame({'total_pnl': total_pnl, 'max_drawdown': max_drawdown, 'sharpe_ratio': sharpe_ratio})
+    actual_pnl, actual_drawdown, actual_variance = kernels.resample_metrics(pnl, np.arange(n)[None, :])
+    actual = {
+        'total_pnl': float(actual_pnl[0]),
+        'max_drawdown': float(actual_drawdown[0]),
+        'sharpe_ratio': float(_sharpe_ratio(actual_pnl / n, actual_variance, init_balance, risk_free_rate)[0])
+    }
+    table = pd.DataFrame(
+        np.percentile(samples.to_numpy(), percentiles, axis=0).T,
+        index=samples.columns, columns=[f'p{q}' for q in percentiles]
+    )
+
+    return {
+        'samples': samples,
+        'percentiles': table,
+        'actual': actual,
+        'rank': {name: float((samples[name].to_numpy() <= value).mean()) for name, value in actual.items()},
+        'prob_loss': float((total_pnl < 0).mean()),
+        'method': method,
+        'trades': n
+    }
+
+def _trade_pnl(result):
+    """
+    按平仓时间排序的每笔交易盈亏
+    """
+    if isinstance(result, dict):
+        histories = [history for history in result.values() if history is not None and len(history)]
+        if all(isinstance(history, Ledger) for history in histories):
+            return Ledger.concat(histories, sort_by='close_date').column('pnl').astype(float)
+        df = pd.concat([to_frame(history) for history in histories]).sort_values('close_date', kind='stable')
+        return df['pnl'].to_numpy(dtype=float)
+    if isinstance(result, Ledger):
+        return result.column('pnl').astype(float)
+    df = to_frame(result)
+    return df['pnl'].to_numpy(dtype=float) if 'pnl' in df.columns else np.array([])
+
+def _resample_indices(rng, method, n, sims, block_size):
+    """
+    生成形状为 (sims, n) 的交易下标
+    """
+    if method == 'bootstrap':
+        return rng.integers(0, n, size=(sims, n), dtype=np.int32)
+
+    # 块自举: 随机选择每块的起点, 块内下标连续, 超出末尾时从头接上
+    blocks = -(-n // block_size)
+    starts = rng.integers(0, n, size=(sims, blocks, 1), dtype=np.int32)
+    indices = (starts + np.arange(block_size, dtype=np.int32)).reshape(sims, blocks * block_size)[:, :n]
+    return indices % n
+
+def _sharpe_ratio(mean_pnl, variance, init_balance, risk_free_rate):
+    """
+    与 _calculate_sharpe_ratio 相同, 每笔交易的收益为 pnl / init_balance, 减去无风险日收益后计算
+    """
+    mean = mean_pnl / init_balance - risk_free_rate / DAYS_IN_ONE_YEAR
+    std = np.sqrt(np.maximum(variance, 0)) / init_balance
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(std != 0, mean / std * np.sqrt(TRADING_DAYS_IN_ONE_YEAR), 0.0)
@@ -0,0 +1,333 @@
+# 本模块提供参数优化和样本外验证工具
+import time
+import itertools
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+
+from .data import get_klines
+from .ledger import Ledger
+from .backtest import _single_symbol_engine, evaluate_strategy
+from .utils.cpu import get_available_cpu_count
+from .utils.magic import TIMEZONE
+
+def walk_forward(symbol, start, end, strategy_cls, param_grid, train_period, test_period, init_balance, trading_fee_ratio, slippage_ratio, strategy_kwargs=None, anchored=False, objective='sharpe_ratio', maximize=True, processes=None, proxy='http://127.0.0.1:7890/'):
+    """
+    滚动(walk-forward)优化。
+    把 [start, end] 切分为若干个训练/测试窗口, 在每个训练窗口上用 evaluate_strategy 的指标挑选最优参数,
+    再用该参数回测紧随其后的测试窗口, 最后把所有测试窗口的账单拼接为样本外结果。
+    1min数据只加载一次, 各窗口在多个进程中并行运行, 使用同一份数据的切片。
+
+    参数:
+    - symbol: string, 交易对名称, 目前只支持单个 symbol
+    - start, end: string, 起止日期 format: YYYY-MM-DDTHH-MM-SSZ
+    - strategy_cls: 策略类, 按 strategy_cls(init_balance, trading_fee_ratio, slippage_ratio, **strategy_kwargs, **params) 构造
+    - param_grid: dict, 参数名 -> 候选值列表, 按笛卡尔积展开; 也可以直接传入参数字典的列表
+    - train_period, test_period: 训练/测试窗口长度, e.g '30d', pd.Timedelta
+    - init_balance: 初始资金, 每个窗口都以该资金开始回测
+    - strategy_kwargs: dict, 所有参数组合共用的构造参数, e.g data, indicators
+    - anchored: bool, True 时训练窗口的起点固定为 start(扩张窗口), False 时为滚动窗口
+    - objective: evaluate_strategy 返回的指标名, 或者接收指标字典返回分数的函数
+    - maximize: bool, 分数越大越好时为 True
+    - processes: 并行进程数, 默认为当前可用的 CPU 数量
+
+    返回:
+    - 字典: ledger 为拼接后的样本外账单(balance 按之前窗口的盈亏连续平移), folds 为每个窗口的参数和得分,
+      evaluation 为样本外账单的 evaluate_strategy 结果
+    """
+    if not isinstance(symbol, str):
+        raise ValueError('walk_forward only supports a single symbol.')
+
+    ticker_data = get_klines(symbol, start, end, '1m', proxy=proxy)
+    folds = _walk_forward_windows(ticker_data.index, start, end, train_period, test_period, anchored)
+    if not folds:
+        raise ValueError('The range is too short for a single train/test window.')
+
+    config = {
+        'symbol': symbol,
+        'strategy_cls': strategy_cls,
+        'strategy_kwargs': strategy_kwargs or {},
+        'params_list': _expand_grid(param_grid),
+        'init_balance': init_balance,
+        'trading_fee_ratio': trading_fee_ratio,
+        'slippage_ratio': slippage_ratio,
+        'objective': objective,
+        'maximize': maximize
+    }
+    fold_results = _map_shared(_run_fold, folds, ticker_data, config, processes)
+
+    # 拼接样本外账单, 每个测试窗口的 balance 接着上一个窗口的结束余额
+    ledger = Ledger.concat([fold['test_ledger'] for fold in fold_results])
+    balance = ledger.column('balance')
+    offset = 0.0
+    position = 0
+    for fold in fold_results:
+        n = len(fold['test_ledger']) if fold['test_ledger'] is not None else 0
+        if n:
+            balance[position:position + n] += offset
+            offset = balance[position + n - 1] - init_balance
+            position += n
+
+    report = pd.DataFrame([{key: value for key, value in fold.items() if key != 'test_ledger'} for fold in fold_results])
+
+    return {
+        'ledger': ledger,
+        'folds': report,
+        'evaluation': evaluate_strategy(ledger, init_balance) if len(ledger) else None
+    }
+
+def successive_halving(symbol, start, end, strategy_cls, param_grid, init_balance, trading_fee_ratio, slippage_ratio, strategy_kwargs=None, min_period='7d', eta=3, n_configs=None, budget_bars=None, budget_seconds=None, objective='sharpe_ratio', maximize=True, processes=None, seed=None, proxy='http://127.0.0.1:7890/'):
+    """
+    逐级减半(successive halving)参数搜索。
+    先在 [start, start + min_period) 的短区间上回测所有参数组合, 保留得分最高的 1/eta 进入下一轮,
+    下一轮的区间长度乘以 eta, 直到最后一轮使用完整的 [start, end]。
+    1min数据只加载一次, 所有轮次共用同一个进程池和同一份数据。
+
+    参数:
+    - symbol, start, end, strategy_cls, param_grid, init_balance, trading_fee_ratio, slippage_ratio, strategy_kwargs,
+      objective, maximize, processes: 与 walk_forward 相同
+    - min_period: 第一轮的区间长度, e.g '7d'
+    - eta: 每轮保留 1/eta 的参数组合, 区间长度乘以 eta
+    - n_configs: 参数组合太多时随机抽取 n_configs 个, seed 为随机种子
+    - budget_bars: 回测K线总数(参数组合数 x 区间K线数)的预算, 预算不足时只评估排名靠前的组合并停止
+    - budget_seconds: 墙钟时间预算, 超时后不再提交新的回测
+
+    返回:
+    - 字典: leaderboard 为所有参数组合到达的轮次和得分(按轮次和得分排序), best_params 为最优参数,
+      bars_evaluated 为回测的K线总数, elapsed 为耗时, stopped 为提前停止的原因
+    """
+    if not isinstance(symbol, str):
+        raise ValueError('successive_halving only supports a single symbol.')
+
+    ticker_data = get_klines(symbol, start, end, '1m', proxy=proxy)
+    params_list = _expand_grid(param_grid)
+    if n_configs is not None and n_configs < len(params_list):
+        rng = np.random.default_rng(seed)
+        params_list = [params_list[k] for k in sorted(rng.choice(len(params_list), n_configs, replace=False))]
+
+    config = {
+        'symbol': symbol,
+        'strategy_cls': strategy_cls,
+        'strategy_kwargs': strategy_kwargs or {},
+        'init_balance': init_balance,
+        'trading_fee_ratio': trading_fee_ratio,
+        'slippage_ratio': slippage_ratio,
+        'objective': objective,
+        'maximize': maximize
+    }
+    records = [{'params': params, 'rung': -1, 'bars': 0, 'score': np.nan, 'total_pnl': np.nan, 'total_trades': 0} for params in params_list]
+
+    started = time.perf_counter()
+    bars_evaluated = 0
+    stopped = None
+    alive = list(range(len(params_list)))
+    rungs = _halving_rungs(ticker_data.index, start, min_period, eta)
+    with _shared_pool(ticker_data, config, processes) as (executor, workers):
+        for rung, (lo, hi) in enumerate(rungs):
+            if budget_bars is not None and bars_evaluated + len(alive) * (hi - lo) > budget_bars:
+                # 预算不够完整跑完这一轮, 只评估上一轮排名靠前的组合
+                alive = alive[:(budget_bars - bars_evaluated) // max(hi - lo, 1)]
+                stopped = 'budget_bars'
+            if not alive:
+                break
+
+            # 同时运行的回测不超过进程数, 超过时间预算后不再提交新的回测
+            scores = {}
+            queue = list(alive)
+            running = {}
+            while queue or running:
+                while queue and len(running) < workers and stopped != 'budget_seconds':
+                    k = queue.pop(0)
+                    running[executor.submit(_run_config, (params_list[k], lo, hi))] = k
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scores[running.pop(future)] = future.result()
+                if budget_seconds is not None and time.perf_counter() - started > budget_seconds:
+                    stopped = 'budget_seconds'
+
+            for k, (score, total_pnl, total_trades) in scores.items():
+                records[k].update(rung=rung, bars=hi - lo, score=score if maximize else -score, total_pnl=total_pnl, total_trades=total_trades)
+            bars_evaluated += len(scores) * (hi - lo)
+
+            ranked = sorted(scores, key=lambda k: scores[k][0], reverse=True)
+            alive = ranked[:max(1, len(ranked) // eta)]
+            if stopped is not None:
+                break
+
+    leaderboard = pd.DataFrame(records)
+    leaderboard = pd.concat([leaderboard, pd.DataFrame(params_list, index=leaderboard.index)], axis=1)
+    order = np.lexsort((-np.nan_to_num(leaderboard['score'].to_numpy(dtype=float) * (1 if maximize else -1), nan=-np.inf), -leaderboard['rung'].to_numpy()))
+    leaderboard = leaderboard.iloc[order].reset_index(drop=True)
+
+    return {
+        'leaderboard': leaderboard,
+        'best_params': leaderboard['params'].iloc[0] if len(leaderboard) and leaderboard['rung'].iloc[0] >= 0 else None,
+        'bars_evaluated': bars_evaluated,
+        'elapsed': time.perf_counter() - started,
+        'stopped': stopped
+    }
+
+def _halving_rungs(index, start, min_period, eta):
+    """
+    每一轮回测的K线区间 [lo, hi), 区间长度按 eta 倍增长, 最后一轮为完整区间
+    """
+    start = _as_index_time(start, index)
+    period = pd.Timedelta(min_period)
+    rungs = []
+    while True:
+        hi = min(int(index.searchsorted(start + period)), len(index))
+        if not rungs or hi > rungs[-1][1]:
+            rungs.append((0, hi))
+        if hi >= len(index):
+            return rungs
+        period = period * eta
+
+def _walk_forward_windows(index, start, end, train_period, test_period, anchored):
+    """
+    生成 (训练窗口, 测试窗口) 列表, 窗口以K线位置 [lo, hi) 和对应的时间表示
+    """
+    train_period = pd.Timedelta(train_period)
+    test_period = pd.Timedelta(test_period)
+    start = _as_index_time(start, index)
+    end = _as_index_time(end, index)
+
+    folds = []
+    test_start = start + train_period
+    while test_start + test_period <= end:
+        train_start = start if anchored else test_start - train_period
+        test_end = test_start + test_period
+        folds.append({
+            'fold': len(folds),
+            'train_start': train_start,
+            'train_end': test_start,
+            'test_start': test_start,
+            'test_end': test_end,
+            'train_slice': (int(index.searchsorted(train_start)), int(index.searchsorted(test_start))),
+            'test_slice': (int(index.searchsorted(test_start)), int(index.searchsorted(test_end)))
+        })
+        test_start = test_end
+
+    return folds
+
+def _as_index_time(value, index):
+    # 把起止时间转换为与K线索引相同的时区
+    value = pd.Timestamp(value)
+    if index.tz is None:
+        return value.tz_convert(None) if value.tz is not None else value
+    return value.tz_localize('UTC').tz_convert(index.tz) if value.tz is None else value.tz_convert(index.tz)
+
+def _expand_grid(param_grid):
+    """
+    参数网格展开为参数字典列表
+    """
+    if isinstance(param_grid, dict):
+        names = list(param_grid.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+    return [dict(params) for params in param_grid]
+
+# 子进程中共享的1min数据和配置, fork 启动时直接继承父进程的内存, 不需要序列化
+_shared_data = None
+_shared_config = None
+
+def _init_shared(ticker_data, config):
+    global _shared_data, _shared_config
+    _shared_data = ticker_data
+    _shared_config = config
+
+def _map_shared(func, tasks, ticker_data, config, processes=None):
+    """
+    在进程池中对每个任务调用 func, 数据和配置通过进程池的初始化函数在每个进程中只传递一次
+    """
+    with _shared_pool(ticker_data, config, processes, len(tasks)) as (executor, _):
+        return [future.result() for future in [executor.submit(func, task) for task in tasks]]
+
+@contextmanager
+def _shared_pool(ticker_data, config, processes=None, max_tasks=None):
+    """
+    创建共享数据的进程池, 返回 (执行器, 进程数), 只有一个进程可用时在当前进程中依次运行
+    """
+    processes = processes or get_available_cpu_count()
+    if max_tasks is not None:
+        processes = min(processes, max_tasks)
+    if processes <= 1:
+        _init_shared(ticker_data, config)
+        yield _SerialExecutor(), 1
+        return
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_shared, initargs=(ticker_data, config)) as executor:
+        yield executor, processes
+
+class _SerialExecutor():
+    """ 与进程池接口相同的串行执行器 """
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+def _run_slice(params, lo, hi):
+    """
+    用一组参数回测共享数据的 [lo, hi) 区间, 返回 (账单, 评估指标), 没有交易时都为 None
+    """
+    config = _shared_config
+    init_balance = config['init_balance']
+    strategy = config['strategy_cls'](init_balance, config['trading_fee_ratio'], config['slippage_ratio'], **config['strategy_kwargs'], **params)
+    result = _single_symbol_engine(config['symbol'], None, None, strategy, None, ticker_data=_shared_data.iloc[lo:hi])
+    if len(result) == 0:
+        return None, None
+    result = result.with_time_offset(TIMEZONE)
+    return result, evaluate_strategy(result, init_balance)
+
+def _score(metrics, objective, maximize):
+    # 没有交易或指标无效时得分最差
+    if metrics is None:
+        return -np.inf
+    score = objective(metrics) if callable(objective) else metrics[objective]
+    if score is None or np.isnan(score):
+        return -np.inf
+    return float(score) if maximize else -float(score)
+
+def _run_config(task):
+    """
+    回测一组参数, 返回 (得分, 总盈亏, 交易次数)
+    """
+    params, lo, hi = task
+    config = _shared_config
+    ledger, metrics = _run_slice(params, lo, hi)
+    if ledger is None:
+        return _score(None, config['objective'], config['maximize']), 0.0, 0
+    return _score(metrics, config['objective'], config['maximize']), float(metrics['total_pnl']), len(ledger)
+
+def _run_fold(fold):
+    """
+    在训练窗口上遍历参数, 再用最优参数回测测试窗口
+    """
+    config = _shared_config
+    objective, maximize = config['objective'], config['maximize']
+
+    best_params, best_score = None, -np.inf
+    for params in config['params_list']:
+        _, metrics = _run_slice(params, *fold['train_slice'])
+        score = _score(metrics, objective, maximize)
+        if best_params is None or score > best_score:
+            best_params, best_score = params, score
+
+    test_ledger, test_metrics = _run_slice(best_params, *fold['test_slice'])
+    return {
+        'fold': fold['fold'],
+        'train_start': fold['train_start'],
+        'train_end': fold['train_end'],
+        'test_start': fold['test_start'],
+        'test_end': fold['test_end'],
+        'params': best_params,
+        'train_score': best_score if maximize else -best_score,
+        'test_score': _score(test_metrics, objective, maximize) * (1 if maximize else -1),
+        'test_trades': len(test_ledger) if test_ledger is not None else 0,
+        'test_pnl': float(test_ledger.column('pnl').sum()) if test_ledger is not None else 0.0,
+        'test_ledger': test_ledger
+    }
@@ -0,0 +1,341 @@
+# 本模块提供模拟盘运行器: 从K线数据源逐根接收K线, 更新指标, 调用策略并撮合, 同时统计每次决策的延迟
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from .data import get_klines, _convert_to_minutes
+from .indicators import get_indicators
+from .streaming import StreamingIndicators, supports_streaming
+from .backtest import _EngineState, _scan_exit_orders, _scan_limit_order, _convert_result_time
+from .utils.magic import TIMEZONE
+
+_BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+class BarFeed():
+    """
+    K线数据源接口。
+    迭代时按时间顺序产出 (date, bar), bar 为包含 open/high/low/close/volume 的 pd.Series, 只能产出已经收盘的K线。
+    实盘数据源(e.g 轮询 ccxt 的 fetch_ohlcv)实现同样的接口即可交给 PaperTrader。
+
+    属性:
+    - symbol: 交易对名称
+    - interval: K线周期, pd.Timedelta
+    - speed: 相对实际时间的加速倍数, 实盘为1, None 表示不等待
+    - due: 最近产出的K线按计划应该到达的时刻(time.perf_counter), 没有计划时为 None
+    """
+    symbol = None
+    interval = pd.Timedelta('1min')
+    speed = 1
+    due = None
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def budget(self):
+        """
+        每根K线可用的处理时间(秒), 超过时下一根K线到达时上一根还没有处理完
+        """
+        seconds = self.interval.total_seconds()
+        return seconds / self.speed if self.speed else seconds
+
+    def close(self):
+        pass
+
+class ReplayFeed(BarFeed):
+    """
+    回放本地K线的数据源。
+    按K线时间间隔除以 speed 的节奏产出K线, e.g speed=60 时1min K线每秒产出一根; speed=None 时不等待, 尽快产出。
+    处理跟不上节奏时不会跳过K线, 之后的K线会立即产出, 落后的时间记录在 PaperTrader 的 lag 中。
+
+    参数:
+    - symbol: 交易对名称
+    - start, end: 起止时间, format: YYYY-MM-DDTHH-MM-SSZ
+    - timeframe: K线周期, 默认1m
+    - speed: 回放加速倍数
+    - ticker_data: 已经加载好的K线, 传入时不再读取本地数据
+    """
+    def __init__(self, symbol, start=None, end=None, timeframe='1m', speed=None, ticker_data=None, proxy='http://127.0.0.1:7890/', data_path=None):
+        self.symbol = symbol
+        self.interval = pd.Timedelta(minutes=_convert_to_minutes(timeframe))
+        self.speed = speed
+        if ticker_data is None:
+            ticker_data = get_klines(symbol, start, end, timeframe, proxy=proxy, data_path=data_path)
+        self.ticker_data = ticker_data
+
+    def __iter__(self):
+        ticker_data = self.ticker_data
+        dates = ticker_data.index
+        if len(dates) == 0:
+            return
+
+        started = time.perf_counter()
+        first = dates[0]
+        for i in range(len(ticker_data)):
+            if self.speed:
+                # 第 i 根K线按回放节奏应该到达的时刻
+                self.due = started + (dates[i] - first).total_seconds() / self.speed
+                wait = self.due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            yield dates[i], ticker_data.iloc[i]
+
+class PaperTrader():
+    """
+    模拟盘运行器。
+    每根K线到达后依次: 检查止盈止损和挂单是否在这根K线上成交, 更新 strategy.data 和 strategy.indicators,
+    调用 strategy.run 并处理返回的信号。成交规则和资金计算与回测引擎相同, 但只使用已经到达的K线。
+    每根K线记录各步骤的耗时, 总耗时超过 feed.budget() 的K线记为超时(overrun)。
+
+    参数:
+    - feed: BarFeed, e.g ReplayFeed
+    - strategy: 策略对象
+    - indicators: 指标列表, 与 get_indicators 的参数相同, e.g ['rsi_14', 'bbands_20'];
+      每根K线只在最近 lookback 根K线上重新计算, 并把最新一行追加到 strategy.indicators
+    - lookback: strategy.data 和 strategy.indicators 保留的K线数量, None 时不更新这两个属性
+    - history: 开始前已经收盘的K线, 只用来填充 strategy.data 和计算指标, 不交易
+    - streaming: True 时有增量实现的指标(见 streaming.py)每根K线只更新一步, 不再在最近 lookback 根K线上重新计算,
+      结果与在全部历史上调用 get_indicators 相同; 其余指标仍然按窗口重新计算
+    """
+    def __init__(self, feed, strategy, indicators=None, lookback=500, history=None, streaming=False):
+        self.feed = feed
+        self.strategy = strategy
+        self.symbol = feed.symbol
+        self.indicators = list(indicators) if indicators else []
+        self.lookback = lookback
+        self.state = _PaperState(self.symbol, strategy)
+        self.on_order_filled = getattr(strategy, 'on_order_filled', None)
+
+        # 每根K线的耗时记录: K线时间, 到达时落后计划的时间, 撮合, 指标, 策略, 总耗时
+        self._records = []
+        self._indicator_dates = []
+        self._indicator_rows = []
+        self._indicator_columns = []
+        self._streams = None
+        self._window_indicators = self.indicators
+        if streaming:
+            self._streams = StreamingIndicators(*[name for name in self.indicators if supports_streaming(name)])
+            self._window_indicators = [name for name in self.indicators if not supports_streaming(name)]
+        if history is not None:
+            for date, bar in history.iterrows():
+                self.state.push_bar(date, bar, locate=False)
+                self._update_indicators(date, bar)
+
+    def run(self, max_bars=None):
+        """
+        运行到数据源结束(或处理完 max_bars 根K线), 返回 report()
+        """
+        processed = 0
+        try:
+            for date, bar in self.feed:
+                self.on_bar(date, bar)
+                processed += 1
+                if max_bars is not None and processed >= max_bars:
+                    break
+        finally:
+            self.feed.close()
+        return self.report()
+
+    def on_bar(self, date, bar):
+        """
+        处理一根新收盘的K线, 返回策略的信号
+        """
+        arrived = time.perf_counter()
+        due = self.feed.due
+        lag = arrived - due if due is not None else 0.0
+        state = self.state
+        strategy = self.strategy
+
+        # 先处理托管的止盈止损和挂单, 与回测引擎一样在策略信号之前成交
+        i = state.push_bar(date, bar)
+        if i == state.exit_idx:
+            state.trigger_exit(date)
+        if i == state.next_order_idx:
+            for order in state.match_orders(i, date):
+                if self.on_order_filled is not None:
+                    self.on_order_filled(date, order, state.current_pos, state.current_balance, self.symbol)
+        matched = time.perf_counter()
+
+        self._update_indicators(date, bar)
+        updated = time.perf_counter()
+
+        state.current_pos.update_float_profit(bar['close'])
+        signal = strategy.run(date, bar, state.current_pos, state.current_balance, self.symbol)
+        if signal is not None:
+            state.apply_signal(signal, i, date)
+        finished = time.perf_counter()
+
+        self._records.append((date, lag, matched - arrived, updated - matched, finished - updated, finished - arrived))
+        return signal
+
+    def latency(self):
+        """
+        每根K线的耗时(秒), overrun 表示总耗时超过了K线间隔允许的处理时间
+        """
+        columns = ['date', 'lag', 'orders', 'indicators', 'strategy', 'total']
+        frame = pd.DataFrame(self._records, columns=columns).set_index('date')
+        frame['overrun'] = frame['total'] > self.feed.budget()
+        return frame
+
+    def latency_stats(self, percentiles=(50, 90, 99)):
+        """
+        决策延迟(从K线到达到信号处理完毕)的分位数和超时统计, 时间单位为毫秒
+        """
+        total = np.array([record[-1] for record in self._records]) * 1000
+        lag = np.array([record[1] for record in self._records]) * 1000
+        budget = self.feed.budget() * 1000
+        stats = {'bars': len(total), 'budget_ms': budget}
+        if len(total) == 0:
+            return stats
+
+        stats['mean_ms'] = float(total.mean())
+        for q, value in zip(percentiles, np.percentile(total, percentiles)):
+            stats[f'p{q}_ms'] = float(value)
+        stats['max_ms'] = float(total.max())
+        stats['overruns'] = int((total > budget).sum())
+        stats['overrun_rate'] = stats['overruns'] / len(total)
+        stats['max_lag_ms'] = float(lag.max())
+        return stats
+
+    def report(self):
+        """
+        返回字典: ledger 为已经平仓的交易记录(未平仓的仓位不会被平掉), position 和 balance 为当前仓位和余额,
+        latency 为每根K线的耗时, stats 为延迟统计, overruns 为超时的K线
+        """
+        latency = self.latency()
+        ledger = self.state.pos_history
+        return {
+            'ledger': _convert_result_time(ledger, TIMEZONE) if len(ledger) else ledger,
+            'position': self.state.current_pos,
+            'balance': self.state.current_balance,
+            'latency': latency,
+            'stats': self.latency_stats(),
+            'overruns': latency[latency['overrun']]
+        }
+
+    def _update_indicators(self, date, bar):
+        if self.lookback is None:
+            return
+
+        window = self.state.frame(self.lookback)
+        self.strategy.data = window
+        if not self.indicators:
+            return
+
+        # 增量指标更新一步, 其余指标只在最近 lookback 根K线上重新计算, 取最后一行作为当前K线的指标
+        if self._streams is not None:
+            latest = pd.Series(self._streams.update(bar))
+            if self._window_indicators:
+                computed = get_indicators(window, *self._window_indicators).iloc[-1]
+                latest = pd.concat([latest, computed.drop('close')])
+        else:
+            latest = get_indicators(window, *self.indicators).iloc[-1]
+        new_columns = [name for name in latest.index if name not in self._indicator_columns]
+        if new_columns:
+            # K线数量不够时部分指标还没有输出, 之后出现的新列在之前的行中补 NaN
+            self._indicator_columns += new_columns
+            width = len(self._indicator_columns)
+            self._indicator_rows = [np.r_[row, np.full(width - len(row), np.nan)] for row in self._indicator_rows]
+        self._indicator_dates.append(date)
+        self._indicator_rows.append(latest.reindex(self._indicator_columns).to_numpy(dtype=float))
+        if len(self._indicator_rows) > 2 * self.lookback:
+            del self._indicator_dates[:-self.lookback]
+            del self._indicator_rows[:-self.lookback]
+        self.strategy.indicators = pd.DataFrame(
+            np.vstack(self._indicator_rows[-self.lookback:]),
+            index=pd.DatetimeIndex(self._indicator_dates[-self.lookback:]),
+            columns=self._indicator_columns
+        )
+
+class _PaperState(_EngineState):
+    """
+    模拟盘的引擎状态。
+    回测引擎在开仓和挂单时向后扫描完整的K线找到成交位置, 模拟盘的K线逐根到达,
+    只能在每根K线到达时检查这一根是否触发止盈止损或挂单成交, 触发和成交价的规则与回测相同。
+    """
+    def __init__(self, symbol, strategy, capacity=4096):
+        self._columns = {name: np.full(capacity, np.nan) for name in _BAR_FIELDS}
+        self._dates = []
+        empty = self._columns['open'][:0]
+        super().__init__(symbol, self._dates, empty, empty, empty, strategy)
+        # 当前仓位从 scan_from 到 _extreme_upto 之前的K线的最高(低)价
+        self._extreme_key, self._extreme, self._extreme_upto = None, None, 0
+
+    def push_bar(self, date, bar, locate=True):
+        """
+        追加一根K线, locate 为 True 时检查这根K线上的止盈止损和挂单, 返回K线位置
+        """
+        i = len(self._dates)
+        if i == len(self._columns['open']):
+            for name, values in self._columns.items():
+                grown = np.full(2 * len(values), np.nan)
+                grown[:i] = values
+                self._columns[name] = grown
+        for name in _BAR_FIELDS:
+            self._columns[name][i] = bar[name] if name in bar else np.nan
+        self._dates.append(date)
+
+        self.total = i + 1
+        self.open_prices = self._columns['open'][:i + 1]
+        self.high_prices = self._columns['high'][:i + 1]
+        self.low_prices = self._columns['low'][:i + 1]
+        if locate:
+            self._locate_events(i, date)
+        return i
+
+    def frame(self, lookback):
+        """
+        最近 lookback 根K线的 DataFrame
+        """
+        stop = len(self._dates)
+        start = max(stop - lookback, 0)
+        return pd.DataFrame(
+            {name: values[start:stop] for name, values in self._columns.items()},
+            index=pd.DatetimeIndex(self._dates[start:stop], name='date')
+        )
+
+    def _locate_events(self, i, date):
+        current_pos = self.current_pos
+        if current_pos.amount > 0 and current_pos.has_exit_orders() and self.exit_idx < 0:
+            # 与回测一样, 仓位记录的极值只在开仓和加仓时更新, 之后K线的极值单独累计,
+            # 移动止损只使用之前K线的极值, 先把上次检查以来的K线合并进去, 再检查这一根
+            key = (current_pos.dir, current_pos.extreme_price, self.scan_from)
+            if self._extreme_key != key:
+                self._extreme_key, self._extreme, self._extreme_upto = key, current_pos.extreme_price, self.scan_from
+            if self._extreme_upto < i:
+                lo, self._extreme_upto = self._extreme_upto, i
+                if current_pos.dir == 'long':
+                    self._extreme = np.fmax(self._extreme, np.fmax.reduce(self.high_prices[lo:i]))
+                else:
+                    self._extreme = np.fmin(self._extreme, np.fmin.reduce(self.low_prices[lo:i]))
+            self.exit_idx, self.exit_price, self.exit_type = _scan_exit_orders(current_pos, self.open_prices, self.high_prices, self.low_prices, i, extreme=self._extreme)
+
+        for order in self.orders:
+            if order['fill_idx'] >= 0:
+                continue
+            expire_date = order['expire_date']
+            if i >= order['expire_idx'] or (expire_date is not None and date >= expire_date):
+                # 挂单到期, match_orders 会把它移除
+                order['expire_idx'] = i
+            else:
+                order['fill_idx'], order['fill_price'] = _scan_limit_order(order['is_buy'], order['signal'].price, self.open_prices, self.high_prices, self.low_prices, i, i + 1)
+        self._update_next_order_idx()
+
+    def _add_order(self, signal, i, is_buy, scan_start):
+        super()._add_order(signal, i, is_buy, scan_start)
+        # 按时间失效的挂单记录到期时间, 之后到达的K线时间不早于到期时间时失效
+        expire = getattr(signal, 'expire', None)
+        if expire is None or isinstance(expire, (int, np.integer)):
+            expire_date = None
+        elif isinstance(expire, pd.Timestamp):
+            expire_date = expire
+        else:
+            expire_date = self.index[i] + pd.Timedelta(expire)
+        self.orders[-1]['expire_date'] = expire_date
+
+    def _expire_idx(self, signal, i):
+        # 之后的K线还没有到达, 只有按K线数量失效的挂单可以确定失效位置
+        expire = getattr(signal, 'expire', None)
+        if isinstance(expire, (int, np.integer)):
+            return i + 1 + int(expire)
+        return sys.maxsize
@@ -0,0 +1,185 @@
+# 本模块提供快速预览回测: 在粗周期K线或抽样的子区间上回测, 给出指标估计和置信区间
+import copy
+import numpy as np
+import pandas as pd
+
+from .data import get_klines, _convert_to_minutes
+from .ledger import Ledger
+from .backtest import _single_symbol_engine
+from .utils.magic import TIMEZONE
+
+def preview_backtest(symbol, start, end, strategy, timeframe=None, segments=8, segment_period='1d', confidence=0.95, intrabar_segments=2, intrabar_tolerance=0.2, seed=None, proxy='http://127.0.0.1:7890/'):
+    """
+    快速预览回测。
+    从 [start, end] 中随机抽取 segments 个长度为 segment_period 的不重叠子区间, 每个子区间用策略的一个副本单独回测,
+    再根据各子区间的结果估计完整区间的指标, 并用 bootstrap 给出置信区间。
+    timeframe 不为空时先把1min K线聚合为该周期(e.g '15m')再回测, segments=None 时在完整区间上回测。
+
+    同时在前 intrabar_segments 个子区间上用更细的K线(timeframe 为空时改用更粗的5m)再回测一次,
+    两次结果的交易次数或盈亏差异超过 intrabar_tolerance 时, 认为策略的表现依赖K线内部的细节, 预览结果不可靠。
+
+    参数:
+    - symbol: string, 交易对名称, 目前只支持单个 symbol
+    - start, end: string, 起止日期 format: YYYY-MM-DDTHH-MM-SSZ
+    - strategy: 策略对象, 每个子区间使用它的副本, 原对象不会被修改
+    - timeframe: 聚合周期, e.g '5m', '1h', 为空时使用1min K线
+    - segments: 抽样的子区间数量, None 时不抽样
+    - segment_period: 子区间长度, e.g '1d'
+    - confidence: 置信区间的置信度
+    - seed: 随机种子
+
+    返回:
+    - 字典: metrics 为各指标的估计值和置信区间, segments 为每个子区间的结果, ledger 为所有子区间的交易记录,
+      intrabar_sensitive 为是否依赖K线内部细节, intrabar_diff 为粗细K线结果的差异
+    """
+    if not isinstance(symbol, str):
+        raise ValueError('preview_backtest only supports a single symbol.')
+
+    ticker_data = get_klines(symbol, start, end, '1m', proxy=proxy)
+    windows = _sample_windows(ticker_data.index, segment_period, segments, seed)
+    state = strategy.get_state()
+
+    runs = []
+    for lo, hi in windows:
+        ledger = _run_window(symbol, strategy, state, ticker_data.iloc[lo:hi], timeframe)
+        runs.append((lo, hi, ledger))
+
+    rows = []
+    for lo, hi, ledger in runs:
+        pnl = ledger.column('pnl') if ledger is not None else np.array([])
+        rows.append({
+            'start': ticker_data.index[lo],
+            'end': ticker_data.index[hi - 1],
+            'bars': hi - lo,
+            'pnl': float(pnl.sum()),
+            'trades': len(pnl),
+            'wins': int((pnl > 0).sum())
+        })
+    report = pd.DataFrame(rows)
+
+    # 按子区间覆盖的天数把结果外推到完整区间
+    days = len(ticker_data) / 1440
+    metrics = _bootstrap_metrics(report, days, strategy.total_balance, confidence, seed)
+
+    # 粗细K线对比, 检查策略是否依赖K线内部的细节
+    # 不抽样时只取开头一个 segment_period 做对比, 避免在完整区间上再跑一次1min回测
+    check_timeframe = '5m' if timeframe is None else None
+    check_bars = int(pd.Timedelta(segment_period) / pd.Timedelta('1min'))
+    pnls, check_pnls = [], []
+    for lo, hi, ledger in runs[:intrabar_segments]:
+        if hi - lo > check_bars:
+            hi = lo + check_bars
+            ledger = _run_window(symbol, strategy, state, ticker_data.iloc[lo:hi], timeframe)
+        other = _run_window(symbol, strategy, state, ticker_data.iloc[lo:hi], check_timeframe)
+        pnls.append(ledger.column('pnl') if ledger is not None else np.array([]))
+        check_pnls.append(other.column('pnl') if other is not None else np.array([]))
+    intrabar_diff = _intrabar_diff(np.concatenate(pnls), np.concatenate(check_pnls)) if pnls else np.nan
+
+    ledgers = [ledger for _, _, ledger in runs if ledger is not None]
+    return {
+        'metrics': metrics,
+        'segments': report,
+        'ledger': Ledger.concat(ledgers).with_time_offset(TIMEZONE) if ledgers else None,
+        'intrabar_sensitive': bool(intrabar_diff > intrabar_tolerance) if pnls else None,
+        'intrabar_diff': intrabar_diff,
+        'coverage': report['bars'].sum() / len(ticker_data)
+    }
+
+def _sample_windows(index, segment_period, segments, seed):
+    """
+    随机抽取不重叠的子区间, 返回按时间排序的K线位置 [lo, hi) 列表
+    """
+    if segments is None:
+        return [(0, len(index))]
+
+    # 按时间切分为等长的候选区间, 再从中无放回抽样
+    edges = pd.date_range(index[0], index[-1], freq=pd.Timedelta(segment_period))
+    bounds = np.unique(np.r_[index.searchsorted(edges), len(index)])
+    candidates = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+    if segments >= len(candidates):
+        return candidates
+
+    rng = np.random.default_rng(seed)
+    picked = np.sort(rng.choice(len(candidates), segments, replace=False))
+    return [candidates[k] for k in picked]
+
+def _run_window(symbol, strategy, state, ticker_data, timeframe):
+    """
+    用策略的副本回测一个子区间, 没有交易时返回 None
+    """
+    # 副本共享 data 和 indicators, 其余状态深拷贝, 保证每个子区间都从相同的初始状态开始
+    fresh = copy.copy(strategy)
+    fresh.set_state(copy.deepcopy(state))
+    if timeframe is not None:
+        ticker_data = _coarsen(ticker_data, _convert_to_minutes(timeframe))
+
+    ledger = _single_symbol_engine(symbol, None, None, fresh, None, ticker_data=ticker_data)
+    return ledger if len(ledger) else None
+
+def _coarsen(ticker_data, minutes):
+    """
+    把1min K线按每 minutes 根聚合, 时间标签取每组最后一根1min K线, 保证策略在该时刻看到的数据都已经发生
+    """
+    if minutes <= 1:
+        return ticker_data
+
+    starts = np.arange(0, len(ticker_data), minutes)
+    ends = np.r_[starts[1:], len(ticker_data)] - 1
+    columns = {
+        'open': ticker_data['open'].to_numpy()[starts],
+        'high': np.maximum.reduceat(ticker_data['high'].to_numpy(), starts),
+        'low': np.minimum.reduceat(ticker_data['low'].to_numpy(), starts),
+        'close': ticker_data['close'].to_numpy()[ends]
+    }
+    if 'volume' in ticker_data.columns:
+        columns['volume'] = np.add.reduceat(ticker_data['volume'].to_numpy(), starts)
+    return pd.DataFrame(columns, index=ticker_data.index[ends])
+
+def _bootstrap_metrics(report, days, init_balance, confidence, seed, n_boot=2000):
+    """
+    对子区间做 bootstrap 重抽样, 估计总盈亏, 收益率, 日均交易次数和胜率的置信区间
+    """
+    pnl = report['pnl'].to_numpy(dtype=float)
+    trades = report['trades'].to_numpy(dtype=float)
+    wins = report['wins'].to_numpy(dtype=float)
+    bars = report['bars'].to_numpy(dtype=float)
+
+    def estimate(sample):
+        # sample 为子区间下标, 可以是一维(点估计)或二维(每行一次重抽样)
+        covered = bars[sample].sum(axis=-1) / 1440
+        total_trades = trades[sample].sum(axis=-1)
+        total_pnl = pnl[sample].sum(axis=-1) / np.maximum(covered, 1e-9) * days
+        with np.errstate(invalid='ignore', divide='ignore'):
+            win_rate = wins[sample].sum(axis=-1) / total_trades
+        return {
+            'total_pnl': total_pnl,
+            'return': total_pnl / init_balance,
+            'daily_trades': total_trades / np.maximum(covered, 1e-9),
+            'win_rate': win_rate
+        }
+
+    n = len(report)
+    point = estimate(np.arange(n))
+    rng = np.random.default_rng(seed)
+    samples = estimate(rng.integers(0, n, size=(n_boot, n)))
+
+    alpha = (1 - confidence) / 2
+    metrics = {}
+    for name, value in point.items():
+        values = samples[name][~np.isnan(samples[name])]
+        low, high = np.quantile(values, [alpha, 1 - alpha]) if len(values) and n > 1 else (np.nan, np.nan)
+        metrics[name] = {'estimate': float(value), 'low': float(low), 'high': float(high)}
+    return metrics
+
+def _intrabar_diff(pnl_a, pnl_b):
+    """
+    两次回测结果的差异: 交易次数的相对差异和盈亏差占总交易盈亏绝对值的比例中较大的一个
+    """
+    trades = max(len(pnl_a), len(pnl_b))
+    if trades == 0:
+        return 0.0
+
+    trade_diff = abs(len(pnl_a) - len(pnl_b)) / trades
+    gross = max(np.abs(pnl_a).sum(), np.abs(pnl_b).sum())
+    pnl_diff = abs(pnl_a.sum() - pnl_b.sum()) / gross if gross > 0 else 0.0
+    return float(max(trade_diff, pnl_diff))
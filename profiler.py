@@ -0,0 +1,173 @@
+# 本模块提供回测的性能分析工具, 统计各阶段的耗时和调用次数
+import sys
+import time
+import cProfile
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块, 使用 psutil 获取内存
+    resource = None
+
+class BacktestProfiler():
+    """
+    回测性能分析器。
+    按阶段记录墙钟时间和调用次数, 同时统计处理的K线数量, 每秒处理的K线数和回测期间内存峰值的增长。
+
+    阶段:
+    - data_load: 拉取/读取K线数据
+    - indicator_prep: 指标计算, 需要用户自己用 profiler.phase('indicator_prep') 包裹 get_indicators
+    - strategy_callback: 策略的 run / run_batch / run_portfolio / on_order_filled 调用
+    - get_recent_data: 策略内部调用 get_recent_data 的时间, 已包含在 strategy_callback 中
+    - order_handling: 信号处理, 止盈止损和挂单成交
+    - engine_loop: 回测主循环的总时间
+    - evaluation: evaluate_strategy
+
+    profile_strategy: 传入文件路径时, 额外用 cProfile 记录策略回调并把 pstats 结果保存到该路径
+    """
+    def __init__(self, profile_strategy=None):
+        self.phases = {}
+        self.bars = 0
+        self.profile_strategy = profile_strategy
+        self._cprofile = cProfile.Profile() if profile_strategy else None
+        self._wrapped = []
+        self._start_time = time.perf_counter()
+        # 进程的内存峰值在整个生命周期内只增不减, 记录开始和结束(detach)时的峰值, 报告两者之差
+        self._start_memory = _peak_memory_mb()
+        self._end_memory = None
+
+    def add(self, name, seconds, calls=1):
+        """
+        累加某个阶段的耗时和调用次数
+        """
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [seconds, calls]
+        else:
+            phase[0] += seconds
+            phase[1] += calls
+
+    @contextmanager
+    def phase(self, name):
+        """
+        统计 with 代码块的耗时
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def wrap(self, name, func, cprofile=False):
+        """
+        返回统计耗时的函数包装, cprofile 为 True 时同时交给 cProfile 记录
+        """
+        phases = self.phases
+        perf_counter = time.perf_counter
+        profile = self._cprofile if cprofile else None
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                if profile is not None:
+                    return profile.runcall(func, *args, **kwargs)
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                phase = phases.get(name)
+                if phase is None:
+                    phases[name] = [elapsed, 1]
+                else:
+                    phase[0] += elapsed
+                    phase[1] += 1
+
+        return timed
+
+    def attach(self, strategy):
+        """
+        在策略实例上替换回调方法为统计耗时的版本, 回测结束后用 detach 还原
+        """
+        for method, name, cprofile in (
+            ('run', 'strategy_callback', True),
+            ('run_portfolio', 'strategy_callback', True),
+            ('run_batch', 'strategy_callback', True),
+            ('on_order_filled', 'strategy_callback', True),
+            ('get_recent_data', 'get_recent_data', False),
+        ):
+            func = getattr(strategy, method, None)
+            if func is None:
+                continue
+            own = method in getattr(strategy, '__dict__', {})
+            self._wrapped.append((strategy, method, own, func))
+            setattr(strategy, method, self.wrap(name, func, cprofile))
+
+    def detach(self):
+        """
+        还原 attach 替换的方法, 并在需要时保存 cProfile 结果
+        """
+        for strategy, method, own, func in reversed(self._wrapped):
+            if own:
+                setattr(strategy, method, func)
+            else:
+                delattr(strategy, method)
+        self._wrapped = []
+        self._end_memory = _peak_memory_mb()
+
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(self.profile_strategy)
+
+    def report(self):
+        """
+        返回结构化的性能报告。
+        peak_memory_growth_mb 为开始到结束(detach, 尚未结束时到现在)之间进程内存峰值的增长, 即这次回测把峰值抬高了多少,
+        峰值没有超过之前(e.g 同一个 notebook 中更早的回测)的峰值时为0; process_peak_memory_mb 为进程启动以来的峰值
+        """
+        wall_time = time.perf_counter() - self._start_time
+        engine_time = self.phases.get('engine_loop', [0, 0])[0]
+        end_memory = self._end_memory if self._end_memory is not None else _peak_memory_mb()
+        phases = {}
+        for name, (seconds, calls) in self.phases.items():
+            phases[name] = {
+                'seconds': seconds,
+                'calls': calls,
+                'share': seconds / wall_time if wall_time > 0 else 0,
+                'per_call_us': seconds / calls * 1e6 if calls else 0
+            }
+
+        return {
+            'wall_time': wall_time,
+            'phases': phases,
+            'bars': self.bars,
+            'bars_per_sec': self.bars / engine_time if engine_time > 0 else 0,
+            'peak_memory_growth_mb': end_memory - self._start_memory,
+            'process_peak_memory_mb': end_memory,
+            'cprofile_path': self.profile_strategy
+        }
+
+    def __repr__(self):
+        report = self.report()
+        lines = [f"{'phase':<20}{'seconds':>12}{'calls':>12}{'us/call':>12}{'share':>9}"]
+        for name, phase in sorted(report['phases'].items(), key=lambda x: -x[1]['seconds']):
+            lines.append(f"{name:<20}{phase['seconds']:>12.4f}{phase['calls']:>12}{phase['per_call_us']:>12.2f}{phase['share']:>9.1%}")
+        lines.append(f"bars: {report['bars']}, bars/sec: {report['bars_per_sec']:.0f}, peak memory growth: {report['peak_memory_growth_mb']:.1f} MB (process peak: {report['process_peak_memory_mb']:.1f} MB)")
+        return '\n'.join(lines)
+
+def profile_phase(profiler, name):
+    """
+    profiler 为 None 时返回空的上下文管理器, 方便在引擎中按需统计
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)
+
+def _peak_memory_mb():
+    """ 进程启动以来的内存峰值(MB) """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 返回字节, Linux 返回 KB
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+    import psutil
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / 1024 / 1024
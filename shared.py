@@ -0,0 +1,110 @@
+# 本模块提供指标之间共用的中间序列(收益率, 滚动方差/标准差, ATR, 滚动回归)和相同参数的指标调用
+# get_indicators 计算一组指标时在 sharing() 中执行, 相同输入和参数的中间序列只计算一次; 不在 sharing() 中时直接计算
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .kernels import rolling_ols as _rolling_ols_kernel
+
+_active = None
+
+class SharedSeries():
+    """
+    一次指标计算中已经算好的中间序列。
+    键为 (运算, 参数, 输入序列), 输入序列按名称, 长度和数据地址区分, 只在 sharing() 期间有效, 结束后释放
+
+    属性:
+    - computed: 实际计算的次数
+    - reused: 直接使用已有结果的次数, 即节省的计算次数
+    """
+    def __init__(self):
+        self.values = {}
+        self.computed = {}
+        self.reused = {}
+
+    def get(self, op, params, inputs, compute):
+        key = (op, params) + tuple(_series_key(series) for series in inputs)
+        if key in self.values:
+            self.reused[op] = self.reused.get(op, 0) + 1
+            return self.values[key][0]
+        value = compute()
+        # 同时保留输入序列, 保证 sharing() 期间它们的内存不会被其它序列复用
+        self.values[key] = (value, inputs)
+        self.computed[op] = self.computed.get(op, 0) + 1
+        return value
+
+    def stats(self):
+        return {
+            'computed': sum(self.computed.values()),
+            'reused': sum(self.reused.values()),
+            'reused_by_op': dict(self.reused)
+        }
+
+@contextmanager
+def sharing():
+    """
+    在 with 块内共用中间序列, 返回 SharedSeries。嵌套时使用外层的 SharedSeries
+    """
+    global _active
+    if _active is not None:
+        yield _active
+        return
+    _active = SharedSeries()
+    try:
+        yield _active
+    finally:
+        _active = None
+
+def pct_change(close):
+    """
+    与 close.pct_change() 相同
+    """
+    return _shared('pct_change', (), (close,), lambda: close.pct_change())
+
+def rolling_var(series, length):
+    """
+    与 series.rolling(length).var() 相同
+    """
+    return _shared('rolling_var', (length,), (series,), lambda: series.rolling(window=length).var())
+
+def rolling_std(series, length):
+    """
+    与 series.rolling(length).std() 相同, pandas 的滚动标准差就是滚动方差的平方根, 两者共用一次计算
+    """
+    return _shared('rolling_std', (length,), (series,), lambda: np.sqrt(rolling_var(series, length)))
+
+def atr(high, low, close, length):
+    """
+    与 pandas_ta 的 atr(high, low, close, length) 相同, 与 get_indicators 中的 atr 指标共用
+    """
+    from pandas_ta.volatility import atr as _atr
+    return indicator(_atr, high=high, low=low, close=close, length=length)
+
+def indicator(func, **kwargs):
+    """
+    调用指标函数 func(**kwargs), 函数, 输入序列和其它参数都相同时共用结果
+    """
+    series = tuple(name for name, value in kwargs.items() if isinstance(value, pd.Series))
+    params = tuple(sorted((name, value) for name, value in kwargs.items() if name not in series)) + series
+    op = f'{func.__module__}.{func.__name__}'
+    return _shared(op, params, tuple(kwargs[name] for name in series), lambda: func(**kwargs))
+
+def rolling_ols(x, y, length):
+    """
+    与 kernels.rolling_ols 相同, 输入为 pd.Series, 返回 (斜率 β, R 方) 两个 NumPy 数组
+    """
+    return _shared('rolling_ols', (length,), (x, y), lambda: _rolling_ols_kernel(x.to_numpy(dtype=float), y.to_numpy(dtype=float), length))
+
+def _shared(op, params, inputs, compute):
+    if _active is None:
+        return compute()
+    return _active.get(op, params, inputs, compute)
+
+def _series_key(series):
+    # 同一次计算中输入序列不会被修改, float64 的序列用名称, 长度和数据地址区分(同一 DataFrame 每次取出的列地址相同), 不需要哈希数据;
+    # 其它类型转换为数组时可能复制, 改用对象本身
+    values = series.to_numpy() if isinstance(series, pd.Series) else series
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        return (getattr(series, 'name', None), len(values), values.__array_interface__['data'][0], values.strides)
+    return ('id', id(series))
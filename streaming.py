@@ -0,0 +1,463 @@
+# 本模块提供增量计算的指标: 每根新K线只更新窗口内的状态, 不重新计算全部历史, 供模拟盘和实盘逐根K线使用
+# 指标由与 get_indicators 相同的名称创建, 输出的列名和数值与批量计算相同
+import bisect
+import inspect
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from .indicators import _parse_spec, _spec_kwargs
+
+_NAN = float('nan')
+_BAR_FIELDS = ('open', 'high', 'low', 'close')
+
+class StreamingIndicator():
+    """
+    增量指标的基类。
+    子类实现 _step(open, high, low, close), 返回与 columns 对应的当前值,
+    每次更新的复杂度为 O(1)(滚动求和每 length 根K线重新求和一次, 平均 O(1)), 分位数为 O(log window)。
+    K线中没有缺失值时结果与 get_indicators 相同(浮点误差以内)。
+
+    用法:
+        ind = streaming_indicator('bollinger_k_20').from_history(data)
+        ind.update(bar)  # {'bollinger_k_20': ...}
+    """
+    columns = ()
+
+    def update(self, bar):
+        """
+        输入一根新收盘的K线(包含 open/high/low/close 的 pd.Series 或字典), 返回 列名 -> 当前值
+        """
+        values = self._step(*(float(bar[field]) for field in _BAR_FIELDS))
+        return dict(zip(self.columns, values))
+
+    def replay(self, data):
+        """
+        依次用 data 的每根K线更新, 返回每根K线上的指标值, 列与 get_indicators 的结果相同(不含 close)
+        """
+        prices = data[list(_BAR_FIELDS)].to_numpy(dtype=float)
+        step = self._step
+        rows = [step(*row) for row in prices.tolist()]
+        values = np.array(rows, dtype=float).reshape(len(rows), len(self.columns))
+        return pd.DataFrame(values, index=data.index, columns=list(self.columns))
+
+    def from_history(self, data):
+        """
+        用已经收盘的历史K线预热, 返回自身
+        """
+        prices = data[list(_BAR_FIELDS)].to_numpy(dtype=float)
+        step = self._step
+        for row in prices.tolist():
+            step(*row)
+        return self
+
+    @property
+    def value(self):
+        """
+        最近一次更新后的指标值, 列名 -> 值
+        """
+        return dict(zip(self.columns, self._last))
+
+    def _step(self, open, high, low, close):
+        raise NotImplementedError
+
+class StreamingEMA(StreamingIndicator):
+    """
+    与 pandas_ta 的 ema 相同: 前 length 个收盘价的均值作为起点, 之后按 alpha = 2 / (length + 1) 递推
+    """
+    def __init__(self, length=None, name=None):
+        self.length = int(length) if length and length > 0 else 10
+        self.columns = (name or f'EMA_{self.length}',)
+        self._average = _SeededAverage(self.length, 2 / (self.length + 1))
+        self._last = (_NAN,)
+
+    def _step(self, open, high, low, close):
+        self._last = (self._average.push(close),)
+        return self._last
+
+class StreamingOHLCEMA(StreamingIndicator):
+    """
+    与 ohlc_ema 相同: (open + high + low + close) / 4 的 EMA, 第一根K线作为起点
+    """
+    def __init__(self, length=None, name=None):
+        self.length = int(length) if length and length > 0 else 10
+        self.columns = (name or f'OHLC_EMA_{self.length}',)
+        self.alpha = 2 / (self.length + 1)
+        self._ema = None
+        self._last = (_NAN,)
+
+    def _step(self, open, high, low, close):
+        price = (open + high + low + close) / 4
+        self._ema = price if self._ema is None else (1 - self.alpha) * self._ema + self.alpha * price
+        self._last = (self._ema,)
+        return self._last
+
+class StreamingBollingerK(StreamingIndicator):
+    """
+    与 bollinger_k 相同: 收盘价与 length 根K线均线的距离除以同一窗口的标准差
+    """
+    def __init__(self, length=None, name=None):
+        self.length = int(length) if length and length > 0 else 20
+        self.columns = (name or f'BOLL_K_{self.length}',)
+        self._window = _RollingMoments(self.length)
+        self._last = (_NAN,)
+
+    def _step(self, open, high, low, close):
+        window = self._window
+        window.push(close)
+        self._last = (_divide(close - window.mean(), window.std()),)
+        return self._last
+
+class StreamingATR(StreamingIndicator):
+    """
+    与 pandas_ta 的 atr 相同: 真实波幅从第二根K线开始, 前 length 个的均值作为起点, 之后按 Wilder 平滑递推
+    """
+    def __init__(self, length=None, name=None):
+        self.length = int(length) if length and length > 0 else 14
+        self.columns = (name or f'ATRr_{self.length}',)
+        self._prev_close = None
+        self._average = _SeededAverage(self.length, 1 / self.length)
+        self._last = (_NAN,)
+
+    def _step(self, open, high, low, close):
+        self._last = (self._push(high, low, close),)
+        return self._last
+
+    def _push(self, high, low, close):
+        prev_close = self._prev_close
+        self._prev_close = close
+        if prev_close is None:
+            return _NAN
+        true_range = max(abs(high - low), abs(high - prev_close), abs(prev_close - low))
+        return self._average.push(true_range)
+
+class StreamingNormalizedStddev(StreamingIndicator):
+    """
+    与 normalized_stddev 相同: std_length 根K线收盘价的标准差除以 atr_length 的 ATR
+    """
+    def __init__(self, std_length=None, atr_length=None, name=None):
+        self.std_length = int(std_length) if std_length and std_length > 0 else 14
+        self.atr_length = int(atr_length) if atr_length and atr_length > 0 else 14
+        self.columns = (name or f'Normalized_Std_{self.std_length}_{self.atr_length}',)
+        self._window = _RollingMoments(self.std_length)
+        self._atr = StreamingATR(self.atr_length)
+        self._last = (_NAN,)
+
+    def _step(self, open, high, low, close):
+        self._window.push(close)
+        self._last = (_divide(self._window.std(), self._atr._push(high, low, close)),)
+        return self._last
+
+class StreamingRSJ(StreamingIndicator):
+    """
+    与 rsj 相同: 窗口内正收益方差与负收益方差之差除以全部收益的方差
+    """
+    def __init__(self, length=None, name=None):
+        self.length = int(length) if length and length > 0 else 10
+        self.columns = (name or f'RSJ_{self.length}',)
+        self._returns = _Returns()
+        self._all = _RollingMoments(self.length)
+        self._positive = _RollingMoments(self.length)
+        self._negative = _RollingMoments(self.length)
+        self._last = (_NAN,)
+
+    def _step(self, open, high, low, close):
+        value = self._returns.push(close)
+        # NaN 也要放进正负两个窗口, 窗口内有 NaN 时方差为 NaN; 0 不属于任何一边
+        self._all.push(value)
+        self._positive.push(value, not value <= 0)
+        self._negative.push(value, not value >= 0)
+        self._last = (_divide(self._positive.var() - self._negative.var(), self._all.var()),)
+        return self._last
+
+class StreamingRSRS(StreamingIndicator):
+    """
+    与 rsrs 相同, 输出 (原始斜率 β, 标准化 RSRS, 钝化 RSRS)。
+    β 和 R 方由窗口内的滑动求和得到, β 的均值和标准差在 std_length 窗口内忽略 NaN,
+    收益率标准差的分位数用有序列表维护, 每根K线二分查找 O(log std_length)
+    """
+    def __init__(self, length=None, std_length=None, name=None):
+        self.length = int(length) if length and length > 0 else 18
+        self.std_length = int(std_length) if std_length and std_length > 0 else 300
+        columns = (f'RSRS_Beta_{self.length}', f'RSRS_{self.length}_{self.std_length}', f'RSRS_Passive_{self.length}_{self.std_length}')
+        self.columns = tuple(f'{name}_{column}' for column in columns) if name else columns
+        self._regression = _RollingRegression(self.length)
+        self._beta = _RollingMoments(self.std_length)
+        self._returns = _Returns()
+        self._ret_std = _RollingMoments(self.length)
+        self._rank = _RollingRank(self.std_length)
+        self._last = (_NAN,) * 3
+
+    def _step(self, open, high, low, close):
+        beta, r_squared = self._regression.push(low, high)
+        self._beta.push(beta)
+        rsrs = _divide(beta - self._beta.mean(strict=False), self._beta.std(strict=False))
+
+        self._ret_std.push(self._returns.push(close))
+        quantile = self._rank.push(self._ret_std.std())
+        # 与批量计算一样用 ** 计算, 底数为负时得到 NaN
+        passive = rsrs * _power(r_squared, 2 * quantile)
+        self._last = (beta, rsrs, passive)
+        return self._last
+
+class StreamingIndicators():
+    """
+    一组增量指标, 按 get_indicators 的参数创建, update 返回的一行与 get_indicators 结果的最后一行相同(包含 close)
+
+    参数:
+    - indicators: 指标名称列表, e.g ['ema_10', 'bollinger_k_20', 'rsrs_18_300']
+    """
+    def __init__(self, *indicators):
+        self.names = list(indicators)
+        self.indicators = [streaming_indicator(indicator) for indicator in indicators]
+        self.columns = ['close'] + [column for indicator in self.indicators for column in indicator.columns]
+
+    def update(self, bar):
+        row = {'close': float(bar['close'])}
+        for indicator in self.indicators:
+            row.update(indicator.update(bar))
+        return row
+
+    def replay(self, data):
+        frames = [data[['close']].astype(float)] + [indicator.replay(data) for indicator in self.indicators]
+        return pd.concat(frames, axis=1)
+
+    def from_history(self, data):
+        for indicator in self.indicators:
+            indicator.from_history(data)
+        return self
+
+# 指标名称 -> 增量实现
+STREAMING_INDICATORS = {
+    'ema': StreamingEMA,
+    'ohlc_ema': StreamingOHLCEMA,
+    'bollinger_k': StreamingBollingerK,
+    'atr': StreamingATR,
+    'normalized_stddev': StreamingNormalizedStddev,
+    'rsj': StreamingRSJ,
+    'rsrs': StreamingRSRS,
+}
+
+def streaming_indicator(indicator):
+    """
+    按 get_indicators 使用的指标名称创建增量指标, e.g 'bollinger_k_20', 'normalized_stddev_14_14', 'rsrs_18_300'。
+    名称中的参数按与 get_indicators 相同的规则传入, 列名也相同; 没有增量实现时抛出 KeyError
+    """
+    name, params, col_name = _parse_spec(indicator)
+    if name not in STREAMING_INDICATORS:
+        raise KeyError(f'Indicator {name} has no streaming implementation, expected one of {list(STREAMING_INDICATORS)}.')
+    cls = STREAMING_INDICATORS[name]
+    kwargs = _spec_kwargs(inspect.signature(cls).parameters, params)
+    return cls(name=col_name, **kwargs)
+
+def supports_streaming(indicator):
+    return _parse_spec(indicator)[0] in STREAMING_INDICATORS
+
+class _SeededAverage():
+    # 前 length 个值的均值作为起点, 之后按 alpha 指数平滑, 与 pandas_ta 的 ema(sma=True) 和 rma 相同
+    def __init__(self, length, alpha):
+        self.length = length
+        self.alpha = alpha
+        self.seed = []
+        self.average = _NAN
+
+    def push(self, value):
+        if self.seed is not None:
+            self.seed.append(value)
+            if len(self.seed) < self.length:
+                return _NAN
+            self.average = sum(self.seed) / self.length
+            self.seed = None
+            return self.average
+        self.average = (1 - self.alpha) * self.average + self.alpha * value
+        return self.average
+
+class _Returns():
+    # 与 pct_change 相同, 第一根K线为 NaN
+    def __init__(self):
+        self.prev = None
+
+    def push(self, close):
+        prev, self.prev = self.prev, close
+        return _NAN if prev is None else close / prev - 1
+
+class _RollingMoments():
+    """
+    滑动窗口内有效值的数量, 和与平方和。
+    和以参考值为基准累加, 每 length 次更新以窗口均值为基准重新求和一次, 平均每次 O(1), 同时避免大数相减的误差。
+    include=False 的值占据窗口位置但不参与计算, NaN 单独计数
+    """
+    def __init__(self, length):
+        self.length = length
+        self.window = deque(maxlen=length)
+        self.missing = 0
+        self.count = 0
+        self.ref = 0.0
+        self.total = 0.0
+        self.squares = 0.0
+        self._pushes = 0
+
+    def push(self, value, include=True):
+        window = self.window
+        if len(window) == self.length:
+            self._move(window[0], -1)
+        item = value if include else None
+        window.append(item)
+        self._move(item, 1)
+        self._pushes += 1
+        if self._pushes >= self.length:
+            self._rebase()
+
+    def mean(self, strict=True):
+        """
+        strict 为 True 时与 rolling(length) 相同, 窗口未满或有 NaN 时为 NaN; 为 False 时与 rolling(length, min_periods=1) 相同, 忽略 NaN
+        """
+        if (strict and self._incomplete()) or self.count == 0:
+            return _NAN
+        return self.ref + self.total / self.count
+
+    def var(self, strict=True):
+        if (strict and self._incomplete()) or self.count < 2:
+            return _NAN
+        return max((self.squares - self.total * self.total / self.count) / (self.count - 1), 0.0)
+
+    def std(self, strict=True):
+        return math.sqrt(self.var(strict))
+
+    def _incomplete(self):
+        return self.missing > 0 or len(self.window) < self.length
+
+    def _move(self, item, sign):
+        if item is None:
+            return
+        if item != item:
+            self.missing += sign
+            return
+        delta = item - self.ref
+        self.count += sign
+        self.total += sign * delta
+        self.squares += sign * delta * delta
+
+    def _rebase(self):
+        values = [item for item in self.window if item is not None and item == item]
+        self.ref = sum(values) / len(values) if values else 0.0
+        self.count = len(values)
+        self.total = sum(value - self.ref for value in values)
+        self.squares = sum((value - self.ref) ** 2 for value in values)
+        self._pushes = 0
+
+class _RollingRegression():
+    """
+    滑动窗口内 y 对 x 的最小二乘回归, 与 kernels.rolling_ols 相同。
+    窗口内连续相同取值的长度单独记录, 用来判断 x 或 y 是否全部相同
+    """
+    def __init__(self, length):
+        self.length = length
+        self.window = deque(maxlen=length)
+        self.missing = 0
+        self.ref_x = self.ref_y = 0.0
+        self.sums = [0.0] * 5
+        self.x_run = self.y_run = 0
+        self._prev = None
+        self._pushes = 0
+
+    def push(self, x, y):
+        window = self.window
+        if len(window) == self.length:
+            self._move(window[0], -1)
+        window.append((x, y))
+        self._move((x, y), 1)
+        prev = self._prev
+        self.x_run = self.x_run + 1 if prev is not None and x == prev[0] else 1
+        self.y_run = self.y_run + 1 if prev is not None and y == prev[1] else 1
+        self._prev = (x, y)
+        self._pushes += 1
+        if self._pushes >= self.length:
+            self._rebase()
+
+        length = self.length
+        if len(window) < length or self.missing > 0 or self.x_run >= length:
+            return _NAN, _NAN
+        if self.y_run >= length:
+            return 0.0, _NAN
+        sx, sy, sxx, sxy, syy = self.sums
+        dxx = sxx - sx * sx / length
+        dxy = sxy - sx * sy / length
+        dyy = syy - sy * sy / length
+        beta = _divide(dxy, dxx)
+        r_squared = _divide(beta * dxy, dyy)
+        return beta, (1.0 if r_squared > 1 - 1e-12 else r_squared)
+
+    def _move(self, item, sign):
+        x, y = item
+        if x != x or y != y:
+            self.missing += sign
+            return
+        dx = x - self.ref_x
+        dy = y - self.ref_y
+        sums = self.sums
+        sums[0] += sign * dx
+        sums[1] += sign * dy
+        sums[2] += sign * dx * dx
+        sums[3] += sign * dx * dy
+        sums[4] += sign * dy * dy
+
+    def _rebase(self):
+        # 以窗口第一个值为基准重新求和
+        x, y = self.window[0]
+        if x == x:
+            self.ref_x = x
+        if y == y:
+            self.ref_y = y
+        self.sums = [0.0] * 5
+        self.missing = 0
+        for item in self.window:
+            self._move(item, 1)
+        self._pushes = 0
+
+class _RollingRank():
+    """
+    窗口最后一个值在窗口内的百分比排名(相同值取平均排名), 与 kernels.rolling_rank_last 相同。
+    窗口内的值保存在有序列表中, 每次更新用 bisect 删除移出的值并插入新值
+    """
+    def __init__(self, length):
+        self.length = length
+        self.window = deque(maxlen=length)
+        self.ordered = []
+        self.missing = 0
+
+    def push(self, value):
+        window = self.window
+        if len(window) == self.length:
+            old = window[0]
+            if old != old:
+                self.missing -= 1
+            else:
+                del self.ordered[bisect.bisect_left(self.ordered, old)]
+        window.append(value)
+        if value != value:
+            self.missing += 1
+            return _NAN
+
+        bisect.insort(self.ordered, value)
+        if len(window) < self.length or self.missing > 0:
+            return _NAN
+        less = bisect.bisect_left(self.ordered, value)
+        equal = bisect.bisect_right(self.ordered, value) - less
+        return (less + (equal + 1) / 2) / self.length
+
+def _divide(a, b):
+    # 与 pandas 的除法相同, 除以0时得到 inf 或 NaN, 不抛出异常
+    if b == 0:
+        if a == 0 or a != a:
+            return _NAN
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+def _power(base, exponent):
+    # 与 NumPy 的 ** 相同, 有 NaN 或底数为负时返回 NaN, 不抛出异常
+    if base != base or exponent != exponent or base < 0:
+        return _NAN if exponent != 0 else 1.0
+    return base ** exponent
@@ -0,0 +1,52 @@
+# 测试使用随机生成的1min K线, 不访问交易所或本地数据
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 仓库目录本身就是 Neilyst 包, 目录名不是 Neilyst 时(e.g 直接克隆后运行测试)按包的方式加载
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if importlib.util.find_spec('Neilyst') is None:
+    _spec = importlib.util.spec_from_file_location('Neilyst', os.path.join(_root, '__init__.py'), submodule_search_locations=[_root])
+    _module = importlib.util.module_from_spec(_spec)
+    sys.modules['Neilyst'] = _module
+    _spec.loader.exec_module(_module)
+
+def make_klines(n=20000, seed=0, start='2024-01-01', freq='1min'):
+    """
+    随机游走的 OHLCV K线, 时间为 UTC
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.0003, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.0005, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.0005, n)))
+    volume = rng.uniform(1, 10, n)
+    index = pd.date_range(start, periods=n, freq=freq, tz='UTC', name='date')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}, index=index)
+
+@pytest.fixture
+def klines():
+    return make_klines
+
+@pytest.fixture
+def fake_klines(monkeypatch):
+    """
+    把回测中的 get_klines 换成返回 frames 中的K线, 返回 frames, 测试中可以直接放入或替换
+    """
+    # Neilyst.backtest 是同名的函数, 模块从 sys.modules 中取
+    engine = importlib.import_module('Neilyst.backtest')
+    frames = {}
+
+    def get_klines(symbol, start, end, timeframe='1m', **kwargs):
+        if isinstance(symbol, list):
+            return {sym: get_klines(sym, start, end, timeframe) for sym in symbol}
+        if symbol not in frames:
+            frames[symbol] = make_klines(seed=sum(symbol.encode()))
+        return frames[symbol]
+
+    monkeypatch.setattr(engine, 'get_klines', get_klines)
+    return frames
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Neilyst import Signal, Strategy, backtest
+
+class _Idle(Strategy):
+    def run(self, date, row, pos, balance, symbol):
+        return None
+
+def test_no_trades_keeps_equity(fake_klines):
+    result = backtest('BTC/USDT', 0, 0, _Idle(1000, 0.0005, 0.0001), record_equity=True)
+    assert result is not None
+    assert len(result) == 0
+    assert len(result.equity) == len(fake_klines['BTC/USDT'])
+    assert (result.equity['equity'] == 1000).all()
+    # 净值曲线与账单一样调整时区
+    assert result.equity.index[0] == fake_klines['BTC/USDT'].index[0] + np.timedelta64(8, 'h')
+
+def test_no_trades_without_equity(fake_klines):
+    assert backtest('BTC/USDT', 0, 0, _Idle(1000, 0.0005, 0.0001)) is None
+
+class _RoundTrip(Strategy):
+    # 第10根K线开多1个, 第20根K线分两次平仓
+    def run(self, date, row, pos, balance, symbol):
+        self.bar = getattr(self, 'bar', -1) + 1
+        if self.bar == 10:
+            return Signal('long', row['close'], 1.0)
+        if self.bar == 20:
+            return Signal('close', row['close'], 0.4)
+        if self.bar == 21:
+            return Signal('close', row['close'], pos.amount)
+        return None
+
+def test_signal_close_records_closed_amount(fake_klines):
+    result = backtest('BTC/USDT', 0, 0, _RoundTrip(1000, 0.0005, 0.0001))
+    assert len(result) == 1
+    assert result[0]['exit_type'] == 'signal'
+    assert result[0]['amount'] == 0.6
+
+def _flat_klines(n=60, start='2024-01-01', bars=None):
+    """
+    价格恒为100的K线, bars 为 位置 -> (open, high, low, close) 的特殊K线
+    """
+    index = pd.date_range(start, periods=n, freq='1min', tz='UTC', name='date')
+    prices = np.full((n, 4), 100.0)
+    for i, bar in (bars or {}).items():
+        prices[i] = bar
+    frame = pd.DataFrame(prices, index=index, columns=['open', 'high', 'low', 'close'])
+    frame['volume'] = 1.0
+    return frame
+
+class _LimitBuyer(Strategy):
+    # 第10根K线挂一个99的限价买单
+    def __init__(self, *args, expire=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expire = expire
+
+    def run(self, date, row, pos, balance, symbol):
+        self.bar = getattr(self, 'bar', -1) + 1
+        if self.bar == 10:
+            return Signal('long', 99.0, 1.0, order_type='limit', expire=self.expire)
+        return None
+
+def test_limit_order_fills_at_open_on_gap(fake_klines):
+    # 第15根K线跳空低开到97, 以更优的开盘价成交
+    data = fake_klines['BTC/USDT'] = _flat_klines(bars={15: (97.0, 97.5, 96.5, 97.0)})
+    result = backtest('BTC/USDT', 0, 0, _LimitBuyer(1000, 0, 0))
+    assert len(result) == 1
+    assert result[0]['open_price'] == 97.0
+    assert result[0]['open_date'] == data.index[15] + np.timedelta64(8, 'h')
+
+def test_limit_order_fills_at_limit_inside_bar(fake_klines):
+    fake_klines['BTC/USDT'] = _flat_klines(bars={15: (100.0, 100.0, 98.0, 100.0)})
+    result = backtest('BTC/USDT', 0, 0, _LimitBuyer(1000, 0, 0))
+    assert result[0]['open_price'] == 99.0
+
+@pytest.mark.parametrize('expire, dip, filled', [
+    # 按K线数量: 第10根K线挂出, 在第11到15根K线有效
+    (5, 15, True),
+    (5, 16, False),
+    # 按时间: 到期时间为挂单时间+5分钟, 即第15根K线开盘时失效
+    ('5min', 14, True),
+    ('5min', 15, False),
+    (pd.Timedelta(minutes=5), 15, False),
+])
+def test_limit_order_expiry(fake_klines, expire, dip, filled):
+    fake_klines['BTC/USDT'] = _flat_klines(bars={dip: (100.0, 100.0, 98.0, 100.0)})
+    result = backtest('BTC/USDT', 0, 0, _LimitBuyer(1000, 0, 0, expire=expire))
+    if filled:
+        assert len(result) == 1
+    else:
+        assert result is None
+
+class _PortfolioBuyer(Strategy):
+    # 每个 symbol 有K线后的第一个时间点各开多1个, 记录每个时间点看到的共享余额
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.balances = []
+
+    def run_portfolio(self, date, bars, positions, current_balance):
+        self.balances.append(current_balance)
+        return {
+            symbol: Signal('long', bar['close'], 1.0)
+            for symbol, bar in bars.iterrows() if not np.isnan(bar['close']) and positions[symbol].amount == 0
+        } or None
+
+def test_portfolio_shares_balance_across_ragged_symbols(fake_klines):
+    # ETH 晚20分钟开始, 早10分钟结束; 结束时按各自最后一根K线平仓
+    fake_klines['BTC/USDT'] = _flat_klines(bars={59: (100.0, 110.0, 100.0, 110.0)})
+    eth = fake_klines['ETH/USDT'] = _flat_klines(n=30, start='2024-01-01 00:20', bars={29: (100.0, 105.0, 100.0, 105.0)})
+    strategy = _PortfolioBuyer(1000, 0.001, 0)
+    result = backtest(['BTC/USDT', 'ETH/USDT'], 0, 0, strategy, portfolio=True).to_frame()
+
+    # BTC 开仓后余额减少 100.1, ETH 在第20分钟开仓后再减少 100.1
+    assert strategy.balances[1] == pytest.approx(1000 - 100.1)
+    assert strategy.balances[21] == pytest.approx(1000 - 200.2)
+    assert list(result['symbol']) == ['ETH/USDT', 'BTC/USDT']
+    eth_trade, btc_trade = result.iloc[0], result.iloc[1]
+    assert eth_trade['open_date'] == eth.index[0] + pd.Timedelta(hours=8)
+    assert eth_trade['close_date'] == eth.index[-1] + pd.Timedelta(hours=8)
+    assert eth_trade['close_price'] == 105.0
+    assert btc_trade['close_price'] == 110.0
+    # 账单中的余额是组合账户的余额, 两笔交易都平仓后等于初始资金加上两笔交易的盈亏
+    final = 1000 + (105 - 100) + (110 - 100) - 2 * 0.1 - (105 + 110) * 0.001
+    assert result['pnl'].sum() == pytest.approx(final - 1000)
+    assert result['balance'].max() == pytest.approx(final)
@@ -0,0 +1,111 @@
+import os
+
+import pandas as pd
+import pytest
+
+from Neilyst import Ledger, ResultCache, Signal, Strategy, backtest
+
+START, END = '2024-01-01T00:00:00Z', '2024-01-15T00:00:00Z'
+
+class _Periodic(Strategy):
+    """
+    只在 symbols 中的 symbol 上每 500 根K线开仓或平仓一次, 其它 symbol 没有交易
+    """
+    def __init__(self, *args, symbols=('BTC/USDT',), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.symbols = list(symbols)
+        self.bars = {}
+
+    def run(self, date, row, pos, balance, symbol):
+        bars = self.bars[symbol] = self.bars.get(symbol, 0) + 1
+        if symbol not in self.symbols or bars % 500:
+            return None
+        if pos.amount == 0:
+            return Signal('long', row['close'], 1.0)
+        return Signal('close', row['close'], pos.amount)
+
+def _strategy(**kwargs):
+    return _Periodic(1000, 0.0005, 0.0001, **kwargs)
+
+def _entries(path):
+    return sorted(os.listdir(path)) if os.path.exists(path) else []
+
+def _assert_same(actual, expected):
+    pd.testing.assert_frame_equal(actual.to_frame(), expected.to_frame())
+
+def test_hit_and_miss_round_trip(fake_klines, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    first = backtest('BTC/USDT', START, END, _strategy(), cache=cache)
+    assert (cache.hits, cache.misses, cache.stores) == (0, 1, 1)
+    second = backtest('BTC/USDT', START, END, _strategy(), cache=cache)
+    assert (cache.hits, cache.misses, cache.stores) == (1, 1, 1)
+    assert len(first) > 0
+    _assert_same(second, first)
+
+    # 策略参数变化时是另一个键
+    backtest('BTC/USDT', START, END, _Periodic(2000, 0.0005, 0.0001), cache=cache)
+    assert (cache.hits, cache.misses, cache.stores) == (1, 2, 2)
+
+def test_multi_symbol_result_with_idle_symbol(fake_klines, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    symbols = ['BTC/USDT', 'ETH/USDT']
+    first = backtest(symbols, START, END, _strategy(), cache=cache)
+    assert first['ETH/USDT'] is None and len(first['BTC/USDT']) > 0
+    assert cache.stores == 1
+    # 没有留下临时目录
+    assert len(_entries(str(tmp_path))) == 1 and '.tmp' not in _entries(str(tmp_path))[0]
+
+    second = backtest(symbols, START, END, _strategy(), cache=cache)
+    assert cache.hits == 1
+    assert list(second) == symbols
+    assert second['ETH/USDT'] is None
+    _assert_same(second['BTC/USDT'], first['BTC/USDT'])
+
+def test_invalidate_by_symbol_and_key(fake_klines, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    backtest('BTC/USDT', START, END, _strategy(), cache=cache)
+    backtest(['BTC/USDT', 'ETH/USDT'], START, END, _strategy(), cache=cache)
+    backtest('ETH/USDT', START, END, _strategy(symbols=['ETH/USDT']), cache=cache)
+    assert cache.stats()['entries'] == 3
+
+    assert cache.invalidate(symbol='ETH/USDT') == 2
+    assert cache.stats()['entries'] == 1
+    backtest('BTC/USDT', START, END, _strategy(), cache=cache)
+    assert cache.hits == 1
+
+    key = _entries(str(tmp_path))[0]
+    assert cache.invalidate(key=key) == 1
+    assert cache.stats()['entries'] == 0
+
+def test_eviction_by_size_and_age(tmp_path):
+    ledger = Ledger()
+    opened = pd.Timestamp('2024-01-01', tz='UTC')
+    for k in range(2000):
+        ledger.append(opened, opened + pd.Timedelta(minutes=k), 'long', 100, 101, 1, 1.0, 0.1, 0.1, 1000 + k)
+
+    cache = ResultCache(str(tmp_path))
+    for key in ('a', 'b', 'c'):
+        cache.put(key, ledger)
+        # 按最近使用时间淘汰, 写入间隔拉开 meta.json 的修改时间
+        os.utime(os.path.join(str(tmp_path), key, 'meta.json'), (0, {'a': 1, 'b': 2, 'c': 3}[key]))
+    assert cache.get('a') is not None
+    size_mb = cache.stats()['size_mb']
+
+    # 'a' 刚被读取, 最久没有使用的 'b' 先被淘汰; meta.json 中的时间长度不同, 各结果的大小可能差几个字节
+    assert cache.evict(max_size_mb=size_mb * 2 / 3 + 1e-3) == 1
+    assert _entries(str(tmp_path)) == ['a', 'c']
+    assert cache.evictions == 1
+
+    assert cache.evict(max_age=-1) == 2
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+def test_failed_put_leaves_no_partial_entry(tmp_path, monkeypatch):
+    def broken_save(self, path):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(Ledger, 'save', broken_save)
+    cache = ResultCache(str(tmp_path))
+    with pytest.raises(OSError):
+        cache.put('key', Ledger())
+    assert _entries(str(tmp_path)) == []
@@ -0,0 +1,88 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Neilyst import Signal, Strategy, backtest
+from Neilyst.checkpoint import load_checkpoint
+
+class _Crash(Exception):
+    pass
+
+class _Trader(Strategy):
+    """
+    随机开平仓, 使用限价单, 止盈止损和移动止损, 断点需要恢复挂单, 托管的止盈止损和随机数状态
+    """
+    def __init__(self, *args, seed=5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rng = np.random.default_rng(seed)
+
+    def run(self, date, row, pos, balance, symbol):
+        u = self.rng.random()
+        close = row['close']
+        if pos.amount == 0 and u < 0.004:
+            return Signal('long', close * 0.999, 1.0, take_profit=close * 1.01, trailing_stop=0.004, order_type='limit', expire=30)
+        if pos.amount == 0 and u < 0.008:
+            return Signal('short', close, 1.0, stop_loss=close * 1.003, take_profit=close * 0.997)
+        if pos.amount > 0 and u > 0.997:
+            return Signal('close', close, pos.amount)
+        return None
+
+class _Jumper(_Trader):
+    # 持仓和挂单期间不调用 run, 引擎直接跳到止盈止损或挂单成交的K线
+    run_in_position = False
+    run_with_orders = False
+
+@pytest.fixture
+def crash_after_second_checkpoint(monkeypatch):
+    """
+    第2次保存断点后抛出异常, 模拟回测进程在断点之后中断
+    """
+    engine = importlib.import_module('Neilyst.backtest')
+    save = engine.save_checkpoint
+    saves = []
+
+    def save_then_crash(path, payload):
+        save(path, payload)
+        saves.append(path)
+        if len(saves) == 2:
+            raise _Crash()
+
+    monkeypatch.setattr(engine, 'save_checkpoint', save_then_crash)
+    return saves
+
+def _assert_same_result(actual, expected):
+    pd.testing.assert_frame_equal(actual.to_frame(), expected.to_frame(), check_exact=True)
+    pd.testing.assert_frame_equal(actual.equity, expected.equity, check_exact=True)
+
+@pytest.mark.parametrize('strategy', [_Trader, _Jumper])
+@pytest.mark.parametrize('interval', [1, 7])
+def test_resume_after_crash_is_identical(fake_klines, crash_after_second_checkpoint, tmp_path, strategy, interval):
+    options = dict(record_equity=True, equity_interval=interval)
+    expected = backtest('BTC/USDT', 0, 0, strategy(1000, 0.0005, 0.0001), **options)
+    assert len(expected) > 0
+
+    path = str(tmp_path / 'run' / 'btc.ckpt')
+    with pytest.raises(_Crash):
+        backtest('BTC/USDT', 0, 0, strategy(1000, 0.0005, 0.0001), checkpoint=path, checkpoint_every=1000, **options)
+    assert len(crash_after_second_checkpoint) == 2
+    assert load_checkpoint(path)['last_date'] < fake_klines['BTC/USDT'].index[-1]
+
+    # 恢复时策略的状态(包括随机数)来自断点, 与新建策略时的参数无关
+    resumed = backtest('BTC/USDT', 0, 0, strategy(1000, 0.0005, 0.0001, seed=999), checkpoint=path, resume=True, **options)
+    _assert_same_result(resumed, expected)
+
+@pytest.mark.parametrize('strategy', [_Trader, _Jumper])
+def test_resume_extends_with_more_data(fake_klines, klines, tmp_path, strategy):
+    full = fake_klines['BTC/USDT'] = klines(seed=7)
+    expected = backtest('BTC/USDT', 0, 0, strategy(1000, 0.0005, 0.0001), record_equity=True)
+
+    # 先回测前一段数据, 断点保存在末尾平仓之前, 补上后面的数据后从断点继续
+    path = str(tmp_path / 'btc.ckpt')
+    fake_klines['BTC/USDT'] = full.iloc[:11111]
+    backtest('BTC/USDT', 0, 0, strategy(1000, 0.0005, 0.0001), record_equity=True, checkpoint=path)
+    assert load_checkpoint(path)['last_date'] == full.index[11110]
+    fake_klines['BTC/USDT'] = full
+    extended = backtest('BTC/USDT', 0, 0, strategy(1000, 0.0005, 0.0001, seed=0), record_equity=True, checkpoint=path, resume=True)
+    _assert_same_result(extended, expected)
@@ -0,0 +1,32 @@
+import importlib
+import os
+import shutil
+
+indicators = importlib.import_module('Neilyst.indicators')
+
+def _relative(paths):
+    return {os.path.relpath(path, indicators.current_dir) for path in paths}
+
+def test_package_imports_follow_shared_modules():
+    rsrs = os.path.join(indicators.indicators_lib_path, 'rsrs.py')
+    assert _relative(indicators._package_imports([rsrs])) == {
+        os.path.join('indicators_lib', 'rsrs.py'), 'shared.py', 'kernels.py'
+    }
+    dmi = os.path.join(indicators.indicators_lib_path, 'dmi.py')
+    assert os.path.join('utils', 'pandas_ta.py') in _relative(indicators._package_imports([dmi]))
+
+def test_fingerprint_changes_with_imported_modules(tmp_path, monkeypatch):
+    package = tmp_path / 'Neilyst'
+    shutil.copytree(indicators.current_dir, package, ignore=shutil.ignore_patterns('__pycache__', 'tests', '.git'))
+    monkeypatch.setattr(indicators, 'current_dir', str(package))
+    monkeypatch.setattr(indicators, 'indicators_lib_path', str(package / 'indicators_lib'))
+
+    before = indicators._indicator_source('rsrs_18_600')
+    with open(package / 'shared.py', 'a') as f:
+        f.write('\n# changed\n')
+    assert indicators._indicator_source('rsrs_18_600') != before
+    # pandas_ta 的指标只取版本号
+    assert indicators._indicator_source('rsi_14').startswith('pandas_ta')
+
+def test_ranged_family_fingerprint_includes_indicators_module():
+    assert indicators._indicator_source('sma_10:30:10') != indicators._indicator_source('sma_10')
@@ -0,0 +1,103 @@
+# numba 和 NumPy 两个后端的结果比较, 没有安装 numba 时跳过
+import importlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+
+from Neilyst import kernels
+from Neilyst.models import Position
+
+_engine = importlib.import_module('Neilyst.backtest')
+
+def _random_inputs(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.0005, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.0005, n)))
+    # 混入缺失的K线和重复的价格, 检查 NaN 和相同值的处理
+    missing = rng.random(n) < 0.001
+    open_[missing] = high[missing] = low[missing] = close[missing] = np.nan
+    returns = np.r_[np.nan, np.round(np.diff(close) / close[:-1], 5)]
+    # 蒙特卡洛内核使用的交易盈亏和重抽样下标
+    pnl = rng.normal(0.5, 10, 1000)
+    indices = rng.integers(0, len(pnl), size=(max(n // len(pnl), 1), len(pnl)), dtype=np.int32)
+    return {'open': open_, 'high': high, 'low': low, 'close': close, 'returns': returns, 'pnl': pnl, 'indices': indices}
+
+def _scan_exit_cases(data, seed=0, cases=300):
+    rng = np.random.default_rng(seed)
+    n = len(data['close'])
+    results = []
+    for _ in range(cases):
+        start = int(rng.integers(0, n - 1))
+        price = data['close'][start - 1] if start > 0 and not np.isnan(data['close'][start - 1]) else 100.0
+        position = Position('check')
+        position.open(price, 1, 'long' if rng.random() < 0.5 else 'short', None)
+        sign = 1 if position.dir == 'long' else -1
+        stop_loss = price * (1 - sign * rng.uniform(0.001, 0.02)) if rng.random() < 0.7 else None
+        take_profit = price * (1 + sign * rng.uniform(0.001, 0.02)) if rng.random() < 0.7 else None
+        trailing_stop = rng.uniform(0.001, 0.01) if rng.random() < 0.5 else None
+        position.set_exit_orders(stop_loss, take_profit, trailing_stop)
+        if rng.random() < 0.5:
+            position.extreme_price = price * (1 + sign * rng.uniform(0, 0.005))
+        idx, fill, exit_type = _engine._scan_exit_orders(position, data['open'], data['high'], data['low'], start)
+        results.append((idx, fill if fill is not None else np.nan, ['stop_loss', 'take_profit', 'trailing_stop'].index(exit_type) if exit_type else -1))
+    return np.array(results, dtype=float).T
+
+def _scan_limit_cases(data, seed=0, cases=300):
+    rng = np.random.default_rng(seed + 1)
+    n = len(data['close'])
+    results = []
+    for _ in range(cases):
+        start = int(rng.integers(0, n - 1))
+        stop = int(rng.integers(start + 1, n + 1))
+        is_buy = rng.random() < 0.5
+        price = np.nanmean(data['close'][max(start - 10, 0):start + 1]) * (1 + (-1 if is_buy else 1) * rng.uniform(0, 0.01))
+        idx, fill = _engine._scan_limit_order(is_buy, price, data['open'], data['high'], data['low'], start, stop)
+        results.append((idx, fill if fill is not None else np.nan))
+    return np.array(results, dtype=float).T
+
+_CASES = {
+    'rolling_ols': lambda data: kernels.rolling_ols(data['low'], data['high'], 18),
+    'rolling_signed_var': lambda data: kernels.rolling_signed_var(data['returns'], 10),
+    'rolling_rank_last': lambda data: (kernels.rolling_rank_last(data['returns'], 300),),
+    'rolling_moments': lambda data: kernels.rolling_moments(data['close'], [2, 10, 20, 55, 300]),
+    'scan_exit': _scan_exit_cases,
+    'scan_limit': _scan_limit_cases,
+    'resample_metrics': lambda data: kernels.resample_metrics(data['pnl'], data['indices']),
+}
+
+@pytest.fixture(scope='module')
+def data():
+    return _random_inputs()
+
+@pytest.fixture
+def restore_backend():
+    previous = kernels.get_backend()
+    yield
+    kernels.set_backend(previous)
+
+@pytest.mark.parametrize('name', list(_CASES))
+def test_backends_agree(data, restore_backend, name):
+    # 两个后端的求和顺序不同, 浮点结果在 rtol/atol 范围内相等, NaN 的位置和K线位置必须完全相同
+    outputs = {}
+    for backend in ('numpy', 'numba'):
+        kernels.set_backend(backend)
+        outputs[backend] = _CASES[name](data)
+
+    for expected, actual in zip(outputs['numpy'], outputs['numba']):
+        expected = np.asarray(expected, dtype=float)
+        actual = np.asarray(actual, dtype=float)
+        np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+        np.testing.assert_allclose(actual, expected, rtol=1e-7, atol=1e-12, equal_nan=True)
+
+def test_rolling_moments_backends_bit_identical(data, restore_backend):
+    # 两个后端使用相同的分块和参考均值, 结果逐位相同
+    outputs = {}
+    for backend in ('numpy', 'numba'):
+        kernels.set_backend(backend)
+        outputs[backend] = kernels.rolling_moments(data['close'], [2, 10, 20, 55, 300])
+    for expected, actual in zip(outputs['numpy'], outputs['numba']):
+        np.testing.assert_array_equal(actual, expected)
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Neilyst import Ledger
+
+@pytest.fixture
+def ledger():
+    ledger = Ledger()
+    opened = pd.Timestamp('2024-01-01', tz='UTC')
+    for k in range(5):
+        ledger.append(opened + pd.Timedelta(hours=k), opened + pd.Timedelta(hours=k + 1), 'long', 100, 101, 1, float(k), 0.1, 0.1, 1000 + k)
+    return ledger
+
+def test_to_frame_edits_do_not_change_ledger(ledger):
+    df = ledger.to_frame()
+    df.loc[0, 'pnl'] = 999
+    df['pnl'] *= 2
+    df.iloc[1, 3] = -1
+    np.testing.assert_array_equal(ledger.column('pnl'), [0, 1, 2, 3, 4])
+    np.testing.assert_array_equal(ledger.column('open_price'), [100] * 5)
+
+def test_to_frame_view_is_read_only(ledger):
+    df = ledger.to_frame(copy=False)
+    with pytest.raises(ValueError):
+        df.loc[0, 'pnl'] = 999
+    with pytest.raises(ValueError):
+        df['pnl'] *= 2
+    np.testing.assert_array_equal(ledger.column('pnl'), [0, 1, 2, 3, 4])
+    pd.testing.assert_frame_equal(df, ledger.to_frame())
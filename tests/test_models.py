@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Neilyst import Strategy
+
+class _Idle(Strategy):
+    def run(self, date, row, pos, balance, symbol):
+        return None
+
+@pytest.fixture
+def strategy(klines):
+    data = klines(n=500)
+    indicators = pd.DataFrame({'close': data['close'], 'ma_5': data['close'].rolling(5).mean(), 'bar': np.arange(len(data))}, index=data.index)
+    return _Idle(1000, 0.0005, 0.0001, data, indicators)
+
+def test_recent_data_window_cannot_corrupt_later_lookups(strategy):
+    date = strategy.data.index[100]
+    window = strategy.get_recent_data(date, 5)
+    expected = window.copy()
+    with pytest.raises(ValueError):
+        window.iloc[-1, 0] = -1
+    with pytest.raises(ValueError):
+        window['bar'] += 1
+    pd.testing.assert_frame_equal(strategy.get_recent_data(date, 5), expected)
+
+    # 复制后可以修改
+    copied = window.copy()
+    copied.iloc[-1, 0] = -1
+    pd.testing.assert_frame_equal(strategy.get_recent_data(date, 5), expected)
+
+def test_recent_data_matches_filtering(strategy):
+    data, indicators = strategy.data, strategy.indicators
+    for i in (0, 3, 4, 250, 251, 100, 499):
+        date = data.index[i]
+        expected = pd.concat([data[data.index <= date].iloc[-20:], indicators.drop(columns=['close'])[indicators.index <= date].iloc[-20:]], axis=1)
+        pd.testing.assert_frame_equal(strategy.get_recent_data(date, 20), expected)
+
+def test_recent_data_window_rejects_inplace_fillna(klines):
+    # 所有列都是浮点数时缓存为一个二维数组, 同样是只读的
+    data = klines(n=100)
+    indicators = pd.DataFrame({'close': data['close'], 'ma_5': data['close'].rolling(5).mean()}, index=data.index)
+    strategy = _Idle(1000, 0.0005, 0.0001, data, indicators)
+    window = strategy.get_recent_data(data.index[10], 20)
+    with pytest.raises(ValueError):
+        window.fillna(0, inplace=True)
+    assert strategy.get_recent_data(data.index[10], 20)['ma_5'].isna().sum() == 4
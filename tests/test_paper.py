@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from Neilyst import Signal, Strategy, backtest, kernels
+from Neilyst.paper import PaperTrader, ReplayFeed
+
+PRICES = ['open_price', 'close_price', 'pnl', 'balance']
+
+class _Trader(Strategy):
+    """
+    随机开平仓: 做多用限价单(止盈和移动止损), 做空用市价单(止盈止损)或按时间过期的限价单(止损)
+    """
+    def __init__(self, *args, seed=11, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rng = np.random.default_rng(seed)
+
+    def run(self, date, row, pos, balance, symbol):
+        u = self.rng.random()
+        close = row['close']
+        if pos.amount == 0 and u < 0.004:
+            return Signal('long', close * 0.999, 1.0, take_profit=close * 1.01, trailing_stop=0.004, order_type='limit', expire=30)
+        if pos.amount == 0 and u < 0.008:
+            return Signal('short', close, 1.0, stop_loss=close * 1.003, take_profit=close * 0.997)
+        if pos.amount == 0 and u < 0.010:
+            return Signal('short', close * 1.001, 1.0, stop_loss=close * 1.004, order_type='limit', expire='1h')
+        if pos.amount > 0 and u > 0.997:
+            return Signal('close', close, pos.amount)
+        return None
+
+@pytest.fixture(params=kernels.available_backends())
+def backend(request):
+    previous = kernels.get_backend()
+    kernels.set_backend(request.param)
+    yield request.param
+    kernels.set_backend(previous)
+
+def test_replay_matches_backtest(fake_klines, klines, backend):
+    data = fake_klines['BTC/USDT'] = klines(n=30000, seed=3)
+    expected = backtest('BTC/USDT', 0, 0, _Trader(1000, 0.0005, 0.0001)).to_frame()
+    trader = PaperTrader(ReplayFeed('BTC/USDT', ticker_data=data, speed=None), _Trader(1000, 0.0005, 0.0001), lookback=None)
+    ledger = trader.run()['ledger'].to_frame()
+
+    # 回测结束时把未平仓的仓位按 'end' 平掉, 模拟盘不会
+    if expected['exit_type'].iloc[-1] == 'end':
+        expected = expected.iloc[:-1]
+    assert set(expected['exit_type']) >= {'signal', 'stop_loss', 'take_profit', 'trailing_stop'}
+    assert (expected['dir'] == 'short').any() and (expected['dir'] == 'long').any()
+    assert len(ledger) == len(expected)
+    for column in ['open_date', 'close_date', 'dir', 'exit_type']:
+        assert list(ledger[column]) == list(expected[column])
+    for column in PRICES:
+        np.testing.assert_allclose(ledger[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float), rtol=1e-12)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from Neilyst import Strategy, backtest
+from Neilyst.profiler import BacktestProfiler
+
+class _Allocating(Strategy):
+    def __init__(self, *args, size_mb=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.size_mb = size_mb
+
+    def run(self, date, row, pos, balance, symbol):
+        if self.size_mb:
+            # 只在第一根K线上分配并写满一块内存, 抬高进程的内存峰值
+            np.ones(self.size_mb * 131072).sum()
+            self.size_mb = 0
+        return None
+
+def test_peak_memory_growth_is_per_run(fake_klines):
+    # profile 传入 BacktestProfiler 时没有交易也能取到报告
+    profiler = BacktestProfiler()
+    backtest('BTC/USDT', 0, 0, _Allocating(1000, 0.0005, 0.0001, size_mb=200), profile=profiler)
+    first = profiler.report()
+    profiler = BacktestProfiler()
+    backtest('BTC/USDT', 0, 0, _Allocating(1000, 0.0005, 0.0001), profile=profiler)
+    second = profiler.report()
+
+    assert first['peak_memory_growth_mb'] > 150
+    # 第二次回测没有超过第一次留下的进程峰值, 不应该报告第一次的峰值
+    assert second['peak_memory_growth_mb'] < 50
+    assert second['process_peak_memory_mb'] >= first['process_peak_memory_mb']
@@ -0,0 +1,105 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Neilyst  # noqa: F401, 把 indicators_lib 加入导入路径
+from Neilyst import kernels
+
+rsrs = importlib.import_module('rsrs').rsrs
+
+@pytest.fixture(params=kernels.available_backends())
+def backend(request):
+    previous = kernels.get_backend()
+    kernels.set_backend(request.param)
+    yield request.param
+    kernels.set_backend(previous)
+
+def _reference_rsrs(high, low, close, length=18, std_length=300):
+    # 改为滑动求和之前的实现: 每个窗口两遍求均值和离差的最小二乘, 排名用 pandas 的 rank(pct=True)
+    x_all, y_all = low.to_numpy(), high.to_numpy()
+    beta = np.full(len(x_all), np.nan)
+    r_squared = np.full(len(x_all), np.nan)
+    for i in range(length - 1, len(x_all)):
+        x = x_all[i - length + 1:i + 1]
+        y = y_all[i - length + 1:i + 1]
+        x_mean, y_mean = x.mean(), y.mean()
+        denominator = ((x - x_mean) ** 2).sum()
+        if denominator == 0:
+            continue
+        beta[i] = ((x - x_mean) * (y - y_mean)).sum() / denominator
+        ss_res = ((y - (x * beta[i] + (y_mean - beta[i] * x_mean))) ** 2).sum()
+        ss_tot = ((y - y_mean) ** 2).sum()
+        r_squared[i] = 1 - ss_res / ss_tot if ss_tot != 0 else np.nan
+    beta = pd.Series(beta, index=high.index)
+    r_squared = pd.Series(r_squared, index=high.index)
+
+    score = (beta - beta.rolling(std_length, min_periods=1).mean()) / beta.rolling(std_length, min_periods=1).std()
+    ret_std = close.pct_change().rolling(length).std()
+    quantile = ret_std.rolling(std_length).apply(
+        lambda x: x.rank(pct=True).iloc[-1] if len(x.dropna()) == std_length else np.nan, raw=False)
+    passive = score * r_squared ** (2 * quantile)
+    return pd.concat([beta, score, passive], axis=1).set_axis(
+        [f'RSRS_Beta_{length}', f'RSRS_{length}_{std_length}', f'RSRS_Passive_{length}_{std_length}'], axis=1)
+
+def _series(n, seed, price, tick=None):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-01-01', periods=n, freq='1min')
+    close = pd.Series(price * np.exp(np.cumsum(rng.normal(0, 0.001, n))), index=index)
+    high = close * (1 + np.abs(rng.normal(0, 0.0005, n)))
+    low = close * (1 - np.abs(rng.normal(0, 0.0005, n)))
+    # 缺失的K线和按最小价位(价格的万分之一)取整的价格
+    for series in (high, low, close):
+        series.iloc[100:103] = np.nan
+    tick = price * 1e-4 if tick is None else tick
+    high.iloc[1000:1500] = (high.iloc[1000:1500] / tick).round() * tick
+    low.iloc[1000:1500] = (low.iloc[1000:1500] / tick).round() * tick
+    return high, low, close
+
+def _relative_error(actual, expected):
+    # 相对误差按 |值| + 1 计算
+    return ((actual - expected).abs() / (expected.abs() + 1)).max().max()
+
+@pytest.mark.parametrize('seed, price', [(3, 100), (4, 60000), (5, 0.01)])
+def test_rsrs_matches_reference(backend, seed, price):
+    high, low, close = _series(2000, seed, price)
+    expected = _reference_rsrs(high, low, close)
+    actual = rsrs(high, low, close)
+    pd.testing.assert_frame_equal(actual.isna(), expected.isna())
+    assert _relative_error(actual, expected) < 1e-8
+
+def test_rsrs_matches_reference_coarse_ticks(backend):
+    # 最小价位是价格的10倍, 取整后大部分窗口只有 0 和 0.1 两个值, 回归接近退化, NumPy 的分块前缀和误差放大到 1e-7 量级
+    high, low, close = _series(2000, 5, 0.01, tick=0.1)
+    expected = _reference_rsrs(high, low, close)
+    actual = rsrs(high, low, close)
+    pd.testing.assert_frame_equal(actual.isna(), expected.isna())
+    assert _relative_error(actual, expected) < (1e-8 if backend == 'numba' else 1e-6)
+
+def test_rolling_rank_last_matches_pandas(backend):
+    # 取整后有大量相同的值, 排名的并列处理要与 pandas 相同
+    values = np.round(np.random.default_rng(1).normal(0, 1, 5000), 2)
+    values[50:52] = np.nan
+    for length in (20, 300, 600):
+        expected = pd.Series(values).rolling(length).apply(lambda x: x.rank(pct=True).iloc[-1], raw=False).to_numpy()
+        np.testing.assert_allclose(kernels.rolling_rank_last(values, length), expected, rtol=0, atol=1e-15, equal_nan=True)
+
+def test_rolling_ols_flat_windows(backend):
+    # 与原实现有意不同的地方: x 全部相同时 β 和 R 方为 NaN, y 全部相同时 β 为 0, R 方为 NaN;
+    # 原实现在这些窗口上的结果取决于求均值的舍入误差(e.g 价格为 60000 时得到非零的 β)
+    x = np.r_[np.linspace(1, 2, 30), np.full(30, 5.0), np.linspace(1, 2, 30)] * 60000
+    y = np.r_[np.linspace(1, 3, 60), np.full(30, 7.0)] * 60000
+    beta, r_squared = kernels.rolling_ols(x, y, 18)
+    assert np.isnan(beta[47:60]).all() and np.isnan(r_squared[47:60]).all()
+    assert (beta[77:90] == 0).all() and np.isnan(r_squared[77:90]).all()
+    # 完全共线的窗口 R 方为 1
+    assert np.isfinite(beta[17:47]).all()
+    assert (np.abs(r_squared[17:30] - 1) < 1e-12).all()
+
+    # 其它窗口与原实现相同
+    reference = _reference_rsrs(pd.Series(y), pd.Series(x), pd.Series(y), length=18, std_length=20)
+    expected = reference['RSRS_Beta_18'].to_numpy()
+    finite = np.isfinite(expected)
+    finite[47:60] = finite[77:90] = False
+    np.testing.assert_allclose(beta[finite], expected[finite], rtol=1e-9)
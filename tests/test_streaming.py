@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Neilyst import StreamingIndicators, get_indicators, streaming_indicator
+
+SPECS = ['ema_10', 'ohlc_ema_8', 'bollinger_k_20', 'atr_14', 'normalized_stddev_14_20', 'rsj_10', 'rsrs_18_300']
+
+def _assert_matches(stream, batch):
+    assert list(stream.columns) == list(batch.columns)
+    for column in batch.columns:
+        expected, actual = batch[column].to_numpy(), stream[column].to_numpy()
+        np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected), err_msg=column)
+        np.testing.assert_allclose(actual, expected, rtol=1e-7, atol=1e-9, err_msg=column)
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_replay_matches_batch(klines, seed):
+    data = klines(n=3000, seed=seed)
+    _assert_matches(StreamingIndicators(*SPECS).replay(data), get_indicators(data, *SPECS))
+
+def test_replay_matches_batch_with_flat_prices(klines):
+    # 价格不变的一段K线: 滚动方差为0, rsrs 的回归退化
+    data = klines(n=3000, seed=2)
+    data.iloc[1000:1100, :4] = 100.0
+    data.iloc[2000:2030, 2] = 99.0
+    _assert_matches(StreamingIndicators(*SPECS).replay(data), get_indicators(data, *SPECS))
+
+@pytest.mark.parametrize('spec', SPECS)
+def test_update_after_history_matches_replay(klines, spec):
+    data = klines(n=1500, seed=3)
+    indicator = streaming_indicator(spec).from_history(data.iloc[:1000])
+    rows = [indicator.update(bar) for _, bar in data.iloc[1000:].iterrows()]
+    updated = pd.DataFrame(rows, index=data.index[1000:])
+    replayed = streaming_indicator(spec).replay(data).iloc[1000:]
+    pd.testing.assert_frame_equal(updated, replayed, check_exact=False, rtol=1e-12)
+    assert indicator.value == rows[-1]
+
+def test_indicators_update_matches_batch_last_row(klines):
+    data = klines(n=1200, seed=4)
+    indicators = StreamingIndicators(*SPECS).from_history(data.iloc[:-1])
+    row = indicators.update(data.iloc[-1])
+    expected = get_indicators(data, *SPECS).iloc[-1]
+    assert list(row) == list(expected.index)
+    np.testing.assert_allclose(list(row.values()), expected.to_numpy(), rtol=1e-7, atol=1e-9)
+
+def test_unsupported_spec():
+    with pytest.raises(KeyError):
+        streaming_indicator('rsi_14')
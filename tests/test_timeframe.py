@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Neilyst import MultiTimeframe
+
+_PERIODS = {'15m': '15min', '1h': '1h', '4h': '4h'}
+
+def _gappy_klines(klines):
+    # 1min K线随机缺失约10%, 另外整段缺失3小时, 粗周期K线只由存在的1min K线聚合
+    data = klines(n=3 * 24 * 60, seed=7)
+    rng = np.random.default_rng(7)
+    keep = rng.random(len(data)) > 0.1
+    keep[1000:1180] = False
+    return data[keep]
+
+def _resample(data, rule):
+    agg = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+    return data.resample(rule, label='left', closed='left').agg(agg).dropna()
+
+@pytest.fixture
+def mtf(klines):
+    data = _gappy_klines(klines)
+    mtf = MultiTimeframe(data.index)
+    for name, rule in _PERIODS.items():
+        mtf.register(name, _resample(data, rule))
+    return mtf
+
+def _brute_force_visible(frame, period, date):
+    # 逐根比较: 当前时刻为1min K线的收盘时间, 收盘时间不晚于当前时刻的K线可见
+    now = date + pd.Timedelta(minutes=1)
+    closes = frame.index + pd.Timedelta(period)
+    return np.flatnonzero(np.asarray(closes <= now))
+
+def test_position_and_recent_match_brute_force(mtf):
+    for name, rule in _PERIODS.items():
+        frame = mtf.frames[name]
+        for i, date in enumerate(mtf.index):
+            visible = _brute_force_visible(frame, rule, date)
+            expected = visible[-1] if len(visible) else -1
+            assert mtf.position(name, date) == expected
+            if i % 5:
+                continue
+
+            recent = mtf.recent(name, date, 3)
+            pd.testing.assert_frame_equal(recent, frame.iloc[visible[-3:]])
+            assert (recent.index + pd.Timedelta(rule) <= date + pd.Timedelta(minutes=1)).all()
+
+            latest = mtf.latest(name, date)
+            if expected < 0:
+                assert latest is None
+            else:
+                assert latest.name == frame.index[expected]
+
+def test_aligned_matches_position(mtf):
+    aligned = mtf.aligned('1h', ['close'])
+    frame = mtf.frames['1h']
+    for i in range(0, len(mtf.index), 97):
+        pos = mtf.position('1h', i)
+        if pos < 0:
+            assert np.isnan(aligned['close'].iloc[i])
+        else:
+            assert aligned['close'].iloc[i] == frame['close'].iloc[pos]
+
+def test_locate_out_of_order(mtf):
+    dates = mtf.index[[500, 10, 11, 3000, 2999]]
+    assert [mtf.locate(date) for date in dates] == [500, 10, 11, 3000, 2999]
+    with pytest.raises(KeyError):
+        mtf.locate(mtf.index[0] - pd.Timedelta(minutes=1))
+
+def test_check_accepts_alignment(mtf):
+    checked = mtf.check()
+    assert set(checked) == set(_PERIODS)
+    assert all(count > 0 for count in checked.values())
+
+@pytest.mark.parametrize('shift, message', [(1, 'visible before it closes'), (-1, 'closed bar is not visible')])
+def test_check_rejects_off_by_one(mtf, shift, message):
+    pos = mtf.positions['1h']
+    mtf.positions['1h'] = np.clip(pos + shift, -1, len(mtf.frames['1h']) - 1)
+    with pytest.raises(AssertionError, match=message):
+        mtf.check()
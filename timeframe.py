@@ -0,0 +1,130 @@
+# 本模块提供多周期对齐: 策略按1min K线运行时, 查询更粗周期(e.g 1h, 4h)的数据和指标
+# 对每根1min K线预先计算各周期中最后一根已经收盘的K线位置, 查询时不需要比较时间, 也不会看到未收盘的K线
+import numpy as np
+import pandas as pd
+
+from .data import _convert_to_minutes
+
+class MultiTimeframe():
+    """
+    多周期对齐索引。
+    K线的时间标签为开盘时间(与 get_klines 和 aggregate_custom_timeframe 相同), 周期为 P 的K线 T 在 T + P 时收盘。
+    策略在1min K线 t 上运行时已经看到了这根K线的收盘价, 即当前时刻为 t + base,
+    此时粗周期中可见的只有 T + P <= t + base 的K线。
+
+    用法:
+        mtf = MultiTimeframe(data.index)
+        mtf.register('1h', indicators_1h)
+        mtf.recent('1h', date, 20)  # 最近20根已收盘的1h K线
+
+    参数:
+    - index: 1min K线的时间索引, 即回测时传给策略的 date
+    - base: index 的K线周期
+    """
+    def __init__(self, index, base='1m'):
+        self.index = pd.DatetimeIndex(index)
+        self.base = pd.Timedelta(minutes=_convert_to_minutes(base))
+        self.frames = {}
+        self.periods = {}
+        self.positions = {}
+        self._keys = self.index.as_unit('ns').asi8
+        self._sorted = self.index.is_monotonic_increasing and self.index.is_unique
+        self._cursor = 0
+
+    def register(self, name, frame, timeframe=None):
+        """
+        注册一个粗周期的数据或指标, 用 searchsorted 一次算出每根1min K线对应的最后一根已收盘K线的位置。
+
+        参数:
+        - name: 查询时使用的名字
+        - frame: 以开盘时间为索引的 DataFrame, 索引需要递增
+        - timeframe: frame 的K线周期, e.g '1h', 为空时使用 name
+        """
+        period = pd.Timedelta(minutes=_convert_to_minutes(timeframe or name))
+        if not frame.index.is_monotonic_increasing:
+            raise ValueError(f'The index of timeframe {name} must be increasing.')
+
+        # 粗周期K线的收盘时间不晚于1min K线的收盘时间时可见, 没有可见K线时为 -1
+        closes = pd.DatetimeIndex(frame.index) + period
+        now = self.index + self.base
+        self.positions[name] = closes.searchsorted(now, side='right') - 1
+        self.frames[name] = frame
+        self.periods[name] = period
+        return self
+
+    def locate(self, date):
+        """
+        date 在1min索引中的位置, 可以直接传入位置(int)。
+        按顺序查询时 date 一般就是上一次位置或其下一根K线, 不是时再二分查找。
+        """
+        if isinstance(date, (int, np.integer)):
+            return int(date)
+        date = pd.Timestamp(date)
+        keys, i = self._keys, self._cursor
+        if self._sorted:
+            key = date.value
+            if i + 1 < len(keys) and keys[i + 1] == key:
+                self._cursor = i + 1
+                return i + 1
+            if i < len(keys) and keys[i] == key:
+                return i
+            i = int(self.index.searchsorted(date, side='left'))
+            if i < len(keys) and keys[i] == key:
+                self._cursor = i
+                return i
+        else:
+            i = self.index.get_indexer([date])[0]
+            if i >= 0:
+                return int(i)
+        raise KeyError(f'{date} is not in the 1m index.')
+
+    def position(self, name, date):
+        """
+        date 时最后一根已收盘的 name 周期K线的位置, 没有时为 -1
+        """
+        return int(self.positions[name][self.locate(date)])
+
+    def latest(self, name, date):
+        """
+        date 时最后一根已收盘的 name 周期K线, 没有时为 None
+        """
+        pos = self.position(name, date)
+        return self.frames[name].iloc[pos] if pos >= 0 else None
+
+    def recent(self, name, date, periods):
+        """
+        date 时最近 periods 根已收盘的 name 周期K线, 与 get_recent_data 一样返回切片, 不要直接修改
+        """
+        stop = self.position(name, date) + 1
+        return self.frames[name].iloc[max(stop - periods, 0):stop]
+
+    def aligned(self, name, columns=None):
+        """
+        把 name 周期的数据按可见性展开到1min索引上, 每一行是该分钟最后一根已收盘的K线, 之前没有K线的行为 NaN。
+        适合在 run_batch 或向量化计算中使用。
+        """
+        frame = self.frames[name] if columns is None else self.frames[name][columns]
+        pos = self.positions[name]
+        if len(frame) == 0:
+            return pd.DataFrame(np.nan, index=self.index, columns=frame.columns)
+        aligned = frame.iloc[np.maximum(pos, 0)].set_axis(self.index)
+        return aligned.where(pd.Series(pos >= 0, index=self.index), axis=0)
+
+    def check(self):
+        """
+        检查每个周期的对齐结果: 每根1min K线对应的粗周期K线都已经收盘, 且它的下一根K线还没有收盘。
+        有问题时抛出 AssertionError, 否则返回每个周期检查的K线数量。
+        """
+        now = (self.index + self.base).as_unit('ns').asi8
+        checked = {}
+        for name, pos in self.positions.items():
+            closes = (pd.DatetimeIndex(self.frames[name].index) + self.periods[name]).as_unit('ns').asi8
+            visible = pos >= 0
+            if np.any(closes[pos[visible]] > now[visible]):
+                raise AssertionError(f'{name}: a bar is visible before it closes.')
+            following = pos + 1
+            pending = following < len(closes)
+            if np.any(closes[following[pending]] <= now[pending]):
+                raise AssertionError(f'{name}: a closed bar is not visible.')
+            checked[name] = int(visible.sum())
+        return checked
@@ -1,4 +1,5 @@
 import re
+import itertools
 
 def split_letters_numbers(s):
     """
@@ -20,3 +21,29 @@ def split_letters_numbers(s):
     else:
         # 如果不匹配，返回原字符串作为名称，参数为空
         return s, []
+
+def expand_param_ranges(s):
+    """
+    展开指标名称中的参数范围, 范围写作 起点:终点(:步长), 包含终点, 步长默认为1, 多个参数都是范围时展开为所有组合。
+    例如：
+    - 'bollinger_k_10:30:10' => ['bollinger_k_10', 'bollinger_k_20', 'bollinger_k_30']
+    - 'normalized_stddev_10:20:10_14' => ['normalized_stddev_10_14', 'normalized_stddev_20_14']
+    - 'rsi_14' => ['rsi_14']
+    """
+    match = re.match(r'^([A-Za-z_]+?)_(\d+(?::\d+){0,2}(?:_\d+(?::\d+){0,2})*)$', s)
+    if ':' not in s or not match:
+        return [s]
+
+    name = match.group(1)
+    choices = []
+    for param in match.group(2).split('_'):
+        bounds = [int(p) for p in param.split(':')]
+        if len(bounds) == 1:
+            choices.append(bounds)
+        else:
+            start, stop = bounds[0], bounds[1]
+            step = bounds[2] if len(bounds) == 3 else 1
+            if step <= 0:
+                raise ValueError(f'Invalid parameter range in {s}: step must be positive.')
+            choices.append(list(range(start, stop + 1, step)))
+    return [f"{name}_{'_'.join(map(str, params))}" for params in itertools.product(*choices)]
@@ -2,10 +2,11 @@
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+from .ledger import Ledger, to_frame
 
 def show_pnl(data, result, init_balance, indicators=None):
     df = pd.DataFrame(data)
-    df_result = pd.DataFrame(result)
+    df_result = to_frame(result)
 
     if df_result.empty:
         return
@@ -99,7 +100,7 @@ def show_total_pnl(results, init_balance):
 
     # 遍历每个 symbol 的交易结果
     for symbol, trades in results.items():
-        df_trades = pd.DataFrame(trades)
+        df_trades = to_frame(trades)
 
         if df_trades.empty:
             print(f'No trading result for {symbol}')
@@ -170,7 +171,7 @@ def show_multi_symbol_pnl(results, init_balance):
     # 获取所有交易的最早日期
     initial_dates = []
     for history in results.values():
-        df = pd.DataFrame(history)
+        df = to_frame(history)
         if not df.empty:
             initial_dates.append(df['close_date'].min())
     if not initial_dates:
@@ -186,7 +187,7 @@ def show_multi_symbol_pnl(results, init_balance):
 
     # 遍历每个 symbol 的回测结果
     for symbol, history in results.items():
-        df = pd.DataFrame(history)
+        df = to_frame(history)
 
         if df.empty:
             print(f'No trading result for {symbol}')
@@ -261,9 +262,9 @@ def show_return_distribution(results, bins=50):
     - bins: 直方图的分箱数量，默认为50。
     """
     # 判断是单 symbol 还是多 symbol
-    if isinstance(results, list):
+    if isinstance(results, (list, Ledger)):
         # 单 symbol 情况
-        df = pd.DataFrame(results)
+        df = to_frame(results)
         if df.empty or 'pnl' not in df.columns or 'open_price' not in df.columns or 'amount' not in df.columns or 'dir' not in df.columns:
             print('交易数据缺少必要的字段。')
             return
@@ -275,7 +276,7 @@ def show_return_distribution(results, bins=50):
         # 多 symbol 情况
         return_list = []
         for _, trades in results.items():
-            df = pd.DataFrame(trades)
+            df = to_frame(trades)
             if not df.empty and all(col in df.columns for col in ['pnl', 'open_price', 'amount', 'dir']):
                 df['return'] = df.apply(_calculate_trade_return, axis=1)
                 return_list.extend(df['return'].tolist())